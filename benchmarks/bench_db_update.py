@@ -0,0 +1,83 @@
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import os
+import sys
+import shutil
+import tempfile
+import time
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'pymigrate'))
+
+import logger
+import migration
+import store
+import synthetic
+
+"""
+Benchmark for migration.db_update on synthetic migrations directories.
+Run as: python3 benchmarks/bench_db_update.py --sizes 10000 100000 --backend journal
+"""
+
+
+def timed(func, *args) -> float:
+    """
+    Call :param func: with :param args: and return wall time it took.
+    """
+    started = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - started
+
+
+def bench(count: int, readme_every: int, app_logger: logger.Logger) -> dict:
+    """
+    Time initial sync into empty database, no-op sync and sync after 1% of migrations were added and removed.
+
+    :return: dict with timings in seconds.
+    """
+    project_dir = tempfile.mkdtemp(prefix='pymigrate-bench-')
+    try:
+        migrations_directory_path = os.path.join(project_dir, 'migrations')
+        synthetic.generate_tree(migrations_directory_path, count, readme_every)
+        store.open_store(migrations_directory_path, app_logger)
+        config = {'PROJECT_DIR': project_dir, 'MIGRATIONS_DIR': 'migrations'}
+        res = {'initial': timed(migration.db_update, config, app_logger),
+               'noop': timed(migration.db_update, config, app_logger)}
+
+        changed = max(count // 100, 1)
+        for i in range(changed):
+            shutil.rmtree(os.path.join(migrations_directory_path, synthetic.migration_id(i)))
+        synthetic.generate_tree(migrations_directory_path, changed, start=count)
+        res['changed'] = timed(migration.db_update, config, app_logger)
+        return res
+    finally:
+        store.close_all()
+        shutil.rmtree(project_dir)
+
+
+def main() -> int:
+    parser = ArgumentParser(description='Benchmark migration.db_update on synthetic migrations directories.')
+    parser.add_argument('--sizes', dest='sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='Amounts of migration directories to generate.')
+    parser.add_argument('--readme-every', dest='readme_every', type=int, default=10,
+                        help='Put readme file into every N-th migration, 0 disables readme files.')
+    parser.add_argument('--backend', dest='backend', choices=store.BACKENDS, default=store.STATE_BACKEND,
+                        help='State backend to keep migrations state in.')
+    args = parser.parse_args()
+    store.use_backend(args.backend)
+    app_logger = logger.Logger(level=logger.Levels.ERROR)
+
+    line_template = '%-10s | %-10s | %-10s | %-10s | %-14s'
+    print(line_template % ('MIGRATIONS', 'INITIAL', 'NOOP', 'CHANGED', 'NOOP_US_PER_DIR'))
+    for count in args.sizes:
+        res = bench(count, args.readme_every, app_logger)
+        print(line_template % (count, '%.3fs' % res['initial'], '%.3fs' % res['noop'], '%.3fs' % res['changed'],
+                               '%.2f' % (res['noop'] * 1000000 / count)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,56 @@
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import os
+import sys
+import shutil
+import tempfile
+import time
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'pymigrate'))
+
+import logger
+
+"""
+Benchmark for logger.Logger: cost of filtered out messages and of messages written to log file.
+Run as: python3 benchmarks/bench_logger.py --count 100000
+"""
+
+
+def per_call_us(app_logger: logger.Logger, count: int) -> float:
+    """
+    Log :param count: DEBUG messages with two arguments and return average microseconds per call.
+    """
+    started = time.perf_counter()
+    for i in range(count):
+        app_logger.log_with_ts('Dispatching migration {0} from {1}', logger.Levels.DEBUG, i, 'migrations')
+    return (time.perf_counter() - started) * 1000000 / count
+
+
+def main() -> int:
+    parser = ArgumentParser(description='Benchmark logger.Logger.')
+    parser.add_argument('--count', dest='count', type=int, default=100000,
+                        help='Amount of messages to log.')
+    args = parser.parse_args()
+
+    log_dir = tempfile.mkdtemp(prefix='pymigrate-bench-')
+    try:
+        path_to_log = os.path.join(log_dir, 'pymigrate.log')
+        loggers = (('filtered', logger.Logger(level=logger.Levels.ERROR)),
+                   ('file_text', logger.Logger(path_to_log, level=logger.Levels.DEBUG)),
+                   ('file_json', logger.Logger(path_to_log, level=logger.Levels.DEBUG, fmt='json')))
+        line_template = '%-10s | %-10s'
+        print(line_template % ('LOGGER', 'US_PER_CALL'))
+        for name, app_logger in loggers:
+            print(line_template % (name, '%.3f' % per_call_us(app_logger, args.count)))
+            app_logger.close()
+    finally:
+        shutil.rmtree(log_dir)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import os
+import sys
+import shutil
+import subprocess
+import tempfile
+import time
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'pymigrate'))
+
+import synthetic
+
+"""
+Benchmark for pymigrate start up: wall time of quick actions run as separate processes, as deploy scripts do,
+and time spent importing modules before the action runs.
+Run as: python3 benchmarks/bench_startup.py --repeat 20
+"""
+
+RUNNER = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'pymigrate', 'runner.py')
+
+
+def median_wall_time(cmd: list, cwd: str, repeat: int) -> float:
+    """
+    Run :param cmd: :param repeat: times and return median wall time in seconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run(cmd, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        timings.append(time.perf_counter() - started)
+    return sorted(timings)[len(timings) // 2]
+
+
+def import_time(cmd: list, cwd: str) -> tuple:
+    """
+    Run :param cmd: with -X importtime.
+
+    :return: tuple of total import time in seconds and amount of imported modules.
+    """
+    child = subprocess.run([sys.executable, '-X', 'importtime'] + cmd, cwd=cwd,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=False)
+    total = 0
+    modules = 0
+    for line in child.stderr.decode().splitlines():
+        if line.startswith('import time:') and '|' in line and 'self [us]' not in line:
+            self_us = line[len('import time:'):].split('|')[0].strip()
+            total += int(self_us)
+            modules += 1
+    return total / 1000000, modules
+
+
+def main() -> int:
+    parser = ArgumentParser(description='Benchmark pymigrate start up time.')
+    parser.add_argument('--repeat', dest='repeat', type=int, default=20,
+                        help='Run every action this many times and take median.')
+    parser.add_argument('--size', dest='size', type=int, default=100,
+                        help='Amount of migrations in synthetic project.')
+    args = parser.parse_args()
+
+    project_dir = tempfile.mkdtemp(prefix='pymigrate-bench-')
+    try:
+        synthetic.generate_tree(os.path.join(project_dir, 'migrations'), args.size, readme_every=1)
+        runner = [os.path.abspath(RUNNER), '--log-level', 'ERROR']
+        actions = (('python', ['-c', 'pass']),
+                   ('status', runner + ['--do', 'status']),
+                   ('readme', runner + ['--do', 'readme', '-m', synthetic.migration_id(0)]),
+                   ('help', runner + ['--help']))
+        line_template = '%-8s | %-10s | %-10s | %-8s'
+        print(line_template % ('ACTION', 'WALL_MS', 'IMPORT_MS', 'MODULES'))
+        for name, cmd in actions:
+            wall = median_wall_time([sys.executable] + cmd, project_dir, args.repeat)
+            imports, modules = import_time(cmd, project_dir)
+            print(line_template % (name, '%.1f' % (wall * 1000), '%.1f' % (imports * 1000), modules))
+    finally:
+        shutil.rmtree(project_dir)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
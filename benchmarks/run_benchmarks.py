@@ -0,0 +1,196 @@
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import contextlib
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'pymigrate'))
+
+import logger
+import migration
+import cli_commands
+import store
+import synthetic
+
+"""
+Reproducible benchmarks of pymigrate itself on synthetic migrations directories.
+
+Run as:
+    python3 benchmarks/run_benchmarks.py --sizes 100 1000 10000 --output results.json
+and compare against previous results with:
+    python3 benchmarks/run_benchmarks.py --sizes 100 1000 10000 --baseline results.json
+"""
+
+BENCHMARKS = ('db_init', 'db_update', 'get_statuses', 'status', 'migrate')
+
+
+@contextlib.contextmanager
+def quiet():
+    """
+    Redirect stdout of benchmarked code to /dev/null.
+    """
+    with open(os.devnull, 'w') as devnull:
+        stdout = sys.stdout
+        sys.stdout = devnull
+        try:
+            yield
+        finally:
+            sys.stdout = stdout
+
+
+def best_of(repeat: int, func, setup=None) -> float:
+    """
+    Call :param func: :param repeat: times and return the best wall time. :param setup: is called before each
+    call and is not timed.
+    """
+    timings = []
+    for _ in range(max(repeat, 1)):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def bench_tree(count: int, readme_every: int, migrate_count: int, jobs: int, repeat: int,
+               app_logger: logger.Logger) -> dict:
+    """
+    Run all BENCHMARKS on a synthetic tree of :param count: migrations.
+
+    :return: dict where key is benchmark name and value is its best time in seconds.
+    """
+    project_dir = tempfile.mkdtemp(prefix='pymigrate-bench-')
+    migrations_directory_path = os.path.join(project_dir, 'migrations')
+    path_to_db = os.path.join(migrations_directory_path, store.DB_FILE)
+    config = os.environ.copy()
+    config.update({'PROJECT_DIR': project_dir,
+                   'MIGRATIONS_DIR': 'migrations',
+                   'MIGRATION_ID': 'None',
+                   'ENVIRONMENT': 'bench',
+                   'JOBS': str(jobs),
+                   'OUTPUT_FORMAT': 'text'})
+    try:
+        synthetic.generate_tree(migrations_directory_path, count, readme_every, scripts=True)
+        res = {}
+
+        def drop_db():
+            store.close_all()
+            if os.path.isfile(path_to_db):
+                os.remove(path_to_db)
+
+        res['db_init'] = best_of(repeat, lambda: migration.db_init(migrations_directory_path, app_logger), drop_db)
+        res['db_update'] = best_of(repeat, lambda: migration.db_update(config, app_logger))
+        res['get_statuses'] = best_of(repeat, lambda: migration.get_statuses(path_to_db, app_logger))
+        with quiet():
+            res['status'] = best_of(repeat, lambda: cli_commands.status(config, app_logger))
+
+        # only the last migrate_count migrations are pending, the rest is already DONE
+        migration_store = store.open_store(migrations_directory_path, app_logger)
+        to_run = [synthetic.migration_id(i) for i in range(max(count - migrate_count, 0), count)]
+        migration_store.set_statuses(set(synthetic.migration_id(i) for i in range(count)), store.Status.DONE)
+
+        def reset_pending():
+            migration_store.set_statuses(to_run, store.Status.PENDING)
+
+        with quiet():
+            res['migrate'] = best_of(repeat, lambda: cli_commands.migrate(config, app_logger), reset_pending)
+        return res
+    finally:
+        store.close_all()
+        shutil.rmtree(project_dir)
+
+
+def compare(results: list, baseline: list, threshold: float) -> list:
+    """
+    Compare results against baseline.
+
+    :param results: list of result dicts as produced by main.
+    :param baseline: list of result dicts loaded from baseline file.
+    :param threshold: ratio of current to baseline time considered a regression.
+
+    :return: list of (result, baseline seconds, ratio, regressed) tuples for results present in baseline.
+    """
+    def key(result):
+        return result['benchmark'], result['size'], result['readme_every']
+
+    baseline_by_key = {key(result): result['seconds'] for result in baseline}
+    res = []
+    for result in results:
+        if key(result) in baseline_by_key:
+            before = baseline_by_key[key(result)]
+            ratio = result['seconds'] / before if before > 0 else float('inf')
+            res.append((result, before, ratio, ratio > threshold))
+    return res
+
+
+def main() -> int:
+    parser = ArgumentParser(description='Benchmark pymigrate on synthetic migrations directories.')
+    parser.add_argument('--sizes', dest='sizes', type=int, nargs='+', default=[100, 1000, 10000],
+                        help='Amounts of migration directories to generate.')
+    parser.add_argument('--readme-every', dest='readme_every', type=int, nargs='+', default=[0, 10],
+                        help='Put readme file into every N-th migration, 0 disables readme files.')
+    parser.add_argument('--migrate-count', dest='migrate_count', type=int, default=50,
+                        help='Amount of pending no-op migrations run by migrate benchmark.')
+    parser.add_argument('--jobs', dest='jobs', type=int, default=1,
+                        help='Amount of concurrent migrations in migrate benchmark.')
+    parser.add_argument('--repeat', dest='repeat', type=int, default=3,
+                        help='Run every benchmark this many times and keep the best time.')
+    parser.add_argument('--output', dest='output', default=None,
+                        help='Write results as JSON to this file.')
+    parser.add_argument('--baseline', dest='baseline', default=None,
+                        help='Compare results against JSON file written by previous run.')
+    parser.add_argument('--threshold', dest='threshold', type=float, default=1.2,
+                        help='Ratio of current to baseline time considered a regression. Default: 1.2')
+    args = parser.parse_args()
+    app_logger = logger.Logger(level=logger.Levels.ERROR)
+
+    results = []
+    line_template = '%-12s | %-10s | %-12s | %-10s | %-10s'
+    print(line_template % ('BENCHMARK', 'SIZE', 'README_EVERY', 'SECONDS', 'US_PER_DIR'))
+    for count in args.sizes:
+        for readme_every in args.readme_every:
+            timings = bench_tree(count, readme_every, args.migrate_count, args.jobs, args.repeat, app_logger)
+            for benchmark in BENCHMARKS:
+                results.append({'benchmark': benchmark,
+                                'size': count,
+                                'readme_every': readme_every,
+                                'seconds': timings[benchmark]})
+                print(line_template % (benchmark, count, readme_every, '%.4f' % timings[benchmark],
+                                       '%.2f' % (timings[benchmark] * 1000000 / count)))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': platform.python_version(),
+                       'platform': platform.platform(),
+                       'timestamp': int(time.time()),
+                       'migrate_count': args.migrate_count,
+                       'jobs': args.jobs,
+                       'results': results}, f, indent=2)
+
+    res = 0
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)['results']
+        print('\nComparison against {0}:'.format(args.baseline))
+        line_template = '%-12s | %-10s | %-12s | %-10s | %-10s | %-6s'
+        print(line_template % ('BENCHMARK', 'SIZE', 'README_EVERY', 'BASELINE', 'CURRENT', 'RATIO'))
+        for result, before, ratio, regressed in compare(results, baseline, args.threshold):
+            print(line_template % (result['benchmark'], result['size'], result['readme_every'], '%.4f' % before,
+                                   '%.4f' % result['seconds'], '%.2f' % ratio) + (' REGRESSED' if regressed else ''))
+            if regressed:
+                res = 1
+    return res
+
+
+if __name__ == '__main__':
+    sys.exit(main())
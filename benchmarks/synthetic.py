@@ -0,0 +1,51 @@
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import os
+import sys
+
+"""
+Generator of synthetic migrations directories for benchmarks.
+"""
+
+FIRST_TIMESTAMP = 1500000000
+NOOP_MIGRATE_SH = '#!/bin/sh\nexit 0\n'
+
+
+def migration_id(i: int) -> str:
+    """
+    Return ID of i-th synthetic migration. IDs sort in the same order as their indexes.
+    """
+    return '{0:010d}-migration'.format(FIRST_TIMESTAMP + i)
+
+
+def generate_tree(migrations_directory_path: str, count: int, readme_every: int = 0, scripts: bool = False,
+                  start: int = 0):
+    """
+    Generate :param count: migration directories. Modification time of each directory is set to its migration
+    timestamp, as if it was created long ago.
+
+    :param migrations_directory_path: path to migrations directory, created if it does not exist.
+    :param count: amount of migrations to generate.
+    :param readme_every: put readme into every N-th migration, 0 means no readme files at all.
+    :param scripts: put no-op migrate.sh into every migration.
+    :param start: index of the first generated migration.
+    """
+    os.makedirs(migrations_directory_path, 0o775, exist_ok=True)
+    for i in range(start, start + count):
+        migration_dir = os.path.join(migrations_directory_path, migration_id(i))
+        os.mkdir(migration_dir)
+        if readme_every and i % readme_every == 0:
+            open(os.path.join(migration_dir, 'README.md'), 'w').close()
+        if scripts:
+            with open(os.path.join(migration_dir, 'migrate.sh'), 'w') as f:
+                f.write(NOOP_MIGRATE_SH)
+            os.chmod(os.path.join(migration_dir, 'migrate.sh'), 0o775)
+        os.utime(migration_dir, (FIRST_TIMESTAMP + i, FIRST_TIMESTAMP + i))
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
@@ -3,10 +3,29 @@ __copyright__ = 'Copyright (c)2017, Maxim Styushin'
 __license__ = 'MIT'
 __email__ = 'makcimkos@gmail.com'
 
-__all__ = ['cli_commands',
+__all__ = ['backends',
+           'baseline',
+           'checksum',
+           'cli_commands',
+           'commands',
+           'daemon',
+           'executor',
+           'fanout',
            'git',
+           'lease',
            'logger',
            'migration',
+           'output',
+           'planner',
+           'profiling',
+           'retry',
+           'rollback',
+           'runlog',
            'runner',
+           'scanner',
+           'scheduler',
+           'stats',
+           'store',
            'util',
-           'templates']
+           'templates',
+           'workers']
@@ -0,0 +1,468 @@
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import sys
+import os
+import json
+import fcntl
+import threading
+import logger
+import store
+from contextlib import contextmanager
+
+# journal is compacted once it holds this many entries more than a snapshot of current state would
+COMPACT_ENTRIES = 10000
+# processes sharing journal lock this file, journal itself is replaced on compaction
+LOCK_SUFFIX = '.lock'
+
+# kinds of state changes, every change is applied to state as a tuple of kind and its values
+MIGRATION = 'migration'
+DELETE = 'delete'
+LEASE = 'lease'
+UNLEASE = 'unlease'
+RUN = 'run'
+SCAN = 'scan'
+UNSCAN = 'unscan'
+FILE_HASH = 'file_hash'
+MIGRATION_FILES = 'migration_files'
+
+
+class MemoryStore:
+    """
+    MemoryStore keeps migrations state in memory of this process, so opening it and changing status cost nothing,
+    but the state is lost once the process exits. Meant for tests, benchmarks and daemon serving a throwaway
+    environment. Unlike sqlite, changes made in a transaction are not rolled back on exception.
+    """
+
+    def __init__(self, path_to_db: str, app_logger: logger.Logger):
+        self.path_to_db = path_to_db
+        self.app_logger = app_logger
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._reset()
+
+    def __repr__(self):
+        return '[ {0}: {1} ]'.format('path_to_db', self.path_to_db)
+
+    def _reset(self):
+        self._migrations = {}
+        self._leases = {}
+        self._runs = {}
+        self._last_run_id = 0
+        self._scans = {}
+        self._file_hashes = {}
+        self._migration_files = {}
+
+    def close(self):
+        pass
+
+    @contextmanager
+    def transaction(self):
+        """
+        Group changes into a single transaction. Transactions may be nested, nothing but the outermost one
+        takes effect. Reads are done in a transaction as well, see JournalStore.
+        """
+        with self._lock:
+            self._depth += 1
+            try:
+                if self._depth == 1:
+                    self._begin()
+                    try:
+                        yield
+                    finally:
+                        self._commit()
+                else:
+                    yield
+            finally:
+                self._depth -= 1
+
+    def _begin(self):
+        pass
+
+    def _commit(self):
+        pass
+
+    def _change(self, *entry):
+        """
+        Change state, every change goes through here.
+        """
+        self._apply(entry)
+
+    def _apply(self, entry: tuple):
+        """
+        Apply change :param entry: to state.
+
+        :raise ValueError: if kind of change is unknown.
+        """
+        kind = entry[0]
+        if kind == MIGRATION:
+            self._migrations[entry[1]] = store.MigrationRecord(*entry[1:])
+        elif kind == DELETE:
+            self._migrations.pop(entry[1], None)
+            self._leases.pop(entry[1], None)
+        elif kind == LEASE:
+            self._leases[entry[1]] = (entry[2], entry[3])
+        elif kind == UNLEASE:
+            self._leases.pop(entry[1], None)
+        elif kind == RUN:
+            self._runs[entry[1]] = store.RunRecord(*entry[1:])
+            self._last_run_id = max(self._last_run_id, entry[1])
+        elif kind == SCAN:
+            self._scans[entry[1]] = store.ScanRecord(*entry[1:])
+        elif kind == UNSCAN:
+            self._scans.pop(entry[1], None)
+        elif kind == FILE_HASH:
+            self._file_hashes[entry[1]] = store.FileHash(*entry[1:])
+        elif kind == MIGRATION_FILES:
+            if entry[2]:
+                self._migration_files[entry[1]] = dict(entry[2])
+            else:
+                self._migration_files.pop(entry[1], None)
+        else:
+            raise ValueError('Unknown kind of state change: {0}'.format(kind))
+
+    def get(self, migration_id: str) -> store.MigrationRecord:
+        with self.transaction():
+            return self._migrations.get(migration_id)
+
+    def set_status(self, migration_id: str, status: store.Status, branch: str = None,
+                   commit_sha: str = 'unknown') -> bool:
+        with self.transaction():
+            record = self._migrations.get(migration_id)
+            if record is None:
+                return False
+            if branch is None:
+                record = record._replace(status=status.name)
+            else:
+                record = record._replace(status=status.name, branch=branch, commit_sha=commit_sha)
+            self._change(MIGRATION, *record)
+        return True
+
+    def set_statuses(self, migration_ids, status: store.Status):
+        with self.transaction():
+            for migration_id in set(migration_ids):
+                if migration_id in self._migrations:
+                    self._change(MIGRATION, *self._migrations[migration_id]._replace(status=status.name))
+
+    def set_presence(self, migration_ids, presence: str):
+        with self.transaction():
+            for migration_id in set(migration_ids):
+                if migration_id in self._migrations:
+                    self._change(MIGRATION, *self._migrations[migration_id]._replace(presence=presence))
+
+    def add(self, records):
+        with self.transaction():
+            for record in records:
+                if record.migration_id not in self._migrations:
+                    self._change(MIGRATION, *record)
+
+    def upsert(self, records):
+        with self.transaction():
+            for record in records:
+                self._change(MIGRATION, *record)
+
+    def delete(self, migration_id: str) -> bool:
+        with self.transaction():
+            existed = migration_id in self._migrations
+            if existed or migration_id in self._leases:
+                self._change(DELETE, migration_id)
+        return existed
+
+    def iterate(self, statuses: tuple = None, since: str = None, limit: int = 0, offset: int = 0):
+        with self.transaction():
+            records = [self._migrations[migration_id] for migration_id in sorted(self._migrations)
+                       if (not since or migration_id >= since) and
+                       (not statuses or self._migrations[migration_id].status in statuses)]
+        offset = max(offset, 0)
+        return iter(records[offset:offset + limit] if limit > 0 else records[offset:])
+
+    def start_run(self, migration_id: str, started_at: float, environment: str, branch: str = 'unknown',
+                  commit_sha: str = 'unknown', pid: int = None, host: str = '', attempt: int = 1,
+                  action: str = store.RUN_MIGRATE) -> int:
+        with self.transaction():
+            run_id = self._last_run_id + 1
+            self._change(RUN, *store.RunRecord(run_id, migration_id, started_at, None, None, None, environment, branch,
+                                               commit_sha, None, started_at, pid, host, attempt, action))
+        return run_id
+
+    def heartbeat(self, run_id: int, at: float):
+        with self.transaction():
+            if run_id in self._runs:
+                self._change(RUN, *self._runs[run_id]._replace(heartbeat_at=at))
+
+    def claim(self, migration_id: str, expected: store.Status, owner: str, now: float, expires_at: float) -> bool:
+        with self.transaction():
+            record = self._migrations.get(migration_id)
+            if record is None:
+                return False
+            if record.status == store.Status.RUNNING.name:
+                lease = self._leases.get(migration_id)
+                if lease is not None and lease[1] >= now:
+                    return False
+            elif record.status != expected.name:
+                return False
+            self._change(MIGRATION, *record._replace(status=store.Status.RUNNING.name))
+            self._change(LEASE, migration_id, owner, expires_at)
+        return True
+
+    def renew_lease(self, migration_id: str, owner: str, expires_at: float) -> bool:
+        with self.transaction():
+            lease = self._leases.get(migration_id)
+            if lease is None or lease[0] != owner:
+                return False
+            self._change(LEASE, migration_id, owner, expires_at)
+        return True
+
+    def get_lease(self, migration_id: str) -> tuple:
+        with self.transaction():
+            return self._leases.get(migration_id)
+
+    def release(self, migration_id: str, owner: str, status: store.Status, branch: str = None,
+                commit_sha: str = None) -> bool:
+        with self.transaction():
+            lease = self._leases.get(migration_id)
+            if lease is not None and lease[0] == owner:
+                self._change(UNLEASE, migration_id)
+            record = self._migrations.get(migration_id)
+            if record is None or record.status != store.Status.RUNNING.name or migration_id in self._leases:
+                return False
+            record = record._replace(status=status.name)
+            if branch is not None:
+                record = record._replace(branch=branch)
+            if commit_sha is not None:
+                record = record._replace(commit_sha=commit_sha)
+            self._change(MIGRATION, *record)
+        return True
+
+    def iterate_unfinished_runs(self):
+        with self.transaction():
+            runs = [run for run_id, run in sorted(self._runs.items()) if run.finished_at is None]
+        return iter(runs)
+
+    def get_last_runs(self, status: store.Status) -> list:
+        with self.transaction():
+            last = {}
+            for run_id, run in sorted(self._runs.items()):
+                last[run.migration_id] = run
+            return sorted((run for migration_id, run in last.items()
+                           if migration_id in self._migrations and
+                           self._migrations[migration_id].status == status.name), key=lambda run: run.run_id)
+
+    def finish_run(self, run_id: int, finished_at: float, duration: float, exit_code: int, output_bytes: int):
+        with self.transaction():
+            if run_id in self._runs:
+                self._change(RUN, *self._runs[run_id]._replace(finished_at=finished_at, duration=duration,
+                                                               exit_code=exit_code, output_bytes=output_bytes))
+
+    def iterate_runs(self, migration_id: str = None, environment: str = None, action: str = None):
+        with self.transaction():
+            runs = [run for run in self._runs.values()
+                    if (not migration_id or run.migration_id == migration_id) and
+                    (not environment or run.environment == environment) and
+                    (not action or run.action == action)]
+        return iter(sorted(runs, key=lambda run: (run.migration_id, run.started_at, run.run_id)))
+
+    def get_scans(self) -> dict:
+        with self.transaction():
+            return dict(self._scans)
+
+    def save_scans(self, records, removed_ids=()):
+        with self.transaction():
+            for record in records:
+                self._change(SCAN, *record)
+            for migration_id in removed_ids:
+                if migration_id in self._scans:
+                    self._change(UNSCAN, migration_id)
+
+    def get_file_hashes(self, migration_id: str = None) -> dict:
+        with self.transaction():
+            if not migration_id:
+                return dict(self._file_hashes)
+            prefix = migration_id + '/'
+            return {path: record for path, record in self._file_hashes.items() if path.startswith(prefix)}
+
+    def save_file_hashes(self, records):
+        with self.transaction():
+            for record in records:
+                self._change(FILE_HASH, *record)
+
+    def set_migration_files(self, migration_id: str, hashes: dict):
+        with self.transaction():
+            self._change(MIGRATION_FILES, migration_id, dict(hashes))
+
+    def get_migration_files(self, migration_id: str = None) -> dict:
+        with self.transaction():
+            return {some_id: dict(hashes) for some_id, hashes in self._migration_files.items()
+                    if not migration_id or some_id == migration_id}
+
+    def snapshot(self):
+        """
+        Describe current state as changes which bring empty state to it.
+
+        :return: generator of changes.
+        """
+        with self.transaction():
+            for record in self._migrations.values():
+                yield (MIGRATION,) + tuple(record)
+            for migration_id, (owner, expires_at) in self._leases.items():
+                yield LEASE, migration_id, owner, expires_at
+            for run_id, run in sorted(self._runs.items()):
+                yield (RUN,) + tuple(run)
+            for record in self._scans.values():
+                yield (SCAN,) + tuple(record)
+            for record in self._file_hashes.values():
+                yield (FILE_HASH,) + tuple(record)
+            for migration_id, hashes in self._migration_files.items():
+                yield MIGRATION_FILES, migration_id, hashes
+
+    def size(self) -> int:
+        """
+        Return amount of changes in snapshot.
+        """
+        with self.transaction():
+            return (len(self._migrations) + len(self._leases) + len(self._runs) + len(self._scans) +
+                    len(self._file_hashes) + len(self._migration_files))
+
+
+def encode(entry: tuple) -> bytes:
+    """
+    Encode change :param entry: as a line of journal.
+    """
+    return json.dumps(entry, separators=(',', ':')).encode() + b'\n'
+
+
+class JournalStore(MemoryStore):
+    """
+    JournalStore keeps migrations state in memory and appends every change to journal file as a line of JSON.
+    Changes made in a transaction are written with a single buffered write once the outermost transaction ends and
+    are never synced to disk, so changing status costs an append instead of a database commit, at the price of
+    losing the latest changes if the host (not the process) crashes. Opening the store replays the journal, which is
+    compacted to a snapshot of current state once it grows COMPACT_ENTRIES entries longer than the snapshot.
+    Processes sharing the journal serialize transactions with a lock on a separate lock file and read changes
+    appended by others at the start of every transaction, so leases work across processes as with sqlite.
+    """
+
+    def __init__(self, path_to_db: str, app_logger: logger.Logger, compact_entries: int = COMPACT_ENTRIES):
+        self.compact_entries = compact_entries
+        self._file = None
+        self._inode = None
+        self._offset = 0
+        self._entries = 0
+        self._pending = []
+        super().__init__(path_to_db, app_logger)
+        self._lock_file = open(path_to_db + LOCK_SUFFIX, 'ab')
+        with self.transaction():
+            pass
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._lock_file.close()
+
+    def _begin(self):
+        fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            self._read()
+        except Exception:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+            raise
+
+    def _commit(self):
+        try:
+            if self._pending:
+                data = b''.join(self._pending)
+                self._file.write(data)
+                self._file.flush()
+                self._offset += len(data)
+                self._entries += len(self._pending)
+                self._pending.clear()
+                if self._entries - self.size() > self.compact_entries:
+                    self.compact()
+        finally:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _change(self, *entry):
+        self._apply(entry)
+        self._pending.append(encode(entry))
+
+    def _open(self):
+        if self._file is not None:
+            self._file.close()
+        # writes of append mode go to the end of file wherever it was read from
+        self._file = open(self.path_to_db, 'a+b')
+        self._inode = os.fstat(self._file.fileno()).st_ino
+        self._offset = 0
+        self._entries = 0
+
+    def _read(self):
+        """
+        Apply changes appended to the journal since it was read last time. Journal is read from the start if it was
+        replaced by compaction in another process.
+
+        :raise store.StateError: if journal is corrupted.
+        """
+        try:
+            inode = os.stat(self.path_to_db).st_ino
+        except FileNotFoundError:
+            inode = None
+        if self._file is None or inode != self._inode:
+            self._open()
+            self._reset()
+        self._file.seek(self._offset)
+        data = self._file.read()
+        end = data.rfind(b'\n') + 1
+        if end < len(data):
+            self.app_logger.log_with_ts('Dropping incomplete last line of journal {0}', logger.Levels.WARNING,
+                                        self.path_to_db)
+            self._file.truncate(self._offset + end)
+        lines = data[:end].splitlines()
+        for number, line in enumerate(lines, self._entries + 1):
+            try:
+                self._apply(tuple(json.loads(line.decode())))
+            except (ValueError, TypeError, IndexError) as e:
+                raise store.StateError('Journal {0} is corrupted at entry {1}: {2}'.format(self.path_to_db, number, e))
+        self._offset += end
+        self._entries += len(lines)
+
+    def compact(self):
+        """
+        Replace journal with a snapshot of current state.
+        """
+        with self.transaction():
+            entries = [encode(entry) for entry in self.snapshot()]
+            path_to_tmp = self.path_to_db + '.tmp'
+            with open(path_to_tmp, 'wb') as f:
+                f.write(b''.join(entries))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path_to_tmp, self.path_to_db)
+            self._open()
+            self._offset = os.fstat(self._file.fileno()).st_size
+            self._entries = len(entries)
+        self.app_logger.log_with_ts('Compacted journal {0} to {1} entries', logger.Levels.DEBUG, self.path_to_db,
+                                    len(entries))
+
+
+def open_backend(name: str, path_to_db: str, app_logger: logger.Logger):
+    """
+    Open state backend :param name: other than sqlite, see store.BACKENDS and store.open_store. Backends have the
+    same interface as store.MigrationStore.
+
+    :param name: journal or memory.
+    :param path_to_db: path to journal file, memory backend doesn't use it.
+    :param app_logger: instance of configured logger.
+
+    :return: JournalStore or MemoryStore.
+    """
+    if name == 'journal':
+        return JournalStore(path_to_db, app_logger)
+    return MemoryStore(path_to_db, app_logger)
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
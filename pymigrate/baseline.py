@@ -0,0 +1,256 @@
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import sys
+import os
+import io
+import json
+import time
+import shutil
+import tarfile
+import store
+import util
+import checksum
+import templates
+import workers
+from typing import NamedTuple
+
+# hidden directory within migrations directory keeping the baseline, also ID of baseline migration
+BASELINE_ID = '.baseline'
+# files of baseline directory: squashed migrations with their checksums, list of squashed migrations
+# and executable applying them
+BUNDLE_FILE = 'bundle.tar.gz'
+MANIFEST_FILE = 'manifest.json'
+MIGRATE_FILE = 'migrate.sh'
+# file within the bundle keeping sha256 of files of squashed migrations
+CHECKSUMS_FILE = 'checksums.json'
+COLUMNS = ('order', 'migration_id', 'status', 'migrate')
+
+# statuses of migrations which may be squashed
+SQUASHABLE = (store.Status.DONE.name, store.Status.SKIP.name)
+
+
+class Entry(NamedTuple):
+    migration_id: str
+    # status migration had when it was squashed, SKIP migrations are not applied by the baseline
+    status: str
+    # path of migrate executable relative to migration directory
+    migrate: str
+    # whether migrate executable is a python unit, see workers
+    unit: bool = False
+
+
+class Manifest(NamedTuple):
+    """
+    Migrations folded into the baseline in order they are applied in.
+    """
+    # ID of the latest squashed migration
+    to: str
+    migrations: list
+    created_at: float
+    branch: str
+    commit_sha: str
+
+    @property
+    def ids(self) -> set:
+        return set(entry.migration_id for entry in self.migrations)
+
+
+def baseline_dir(migrations_directory_path: str) -> str:
+    return os.path.join(migrations_directory_path, BASELINE_ID)
+
+
+def find_migrate(migration_dir: str) -> str:
+    """
+    Find migrate executable of migration located at :param migration_dir: the same way migration.run_migration does.
+
+    :return: path relative to :param migration_dir: or None if migration has no migrate executable.
+    """
+    if workers.find_unit(migration_dir) is not None:
+        return workers.UNIT_FILE
+    executables = util.find_files('migrate*', migration_dir, True)
+    return os.path.relpath(executables.pop(), migration_dir) if executables else None
+
+
+def load(migrations_directory_path: str) -> Manifest:
+    """
+    Read manifest of the baseline of :param migrations_directory_path:.
+
+    :raise ValueError: if manifest is corrupted.
+
+    :return: Manifest or None if there is no baseline.
+    """
+    try:
+        with open(os.path.join(baseline_dir(migrations_directory_path), MANIFEST_FILE)) as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    try:
+        return Manifest(data['to'], [Entry(*entry) for entry in data['migrations']], data['created_at'],
+                        data['branch'], data['commit_sha'])
+    except (KeyError, TypeError) as e:
+        raise ValueError('Baseline manifest is corrupted: {0}'.format(e))
+
+
+def select(migrations_dict: dict, migrations_directory_path: str, graph: dict, to: str,
+           manifest: Manifest = None) -> list:
+    """
+    Select migrations to squash into the baseline: :param to: and every PRESENT migration it depends on directly
+    or not in :param graph: which is not squashed yet, in order migrate runs them in. ABSENT migrations are left
+    as they are.
+
+    :param migrations_dict: migration statuses as returned by migration.get_statuses.
+    :param migrations_directory_path: path to migrations directory.
+    :param graph: dependency graph of migrations as returned by scheduler.build_graph.
+    :param to: ID of the latest migration to squash.
+    :param manifest: manifest of existing baseline or None.
+
+    :raise ValueError: if some of migrations can't be squashed: they are neither DONE nor SKIP, are MANUAL,
+    have no migrate executable or depend on migrations which are not squashed.
+
+    :return: list of migration IDs.
+    """
+    import scheduler
+    if to not in migrations_dict or to == BASELINE_ID:
+        raise ValueError('Migration not found: {0}'.format(to))
+    if BASELINE_ID in migrations_dict and migrations_dict[BASELINE_ID][0] != store.Status.DONE.name:
+        raise ValueError('Baseline is {0}, apply it first'.format(migrations_dict[BASELINE_ID][0]))
+    squashed = manifest.ids if manifest else set()
+    ancestors = set()
+    pending = [to]
+    while pending:
+        for dep in graph.get(pending.pop(), ()):
+            if dep not in ancestors:
+                ancestors.add(dep)
+                pending.append(dep)
+    selected = set(migration_id for migration_id in ancestors | {to}
+                   if migration_id in migrations_dict and migration_id != BASELINE_ID and
+                   migration_id not in squashed and migrations_dict[migration_id][1] != 'ABSENT')
+    not_done = sorted(migration_id for migration_id in selected if migrations_dict[migration_id][0] not in SQUASHABLE)
+    if not_done:
+        raise ValueError('Only DONE and SKIP migrations may be squashed: {0}'.format(', '.join(not_done)))
+    for migration_id in sorted(selected):
+        migration_dir = os.path.join(migrations_directory_path, migration_id)
+        if util.has_file('readme*', migration_dir, False):
+            raise ValueError('Migration {0} is MANUAL, it can\'t be applied by the baseline'.format(migration_id))
+        if migrations_dict[migration_id][0] == store.Status.DONE.name and find_migrate(migration_dir) is None:
+            raise ValueError('Migration {0} has no migrate executable'.format(migration_id))
+        outside = sorted(dep for dep in graph[migration_id] if dep not in selected and dep != BASELINE_ID)
+        if outside:
+            raise ValueError('Migration {0} depends on migrations which are not squashed: {1}'.format(
+                migration_id, ', '.join(outside)))
+    return scheduler.topological_order(scheduler.prune_graph(graph, selected))
+
+
+def squash(migrations_directory_path: str, selected: list, migrations_dict: dict, migration_store: store.MigrationStore,
+           branch: str, commit_sha: str) -> Manifest:
+    """
+    Fold migrations :param selected: into the baseline: their directories and sha256 of their files are added to
+    the bundle of existing baseline, migrate executable of the baseline is regenerated to apply all squashed
+    migrations in order, then directories of squashed migrations are removed. Migrations state is not changed,
+    see migration.sync_baseline.
+
+    :param migrations_directory_path: path to migrations directory.
+    :param selected: IDs of migrations to squash as returned by select.
+    :param migrations_dict: migration statuses as returned by migration.get_statuses.
+    :param migration_store: migrations store, file hashes are taken from its cache.
+    :param branch: git branch the baseline is created on.
+    :param commit_sha: git commit the baseline is created on.
+
+    :return: Manifest of the new baseline.
+    """
+    path = baseline_dir(migrations_directory_path)
+    os.makedirs(path, 0o775, exist_ok=True)
+    previous = load(migrations_directory_path)
+    entries = list(previous.migrations) if previous else []
+    checksums = {}
+    path_to_bundle = os.path.join(path, BUNDLE_FILE)
+    with tarfile.open(path_to_bundle + '.tmp', 'w:gz') as bundle:
+        if previous is not None:
+            with tarfile.open(path_to_bundle, 'r:gz') as previous_bundle:
+                for member in previous_bundle:
+                    if member.name == CHECKSUMS_FILE:
+                        checksums.update(json.load(previous_bundle.extractfile(member)))
+                    else:
+                        bundle.addfile(member, previous_bundle.extractfile(member) if member.isfile() else None)
+        for migration_id in selected:
+            migration_dir = os.path.join(migrations_directory_path, migration_id)
+            entries.append(Entry(migration_id, migrations_dict[migration_id][0], find_migrate(migration_dir) or '',
+                                 workers.find_unit(migration_dir) is not None))
+            checksums[migration_id], updated = checksum.hash_migration(
+                migrations_directory_path, migration_id, migration_store.get_file_hashes(migration_id))
+            migration_store.save_file_hashes(updated)
+            bundle.add(os.path.join(migrations_directory_path, migration_id), arcname=migration_id)
+        data = json.dumps(checksums, indent=1, sort_keys=True).encode()
+        info = tarfile.TarInfo(CHECKSUMS_FILE)
+        info.size = len(data)
+        info.mtime = time.time()
+        bundle.addfile(info, io.BytesIO(data))
+
+    # the rest of selected migrations precede the last one, see select
+    manifest = Manifest(selected[-1] if selected else previous.to, entries, time.time(), branch, commit_sha)
+    os.replace(path_to_bundle + '.tmp', path_to_bundle)
+    path_to_migrate = os.path.join(path, MIGRATE_FILE)
+    with open(path_to_migrate + '.tmp', 'w') as f:
+        f.write(templates.generate_baseline_migrate_sh(manifest.to, [(entry.migration_id, entry.migrate, entry.unit)
+                                                                     for entry in entries
+                                                                     if entry.status == store.Status.DONE.name]))
+    os.chmod(path_to_migrate + '.tmp', 0o775)
+    os.replace(path_to_migrate + '.tmp', path_to_migrate)
+    # manifest is written last, so baseline is not seen until it is complete
+    path_to_manifest = os.path.join(path, MANIFEST_FILE)
+    with open(path_to_manifest + '.tmp', 'w') as f:
+        json.dump({'to': manifest.to, 'migrations': [tuple(entry) for entry in entries],
+                   'created_at': manifest.created_at, 'branch': branch, 'commit_sha': commit_sha}, f, indent=1)
+    os.replace(path_to_manifest + '.tmp', path_to_manifest)
+    for migration_id in selected:
+        shutil.rmtree(os.path.join(migrations_directory_path, migration_id))
+    return manifest
+
+
+def reconcile(manifest: Manifest, from_db: dict) -> tuple:
+    """
+    Decide how migrations state of an environment catches up with the baseline. Environment which ran all squashed
+    migrations gets the baseline DONE and forgets squashed migrations, environment which ran none of them gets
+    the baseline PENDING, so migrate applies it. Environment which ran squashed migrations partially gets
+    the baseline MANUAL: the rest has to be applied by hand, then the baseline is set DONE.
+
+    :param manifest: manifest of the baseline.
+    :param from_db: dict of store.MigrationRecord of all migrations.
+
+    :return: tuple of status name the baseline should get (None to leave it as is) and set of IDs of squashed
+    migrations which should be removed from migrations state.
+    """
+    squashed = manifest.ids
+    seen = set(squashed.intersection(from_db))
+    statuses = set(from_db[migration_id].status for migration_id in seen)
+    record = from_db.get(BASELINE_ID)
+    if record is not None:
+        if record.status != store.Status.DONE.name or not seen:
+            return None, set()
+        if statuses.issubset(SQUASHABLE):
+            return None, seen
+        return store.Status.MANUAL.name, set()
+    if statuses.issubset({store.Status.PENDING.name}):
+        return store.Status.PENDING.name, seen
+    if seen == squashed and statuses.issubset(SQUASHABLE):
+        return store.Status.DONE.name, seen
+    return store.Status.MANUAL.name, set()
+
+
+def describe(selected: list, migrations_dict: dict, migrations_directory_path: str):
+    """
+    Describe what squash would do with :param selected: without changing anything.
+
+    :return: generator of tuples with values for COLUMNS.
+    """
+    for order, migration_id in enumerate(selected, 1):
+        yield (order, migration_id, migrations_dict[migration_id][0],
+               find_migrate(os.path.join(migrations_directory_path, migration_id)))
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
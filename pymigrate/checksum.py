@@ -0,0 +1,144 @@
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import sys
+import os
+import time
+import mmap
+import fnmatch
+import hashlib
+import store
+import scanner
+
+# files are read in chunks of this size, so hashing never loads a whole file in memory
+CHUNK_SIZE = 1048576
+# files of this size and bigger are hashed via mmap without copying them to userspace buffers
+MMAP_THRESHOLD = 16 * CHUNK_SIZE
+# files matching these patterns (case-insensitive) are documentation and may be edited freely
+IGNORED = ('readme*',)
+
+DRIFT_COLUMNS = ('migration_id', 'status', 'path', 'change')
+
+
+def hash_file(path: str) -> str:
+    """
+    Compute sha256 of file :param path: reading it in chunks or via mmap for big files.
+
+    :return: hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                digest.update(mapped)
+        else:
+            buf = bytearray(min(CHUNK_SIZE, max(size, 1)))
+            view = memoryview(buf)
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                digest.update(view[:n])
+    return digest.hexdigest()
+
+
+def list_files(migration_dir: str) -> list:
+    """
+    List files of migration located at :param migration_dir: which are covered by checksums.
+
+    :return: sorted list of paths relative to :param migration_dir:.
+    """
+    res = []
+    for root, dirs, files in os.walk(migration_dir):
+        for name in files:
+            if not any(fnmatch.fnmatchcase(name.lower(), pattern) for pattern in IGNORED):
+                res.append(os.path.relpath(os.path.join(root, name), migration_dir))
+    return sorted(res)
+
+
+def hash_migration(migrations_directory_path: str, migration_id: str, cached: dict) -> tuple:
+    """
+    Compute sha256 of every file of migration :param migration_id:. Files whose size and mtime match
+    the cache entry are not read at all.
+
+    :param migrations_directory_path: path to migrations directory.
+    :param migration_id: ID of migration.
+    :param cached: dict of FileHash as returned by MigrationStore.get_file_hashes.
+
+    :return: tuple of dict where key is file path relative to migration directory and value is sha256,
+    and list of FileHash which should be saved to cache.
+    """
+    migration_dir = os.path.join(migrations_directory_path, migration_id)
+    racy_after = int(time.time() * 1000000000) - scanner.RACY_WINDOW_NS
+    hashes = {}
+    updated = []
+    for path in list_files(migration_dir):
+        key = migration_id + '/' + path
+        st = os.stat(os.path.join(migration_dir, path))
+        record = cached.get(key)
+        if record is None or record.size != st.st_size or record.mtime_ns != st.st_mtime_ns:
+            # file modified within the same mtime tick would keep the hash, so don't trust recent mtimes
+            mtime_ns = st.st_mtime_ns if st.st_mtime_ns < racy_after else 0
+            record = store.FileHash(key, st.st_size, mtime_ns, hash_file(os.path.join(migration_dir, path)))
+            updated.append(record)
+        hashes[path] = record.sha256
+    return hashes, updated
+
+
+def record(migrations_directory_path: str, migration_id: str, migration_store: store.MigrationStore) -> dict:
+    """
+    Remember hashes of files of migration :param migration_id: as the ones it was run with.
+
+    :return: dict where key is file path relative to migration directory and value is sha256.
+    """
+    hashes, updated = hash_migration(migrations_directory_path, migration_id,
+                                     migration_store.get_file_hashes(migration_id))
+    with migration_store.transaction():
+        migration_store.save_file_hashes(updated)
+        migration_store.set_migration_files(migration_id, hashes)
+    return hashes
+
+
+def find_drift(migrations_directory_path: str, migration_store: store.MigrationStore, migration_id: str = None):
+    """
+    Compare files of migrations which were run against hashes recorded at their last run.
+    Migrations which are not on disk anymore are skipped.
+
+    :param migrations_directory_path: path to migrations directory.
+    :param migration_store: store of migrations database located in :param migrations_directory_path:.
+    :param migration_id: check this migration only, all migrations if None.
+
+    :return: generator of (migration ID, status, file path, change) tuples, where change is one of
+    modified, added or removed.
+    """
+    recorded = migration_store.get_migration_files(migration_id)
+    cached = migration_store.get_file_hashes(migration_id)
+    updated = []
+    try:
+        for checked_id in sorted(recorded):
+            if not os.path.isdir(os.path.join(migrations_directory_path, checked_id)):
+                continue
+            hashes, changed = hash_migration(migrations_directory_path, checked_id, cached)
+            updated.extend(changed)
+            before = recorded[checked_id]
+            if hashes == before:
+                continue
+            current = migration_store.get(checked_id)
+            status = current.status if current else store.Status.UNKNOWN.name
+            for path in sorted(set(hashes).union(before)):
+                if path not in before:
+                    yield checked_id, status, path, 'added'
+                elif path not in hashes:
+                    yield checked_id, status, path, 'removed'
+                elif hashes[path] != before[path]:
+                    yield checked_id, status, path, 'modified'
+    finally:
+        migration_store.save_file_hashes(updated)
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
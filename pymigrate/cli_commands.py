@@ -5,24 +5,25 @@ __email__ = 'makcimkos@gmail.com'
 
 import os
 import sys
-import migration
 import logger
 import util
 """
-Don't use imports like 'from modulename import something', since currently this module must contain
-action callables only.
+Actions available via --do, each of them is registered in commands.COMMANDS.
+Modules with heavy dependencies (sqlite3, subprocess etc.) are imported inside actions, so running a quick
+action like readme does not pay for importing everything the others need.
 """
 
 
 def init(config: dict, app_logger: logger.Logger) -> bool:
     """
-    Initialize sqlite3 database with migrations metadata.
+    Initialize migrations state.
 
     :param config: pymigrate configuration.
     :param app_logger: pymigrate configured logger.
 
     :return: True on success, False otherwise.
     """
+    import migration
     app_logger.log_with_ts('Running init action', logger.Levels.DEBUG)
     print("Initializing migrations database")
     migrations_directory_path = os.path.join(os.pardir, config['PROJECT_DIR'] + '/' + config['MIGRATIONS_DIR'])
@@ -32,31 +33,52 @@ def init(config: dict, app_logger: logger.Logger) -> bool:
     return res
 
 
-# TODO: implement pagination
 def status(config: dict, app_logger: logger.Logger) -> bool:
     """
-    Print to stdout formatted table with status for all migrations.
+    Print to stdout status of migrations. Rows are streamed from migrations database, filters and pagination
+    are controlled by config['STATUS_FILTER'], config['SINCE'], config['LIMIT'] and config['OFFSET'].
+    Output format is one of output.FORMATS and is set by config['OUTPUT_FORMAT'].
 
     :param config: pymigrate configuration.
     :param app_logger: pymigrate configured logger.
 
     :return: True on success, False otherwise.
     """
+    import store
+    import output
     app_logger.log_with_ts('Running status action', logger.Levels.DEBUG)
-    print('Migration summary on environment {0}:'.format(config['ENVIRONMENT']))
+    fmt = config.get('OUTPUT_FORMAT', 'text')
+    if fmt == 'text':
+        print('Migration summary on environment {0}:'.format(config['ENVIRONMENT']))
 
     migrations_directory_path = os.path.join(os.pardir, config['PROJECT_DIR'] + '/' + config['MIGRATIONS_DIR'])
-    if not os.path.isfile(migrations_directory_path + '/migrations.db'):
+    if not store.exists(migrations_directory_path):
+        import migration
         migration.db_init(migrations_directory_path, app_logger)
-    migration_statuses = migration.get_statuses(migrations_directory_path + '/migrations.db', app_logger)
 
-    # generate template with alignments for pretty-printing
-    spaces = max(len(x) for x in migration_statuses.keys()) if len(migration_statuses) != 0 else 4
-    line_template = '%-' + str(spaces) + 's | %-8s | %-8s | %-20s'
+    statuses = None
+    if config.get('STATUS_FILTER', 'None') != 'None':
+        statuses = tuple(name.strip().upper() for name in config['STATUS_FILTER'].split(','))
+        unknown = [name for name in statuses if name not in store.Status.__members__]
+        if unknown:
+            app_logger.log_with_ts('Unknown --status value: {0}, expected some of: {1}', logger.Levels.ERROR,
+                                   ', '.join(unknown), ', '.join(store.Status.__members__))
+            return False
+    since = None
+    if config.get('SINCE', 'None') != 'None':
+        try:
+            since = str(util.parse_timestamp(config['SINCE']))
+        except ValueError:
+            app_logger.log_with_ts('Unable to parse --since value: {0}', logger.Levels.ERROR, config['SINCE'])
+            return False
 
-    print(line_template % ('MIGRATION_ID', 'STATUS', 'PRESENCE', 'BRANCH'))
-    for migration_id, state in sorted(migration_statuses.items()):
-        print(line_template % (migration_id, state[0], state[1], state[2]))
+    records = store.open_store(migrations_directory_path, app_logger).iterate(statuses=statuses,
+                                                                              since=since,
+                                                                              limit=int(config.get('LIMIT', '0')),
+                                                                              offset=int(config.get('OFFSET', '0')))
+    rows = ((record.migration_id, record.status, record.presence, record.branch,
+             record.commit_sha[:7] if fmt == 'text' else record.commit_sha) for record in records)
+    output.write_rows(('migration_id', 'status', 'presence', 'branch', 'commit'), rows, fmt, widths=(4, 8, 8, 20, 7))
     return True
 
 
@@ -69,8 +91,9 @@ def done(config: dict, app_logger: logger.Logger) -> bool:
 
     :return: True on success, False otherwise.
     """
-    app_logger.log_with_ts('Running status_done action for migration {0}'.format(config['MIGRATION_ID']),
-                           logger.Levels.DEBUG)
+    import migration
+    app_logger.log_with_ts('Running status_done action for migration {0}', logger.Levels.DEBUG,
+                           config['MIGRATION_ID'])
     migrations_directory_path = os.path.join(os.pardir, config['PROJECT_DIR'] + '/' + config['MIGRATIONS_DIR'])
     return migration.set_status_done(config['MIGRATION_ID'], app_logger, migrations_directory_path)
 
@@ -84,8 +107,9 @@ def skip(config: dict, app_logger: logger.Logger) -> bool:
 
     :return: True on success, False otherwise.
     """
-    app_logger.log_with_ts('Running status_skip action for migration {0}'.format(config['MIGRATION_ID']),
-                           logger.Levels.DEBUG)
+    import migration
+    app_logger.log_with_ts('Running status_skip action for migration {0}', logger.Levels.DEBUG,
+                           config['MIGRATION_ID'])
     migrations_directory_path = os.path.join(os.pardir, config['PROJECT_DIR'] + '/' + config['MIGRATIONS_DIR'])
     return migration.set_status_skip(config['MIGRATION_ID'], app_logger, migrations_directory_path)
 
@@ -99,8 +123,9 @@ def failed(config: dict, app_logger: logger.Logger) -> bool:
 
     :return: True on success, False otherwise.
     """
-    app_logger.log_with_ts('Running status_failed action for migration {0}'.format(config['MIGRATION_ID']),
-                           logger.Levels.DEBUG)
+    import migration
+    app_logger.log_with_ts('Running status_failed action for migration {0}', logger.Levels.DEBUG,
+                           config['MIGRATION_ID'])
     migrations_directory_path = os.path.join(os.pardir, config['PROJECT_DIR'] + '/' + config['MIGRATIONS_DIR'])
     return migration.set_status_failed(config['MIGRATION_ID'], app_logger, migrations_directory_path)
 
@@ -114,8 +139,9 @@ def pending(config: dict, app_logger: logger.Logger) -> bool:
 
     :return: True on success, False otherwise.
     """
-    app_logger.log_with_ts('Running status_pending action for migration {0}'.format(config['MIGRATION_ID']),
-                           logger.Levels.DEBUG)
+    import migration
+    app_logger.log_with_ts('Running status_pending action for migration {0}', logger.Levels.DEBUG,
+                           config['MIGRATION_ID'])
     migrations_directory_path = os.path.join(os.pardir, config['PROJECT_DIR'] + '/' + config['MIGRATIONS_DIR'])
     return migration.set_status_pending(config['MIGRATION_ID'], app_logger, migrations_directory_path)
 
@@ -129,8 +155,9 @@ def manual(config: dict, app_logger: logger.Logger) -> bool:
 
     :return: True on success, False otherwise.
     """
-    app_logger.log_with_ts('Running status_manual action for migration {0}'.format(config['MIGRATION_ID']),
-                           logger.Levels.DEBUG)
+    import migration
+    app_logger.log_with_ts('Running status_manual action for migration {0}', logger.Levels.DEBUG,
+                           config['MIGRATION_ID'])
     migrations_directory_path = os.path.join(os.pardir, config['PROJECT_DIR'] + '/' + config['MIGRATIONS_DIR'])
     return migration.set_status_manual(config['MIGRATION_ID'], app_logger, migrations_directory_path)
 
@@ -165,36 +192,48 @@ def readme(config: dict, app_logger: logger.Logger) -> bool:
 def migrate(config: dict, app_logger: logger.Logger) -> bool:
     """
     Run migration. If :param config['MIGRATION_ID']: is not specified, then run all PENDING migrations starting from
-    older one. If one of migrations fails then stop execution and return False.
+    older one. Up to config['JOBS'] migrations with satisfied dependencies are run concurrently.
+    If one of migrations fails or is MANUAL then stop execution and return False. What is run is decided
+    by planner, the same way plan action shows it.
+    Runs abandoned by crashed or killed pymigrate processes are reclaimed first, see migration.reclaim_stale_runs.
 
     :param config: pymigrate configuration.
     :param app_logger: pymigrate configured logger.
 
     :return: True on success, False otherwise.
     """
+    import store
+    import migration
+    import planner
+    import scheduler
     app_logger.log_with_ts('Running migrate action', logger.Levels.DEBUG)
     migrations_directory_path = os.path.join(os.pardir, config['PROJECT_DIR'] + '/' + config['MIGRATIONS_DIR'])
 
+    if not store.exists(migrations_directory_path):
+        migration.db_init(migrations_directory_path, app_logger)
+    migration.sync_baseline(migrations_directory_path, app_logger)
+    migration.reclaim_stale_runs(migrations_directory_path, config, app_logger)
+
+    try:
+        migration_plan = planner.load(config, app_logger)
+    except planner.PlanError as e:
+        app_logger.log_with_ts(str(e), logger.Levels.ERROR)
+        return False
+
     if config['MIGRATION_ID'] == 'None':
-        migrations_dict = migration.get_statuses(migrations_directory_path + '/migrations.db', app_logger)
-        for migration_id, state in sorted(migrations_dict.items()):
-            if state[1] == 'ABSENT':
-                continue
-            elif state[0] == migration.Status.DONE.name:
-                continue
-            elif state[0] == migration.Status.SKIP.name:
-                continue
-
-            print('Starting migration {0}'.format(migration_id))
-            if migration.run_migration(migration_id, config, app_logger):
-                print('Migration {0}: {1}'.format(migration_id, migration.Status.DONE.name))
-            else:
-                print('Migration {0}: {1}'.format(migration_id, migration.Status.FAILED.name))
-                return False
+        return scheduler.run_plan(migration_plan, config, app_logger)
     else:
         # TODO: check for migration state as done above (i.e. was it already DONE or set to SKIP, is it ABSENT)
         migration_id = config['MIGRATION_ID']
-        if migration.run_migration(migration_id, config, app_logger):
+        if migration_plan.stop is not None:
+            print('Migration {0} is already {1}'.format(migration_id, migration.Status.RUNNING.name))
+            return False
+        res = migration.run_migration(migration_id, config, app_logger, migration.run_deadline(config),
+                                      migration_plan.steps[0].status)
+        if res is None:
+            print('Migration {0} is already {1}'.format(migration_id, migration.Status.RUNNING.name))
+            return False
+        if res:
             print('Migration {0}: {1}'.format(migration_id, migration.Status.DONE.name))
         else:
             print('Migration {0}: {1}'.format(migration_id, migration.Status.FAILED.name))
@@ -202,16 +241,252 @@ def migrate(config: dict, app_logger: logger.Logger) -> bool:
     return True
 
 
+def plan(config: dict, app_logger: logger.Logger) -> bool:
+    """
+    Print what migrate action would do without running anything: migrations in order they would be run,
+    where migrate would stop and why migrations are skipped, along with duration estimates based on past runs
+    in current environment. Estimated total takes config['JOBS'] into account.
+    If config['MIGRATION_ID'] is specified then plan for this migration only is printed.
+
+    :param config: pymigrate configuration.
+    :param app_logger: pymigrate configured logger.
+
+    :return: True if migrate would run all pending migrations, False otherwise.
+    """
+    import store
+    import output
+    import planner
+    import migration
+    app_logger.log_with_ts('Running plan action', logger.Levels.DEBUG)
+    fmt = config.get('OUTPUT_FORMAT', 'text')
+    migrations_directory_path = os.path.join(os.pardir, config['PROJECT_DIR'] + '/' + config['MIGRATIONS_DIR'])
+    if not store.exists(migrations_directory_path):
+        migration.db_init(migrations_directory_path, app_logger)
+    migration.sync_baseline(migrations_directory_path, app_logger)
+
+    try:
+        migration_plan = planner.load(config, app_logger)
+    except planner.PlanError as e:
+        app_logger.log_with_ts(str(e), logger.Levels.ERROR)
+        return False
+    if fmt == 'text':
+        print('Migration plan on environment {0} (seconds):'.format(config['ENVIRONMENT']))
+
+    def rows():
+        order = 0
+        for step in migration_plan.steps:
+            if step.action != planner.SKIP:
+                order += 1
+            estimate = None if step.estimate is None else round(step.estimate, 3)
+            if fmt == 'text':
+                yield (order if step.action != planner.SKIP else '-', step.migration_id, step.action,
+                       step.reason or '-', '-' if estimate is None else estimate)
+            else:
+                yield (order if step.action != planner.SKIP else None, step.migration_id, step.action,
+                       step.reason, estimate)
+
+    output.write_rows(planner.COLUMNS, rows(), fmt, widths=(5, 12, 7, 7, 8))
+    if fmt == 'text':
+        to_run = [step for step in migration_plan.steps if step.action == planner.RUN]
+        unknown = sum(1 for step in to_run if step.estimate is None)
+        jobs = int(config.get('JOBS', '1'))
+        total = planner.estimate_total(migration_plan, jobs)
+        print('Migrations to run: {0}, estimated duration: {1:.3f}s{2}{3}'.format(
+            len(to_run), total,
+            ' with {0} jobs'.format(jobs) if jobs > 1 else '',
+            ' ({0} without successful runs not counted)'.format(unknown) if unknown else ''))
+        run_timeout = float(config.get('RUN_TIMEOUT', '0'))
+        if 0 < run_timeout < total:
+            print('Estimated duration exceeds run timeout of {0:.0f}s'.format(run_timeout))
+        if migration_plan.stop is not None:
+            print('Migrate would stop before {0}: {1}'.format(migration_plan.stop.migration_id,
+                                                              migration_plan.stop.reason))
+    return migration_plan.stop is None
+
+
+def stats(config: dict, app_logger: logger.Logger) -> bool:
+    """
+    Print p50/p95/max duration of successful runs per migration and flag migrations whose last run regressed
+    against their own history. Only runs of migrate executables in current environment are taken into account.
+    If config['MIGRATION_ID'] is specified then statistics for this migration only is printed.
+
+    :param config: pymigrate configuration.
+    :param app_logger: pymigrate configured logger.
+
+    :return: True on success, False otherwise.
+    """
+    import store
+    import output
+    import stats as migration_stats
+    app_logger.log_with_ts('Running stats action', logger.Levels.DEBUG)
+    fmt = config.get('OUTPUT_FORMAT', 'text')
+    if fmt == 'text':
+        print('Migration run statistics on environment {0} (seconds):'.format(config['ENVIRONMENT']))
+
+    migrations_directory_path = os.path.join(os.pardir, config['PROJECT_DIR'] + '/' + config['MIGRATIONS_DIR'])
+    migration_id = config['MIGRATION_ID'] if config['MIGRATION_ID'] != 'None' else None
+    runs = store.open_store(migrations_directory_path, app_logger).iterate_runs(migration_id, config['ENVIRONMENT'],
+                                                                                store.RUN_MIGRATE)
+    rows = migration_stats.summarize(runs,
+                                     float(config.get('STATS_REGRESSION_FACTOR', migration_stats.REGRESSION_FACTOR)),
+                                     int(config.get('STATS_MIN_HISTORY', migration_stats.MIN_HISTORY)))
+    regressed = []
+
+    def track(rows_iter):
+        for row in rows_iter:
+            if row[-1] == 'yes':
+                regressed.append(row[0])
+            yield tuple('-' if value is None else value for value in row) if fmt == 'text' else row
+
+    output.write_rows(migration_stats.COLUMNS, track(rows), fmt, widths=(4, 4, 8, 8, 8, 8, 8, 9))
+    if fmt == 'text' and regressed:
+        print('Regressed migrations: {0}'.format(', '.join(regressed)))
+    return True
+
+
+def verify(config: dict, app_logger: logger.Logger) -> bool:
+    """
+    Print files of migrations which were modified, added or removed after the migration was run.
+    If config['MIGRATION_ID'] is specified then only this migration is checked.
+
+    :param config: pymigrate configuration.
+    :param app_logger: pymigrate configured logger.
+
+    :return: True if no changes were found, False otherwise.
+    """
+    import store
+    import output
+    import checksum
+    app_logger.log_with_ts('Running verify action', logger.Levels.DEBUG)
+    fmt = config.get('OUTPUT_FORMAT', 'text')
+    if fmt == 'text':
+        print('Migration files changed after run on environment {0}:'.format(config['ENVIRONMENT']))
+
+    migrations_directory_path = os.path.join(os.pardir, config['PROJECT_DIR'] + '/' + config['MIGRATIONS_DIR'])
+    migration_id = config['MIGRATION_ID'] if config['MIGRATION_ID'] != 'None' else None
+    drift = checksum.find_drift(migrations_directory_path, store.open_store(migrations_directory_path, app_logger),
+                                migration_id)
+    return output.write_rows(checksum.DRIFT_COLUMNS, drift, fmt, widths=(4, 8, 4, 8)) == 0
+
+
+def serve(config: dict, app_logger: logger.Logger) -> bool:
+    """
+    Run daemon answering status, migrate and status change requests of current environment over Unix socket
+    until terminated, see daemon.serve.
+
+    :param config: pymigrate configuration.
+    :param app_logger: pymigrate configured logger.
+
+    :return: True on success, False otherwise.
+    """
+    import store
+    import migration
+    import daemon
+    app_logger.log_with_ts('Running serve action', logger.Levels.DEBUG)
+    migrations_directory_path = os.path.join(os.pardir, config['PROJECT_DIR'] + '/' + config['MIGRATIONS_DIR'])
+    if not store.exists(migrations_directory_path):
+        migration.db_init(migrations_directory_path, app_logger)
+    # open store before the first request comes
+    store.open_store(migrations_directory_path, app_logger)
+    return daemon.serve(config, app_logger)
+
+
 def rollback(config: dict, app_logger: logger.Logger) -> bool:
     """
-    Rollback a migration.
+    Roll back migration :param config['MIGRATION_ID']:, config['ROLLBACK_LAST'] latest DONE migrations or
+    DONE migrations following config['ROLLBACK_TO'] in reversed order, see rollback.run.
+    With config['DRY_RUN'] only print what would be rolled back.
 
     :param config: pymigrate configuration.
     :param app_logger: pymigrate configured logger.
 
     :return: True on success, False otherwise.
     """
+    import store
+    import output
+    import migration
+    import rollback as rollback_engine
     app_logger.log_with_ts('Running rollback action', logger.Levels.DEBUG)
+    migrations_directory_path = os.path.join(os.pardir, config['PROJECT_DIR'] + '/' + config['MIGRATIONS_DIR'])
+    if not store.exists(migrations_directory_path):
+        migration.db_init(migrations_directory_path, app_logger)
+
+    migrations_dict = migration.get_statuses(migrations_directory_path + '/' + store.DB_FILE, app_logger)
+    to = config['ROLLBACK_TO'] if config.get('ROLLBACK_TO', 'None') != 'None' else None
+    migration_id = config['MIGRATION_ID'] if config['MIGRATION_ID'] != 'None' else None
+    try:
+        steps = rollback_engine.select(migrations_dict, migrations_directory_path,
+                                       int(config.get('ROLLBACK_LAST', '0')), to, migration_id)
+    except ValueError as e:
+        app_logger.log_with_ts(str(e), logger.Levels.ERROR)
+        return False
+    if not steps:
+        print('Nothing to roll back')
+        return True
+
+    if config.get('DRY_RUN', 'False') == 'True':
+        fmt = config.get('OUTPUT_FORMAT', 'text')
+        if fmt == 'text':
+            print('Rollback plan on environment {0}:'.format(config['ENVIRONMENT']))
+        rows = rollback_engine.describe(steps)
+        if fmt == 'text':
+            rows = (tuple('-' if value is None else value for value in row) for row in rows)
+        output.write_rows(rollback_engine.COLUMNS, rows, fmt, widths=(5, 12, 8, 8, 6))
+        return all(step.script is not None for step in steps)
+    return rollback_engine.run(steps, config, app_logger)
+
+
+def squash(config: dict, app_logger: logger.Logger) -> bool:
+    """
+    Fold DONE and SKIP migration :param config['MIGRATION_ID']: and migrations it depends on into the baseline,
+    see baseline.select and baseline.squash.
+    Fresh environments apply the baseline as a single migration, environments which already ran squashed migrations
+    get it DONE. With config['DRY_RUN'] only print what would be squashed.
+
+    :param config: pymigrate configuration.
+    :param app_logger: pymigrate configured logger.
+
+    :return: True on success, False otherwise.
+    """
+    import git
+    import store
+    import output
+    import baseline
+    import migration
+    import scheduler
+    app_logger.log_with_ts('Running squash action', logger.Levels.DEBUG)
+    migrations_directory_path = os.path.join(os.pardir, config['PROJECT_DIR'] + '/' + config['MIGRATIONS_DIR'])
+    if not store.exists(migrations_directory_path):
+        migration.db_init(migrations_directory_path, app_logger)
+    migration.sync_baseline(migrations_directory_path, app_logger)
+
+    migrations_dict = migration.get_statuses(migrations_directory_path + '/' + store.DB_FILE, app_logger)
+    try:
+        manifest = baseline.load(migrations_directory_path)
+        graph = scheduler.build_graph(list(migrations_dict.keys()), migrations_directory_path)
+        selected = baseline.select(migrations_dict, migrations_directory_path, graph, config['MIGRATION_ID'],
+                                   manifest)
+    except (ValueError, scheduler.CycleError) as e:
+        app_logger.log_with_ts(str(e), logger.Levels.ERROR)
+        return False
+    if not selected:
+        print('Nothing to squash')
+        return True
+
+    if config.get('DRY_RUN', 'False') == 'True':
+        fmt = config.get('OUTPUT_FORMAT', 'text')
+        if fmt == 'text':
+            print('Squash plan up to {0}:'.format(config['MIGRATION_ID']))
+        rows = baseline.describe(selected, migrations_dict, migrations_directory_path)
+        if fmt == 'text':
+            rows = (tuple('-' if value is None else value for value in row) for row in rows)
+        output.write_rows(baseline.COLUMNS, rows, fmt, widths=(5, 12, 6, 10))
+        return True
+    migration_store = store.open_store(migrations_directory_path, app_logger)
+    manifest = baseline.squash(migrations_directory_path, selected, migrations_dict, migration_store,
+                               git.get_branch(migrations_directory_path), git.get_commit(migrations_directory_path))
+    migration.sync_baseline(migrations_directory_path, app_logger)
+    print('Squashed {0} migrations up to {1} into {2}'.format(len(selected), manifest.to, baseline.BASELINE_ID))
     return True
 
 
@@ -229,6 +504,7 @@ def create(config: dict, app_logger: logger.Logger) -> bool:
 
     :return: True on success, False otherwise.
     """
+    import migration
     app_logger.log_with_ts('Running create action', logger.Levels.DEBUG)
     return migration.create_migration(config, app_logger)
 
@@ -242,6 +518,7 @@ def delete(config: dict, app_logger: logger.Logger) -> bool:
 
     :return: True on success, False otherwise.
     """
+    import migration
     app_logger.log_with_ts('Running delete action', logger.Levels.DEBUG)
     migration_id = config['MIGRATION_ID']
     if util.query_yes_no('Are you sure you want to delete {0} ?'.format(migration_id)):
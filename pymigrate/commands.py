@@ -0,0 +1,60 @@
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import sys
+import importlib
+from collections import namedtuple
+
+# Action available via --do. Module implementing the action is imported only when the action is run.
+# This module is imported on every start, so it avoids importing typing for NamedTuple.
+Command = namedtuple('Command', ('name', 'module', 'function', 'help'))
+
+COMMANDS = (
+    Command('create', 'cli_commands', 'create', 'generate new migration from template'),
+    Command('delete', 'cli_commands', 'delete', 'delete migration from disk and database'),
+    Command('done', 'cli_commands', 'done', 'set migration status to DONE'),
+    Command('failed', 'cli_commands', 'failed', 'set migration status to FAILED'),
+    Command('init', 'cli_commands', 'init', 'initialize migrations database'),
+    Command('manual', 'cli_commands', 'manual', 'set migration status to MANUAL'),
+    Command('migrate', 'cli_commands', 'migrate', 'run one or all pending migrations'),
+    Command('pending', 'cli_commands', 'pending', 'set migration status to PENDING'),
+    Command('plan', 'cli_commands', 'plan', 'show what migrate would run, in which order and how long it may take'),
+    Command('readme', 'cli_commands', 'readme', 'show readme of migration'),
+    Command('rollback', 'cli_commands', 'rollback', 'roll back migration or range of migrations'),
+    Command('serve', 'cli_commands', 'serve', 'answer status, migrate and status change requests over Unix socket'),
+    Command('skip', 'cli_commands', 'skip', 'set migration status to SKIP'),
+    Command('squash', 'cli_commands', 'squash', 'fold DONE migrations up to given ID into baseline'),
+    Command('stats', 'cli_commands', 'stats', 'show run duration statistics'),
+    Command('status', 'cli_commands', 'status', 'show migrations status'),
+    Command('verify', 'cli_commands', 'verify', 'show migrations whose files changed after they were run'),
+)
+
+_by_name = {command.name: command for command in COMMANDS}
+
+
+def names() -> tuple:
+    """
+    Return names of all registered actions.
+    """
+    return tuple(command.name for command in COMMANDS)
+
+
+def get(name: str):
+    """
+    Import module implementing action :param name: and return the action callable.
+
+    :param name: registered action name.
+
+    :return: callable accepting config dict and logger.Logger and returning bool.
+    """
+    if name not in _by_name:
+        raise KeyError("unknown action: '%s'" % name)
+    command = _by_name[name]
+    return getattr(importlib.import_module(command.module), command.function)
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
@@ -0,0 +1,279 @@
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import sys
+import os
+import threading
+import logger
+
+# actions served by daemon, the rest always run in-process
+ACTIONS = ('status', 'plan', 'migrate', 'done', 'failed', 'manual', 'pending', 'skip')
+# actions which change migrations state, they are served one at a time
+MUTATING_ACTIONS = ('migrate', 'done', 'failed', 'manual', 'pending', 'skip')
+# config keys which must match the ones of daemon, otherwise request is rejected, state file and backend are
+# resolved by the client before the request, see runner.run
+PINNED_KEYS = ('PROJECT_DIR', 'MIGRATIONS_DIR', 'ENVIRONMENT', 'STATE_BACKEND', 'STATE_DB_FILE')
+# Unix socket paths longer than this are not portable, such sockets are created in temp directory
+MAX_SOCKET_PATH = 100
+
+
+def socket_path(project_dir: str, environment: str) -> str:
+    """
+    Return path of socket of daemon serving :param environment: of project located at :param project_dir:.
+    """
+    path = os.path.join(os.path.abspath(project_dir), '.pymigrate.{0}.sock'.format(environment))
+    if len(path) > MAX_SOCKET_PATH:
+        import hashlib
+        import tempfile
+        path = os.path.join(tempfile.gettempdir(),
+                            'pymigrate-{0}.sock'.format(hashlib.sha1(path.encode()).hexdigest()[:16]))
+    return path
+
+
+def request(path: str, action: str, config: dict, stream=None, app_logger: logger.Logger = None):
+    """
+    Ask daemon listening on :param path: to run :param action: and copy its output to :param stream:.
+
+    :param path: daemon socket path.
+    :param action: one of ACTIONS.
+    :param config: pymigrate configuration, migrations are run with it as environment variables.
+    :param stream: TextIOWrapper object to write action output to, stdout by default.
+    :param app_logger: instance of configured logger.
+
+    :return: action result or None if daemon is not running.
+    """
+    if not os.path.exists(path):
+        return None
+    # client runs on every start of status and migrate, so don't pay for these imports when daemon is not running
+    import json
+    import socket
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    stream = stream or sys.stdout
+    with sock, sock.makefile('rwb') as f:
+        f.write(json.dumps({'action': action, 'config': config}).encode() + b'\n')
+        f.flush()
+        for line in f:
+            message = json.loads(line.decode())
+            if 'out' in message:
+                try:
+                    stream.write(message['out'])
+                    stream.flush()
+                except BrokenPipeError:
+                    # reader of our output went away (e.g. piped to head), daemon notices it on the next write
+                    return False
+            elif 'result' in message:
+                return message['result']
+            elif 'error' in message:
+                if app_logger:
+                    app_logger.log_with_ts('Daemon rejected request: {0}', logger.Levels.ERROR, message['error'])
+                return False
+    # daemon went away in the middle of request, don't run the action again in-process
+    if app_logger:
+        app_logger.log_with_ts('Daemon closed connection before sending result', logger.Levels.ERROR)
+    return False
+
+
+class ResponseWriter:
+    """
+    Text stream sending everything written to it to the client as {"out": ...} messages.
+    Binary output written to its buffer attribute (see executor.write_stdout) is decoded as UTF-8.
+    """
+
+    def __init__(self, wfile):
+        self._wfile = wfile
+        self._lock = threading.Lock()
+        self.buffer = _BinaryWriter(self)
+
+    def send(self, message: dict):
+        import json
+        with self._lock:
+            self._wfile.write(json.dumps(message).encode() + b'\n')
+            self._wfile.flush()
+
+    def write(self, s: str) -> int:
+        if s:
+            self.send({'out': s})
+        return len(s)
+
+    def flush(self):
+        pass
+
+
+class _BinaryWriter:
+    def __init__(self, writer: ResponseWriter):
+        self._writer = writer
+
+    def write(self, b: bytes) -> int:
+        self._writer.write(b.decode('utf-8', 'replace'))
+        return len(b)
+
+    def flush(self):
+        pass
+
+
+class StdoutRouter:
+    """
+    Replacement of sys.stdout sending output of each request to its client. Output of threads started by
+    a request (e.g. concurrent migrations) goes to the client of mutating request being served.
+    """
+
+    def __init__(self, default):
+        self.default = default
+        self.mutating = None
+        self._local = threading.local()
+
+    def bind(self, writer):
+        self._local.writer = writer
+
+    def _target(self):
+        return getattr(self._local, 'writer', None) or self.mutating or self.default
+
+    def write(self, s: str) -> int:
+        return self._target().write(s)
+
+    def flush(self):
+        self._target().flush()
+
+    @property
+    def buffer(self):
+        return self._target().buffer
+
+    def __getattr__(self, name):
+        return getattr(self.default, name)
+
+
+def serve(config: dict, app_logger: logger.Logger) -> bool:
+    """
+    Serve ACTIONS over Unix socket until terminated. Migrations store, scan cache and git metadata
+    stay in memory between requests, while everything else is taken from configuration sent with request.
+    Request is a single JSON line with action and configuration built by the client exactly as for running
+    the action in-process:
+        {"action": "status", "config": {"ENVIRONMENT": "dev", "OUTPUT_FORMAT": "json", "PATH": "...", ...}}
+    Response is a stream of JSON lines with action output followed by the result:
+        {"out": "Migration summary on environment dev:\\n"}
+        {"result": true}
+    or {"error": "..."} if request was rejected.
+
+    :param config: pymigrate configuration of the environment to serve.
+    :param app_logger: instance of configured logger.
+
+    :return: True when stopped by SIGINT or SIGTERM, False if daemon can't be started.
+    """
+    import json
+    import signal
+    import socketserver
+    import commands
+    path = socket_path(config['PROJECT_DIR'], config['ENVIRONMENT'])
+    if request_is_answered(path):
+        app_logger.log_with_ts('Daemon is already running at {0}', logger.Levels.ERROR, path)
+        return False
+    if os.path.exists(path):
+        os.remove(path)
+
+    router = StdoutRouter(sys.stdout)
+    mutating_lock = threading.Lock()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            writer = ResponseWriter(self.wfile)
+            line = self.rfile.readline()
+            if not line.strip():
+                # liveness probe, see request_is_answered
+                return
+            try:
+                message = json.loads(line.decode())
+                action = message['action']
+                if action not in ACTIONS:
+                    raise ValueError("action '%s' is not served by daemon" % action)
+                request_config = {str(key): str(value) for key, value in message['config'].items()}
+                for key in PINNED_KEYS:
+                    if request_config.get(key) != config[key]:
+                        raise ValueError('{0} {1} is not served by this daemon'.format(key, request_config.get(key)))
+            except (ValueError, KeyError, AttributeError) as e:
+                try:
+                    writer.send({'error': str(e)})
+                except OSError:
+                    pass
+                return
+            app_logger.log_with_ts('Serving {0} request', logger.Levels.DEBUG, action)
+            router.bind(writer)
+            try:
+                if action in MUTATING_ACTIONS:
+                    with mutating_lock:
+                        router.mutating = writer
+                        try:
+                            res = commands.get(action)(request_config, app_logger)
+                        finally:
+                            router.mutating = None
+                else:
+                    res = commands.get(action)(request_config, app_logger)
+                writer.send({'result': bool(res)})
+            except OSError as e:
+                # client went away, e.g. BrokenPipeError or ConnectionResetError, migration it ran is FAILED now
+                app_logger.log_with_ts('Client went away during {0} request: {1}', logger.Levels.WARNING, action, e)
+            except Exception as e:
+                # traceback is printed by socketserver, the client only gets the message
+                try:
+                    writer.send({'error': '{0} failed: {1}'.format(action, e)})
+                except OSError:
+                    pass
+                raise
+            finally:
+                router.bind(None)
+
+    def terminate(signum, frame):
+        raise KeyboardInterrupt
+
+    server = socketserver.ThreadingUnixStreamServer(path, Handler)
+    # let requests being served record results of their migrations on shutdown
+    server.daemon_threads = False
+    # signal handlers may be installed by main thread only
+    in_main_thread = threading.current_thread() is threading.main_thread()
+    if in_main_thread:
+        previous_handler = signal.signal(signal.SIGTERM, terminate)
+    sys.stdout = router
+    router.default.write('Serving environment {0} at {1}\n'.format(config['ENVIRONMENT'], path))
+    router.default.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        import executor
+        executor.cancel_all()
+        server.server_close()
+        sys.stdout = router.default
+        if in_main_thread:
+            signal.signal(signal.SIGTERM, previous_handler)
+        if os.path.exists(path):
+            os.remove(path)
+    return True
+
+
+def request_is_answered(path: str) -> bool:
+    """
+    Check whether somebody listens on socket :param path:.
+    """
+    if not os.path.exists(path):
+        return False
+    import socket
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
@@ -0,0 +1,286 @@
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import sys
+import os
+import time
+import signal
+import selectors
+import subprocess
+import threading
+
+# amount of bytes read from child pipe at once, also the longest line kept in memory
+CHUNK_SIZE = 65536
+# seconds between SIGTERM and SIGKILL sent to process group of cancelled command
+KILL_GRACE = 10.0
+# seconds between checks whether cancelled process group exited
+GROUP_POLL_INTERVAL = 0.05
+# exit codes reported for commands killed on timeout and on interruption of pymigrate, as coreutils timeout and
+# shells do
+TIMEOUT_EXIT_CODE = 124
+INTERRUPTED_EXIT_CODE = 130
+
+_output_lock = threading.Lock()
+# commands being run by run_streaming by pid, and exit codes to report for the cancelled ones
+_running = {}
+_cancelled = {}
+_running_lock = threading.Lock()
+# set once cancel_all was called, nothing new should be started after that
+_cancelling = threading.Event()
+
+
+def write_stdout(line: bytes):
+    """
+    Write a single line of child output to stdout. Lines are written atomically, so output of concurrently
+    running migrations is interleaved line by line.
+
+    :param line: bytes to write.
+    """
+    with _output_lock:
+        sys.stdout.buffer.write(line)
+        sys.stdout.buffer.flush()
+
+
+def prefixed(prefix: str, sink):
+    """
+    Wrap :param sink: so every line written to it gets :param prefix: prepended.
+
+    :param prefix: string to prepend.
+    :param sink: callable accepting line bytes.
+
+    :return: callable accepting line bytes.
+    """
+    tag = prefix.encode()
+
+    def write(line: bytes):
+        sink(tag + line)
+
+    return write
+
+
+def stream_lines(fd: int, sink, exited_fd: int = None) -> int:
+    """
+    Read everything from file descriptor :param fd: until EOF and pass it to :param sink: line by line.
+    At most CHUNK_SIZE bytes of an incomplete line are kept between reads, longer lines are passed in pieces.
+    Once :param exited_fd: becomes readable, whatever is readable from :param fd: already is read and reading
+    stops without waiting for EOF, so a background process inheriting the pipe does not hold the caller.
+
+    :param fd: readable file descriptor.
+    :param sink: callable accepting line bytes.
+    :param exited_fd: file descriptor which becomes readable once the writer is done.
+
+    :return: amount of bytes read.
+    """
+    total = 0
+    pending = b''
+    exited = False
+    with selectors.DefaultSelector() as selector:
+        selector.register(fd, selectors.EVENT_READ)
+        if exited_fd is not None:
+            selector.register(exited_fd, selectors.EVENT_READ)
+        while True:
+            ready = set(key.fd for key, _ in selector.select(0 if exited else None))
+            if exited_fd in ready:
+                exited = True
+                selector.unregister(exited_fd)
+            if fd not in ready:
+                if exited:
+                    break
+                continue
+            chunk = os.read(fd, CHUNK_SIZE)
+            if not chunk:
+                break
+            total += len(chunk)
+            lines = (pending + chunk).split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                sink(line + b'\n')
+            if len(pending) >= CHUNK_SIZE:
+                sink(pending)
+                pending = b''
+    if pending:
+        sink(pending + b'\n')
+    return total
+
+
+def _signal_group(child: subprocess.Popen, signum: int):
+    try:
+        os.killpg(child.pid, signum)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _group_exists(child: subprocess.Popen) -> bool:
+    # reap the command itself first, its zombie would keep the group alive
+    child.poll()
+    try:
+        os.killpg(child.pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def cancel(children: list, exit_code: int, grace: float = KILL_GRACE):
+    """
+    Send SIGTERM to process groups of :param children: started by run_streaming and SIGKILL to whatever is left
+    of them after :param grace: seconds. Whole groups are waited for, not just the commands, since the shell
+    running a command may exit on SIGTERM right away while the script it started still handles the signal.
+
+    :param children: subprocess.Popen objects, ones which already finished are ignored.
+    :param exit_code: exit code run_streaming reports for cancelled commands.
+    :param grace: seconds commands have to exit after SIGTERM.
+    """
+    with _running_lock:
+        children = [child for child in children if child.pid in _running and child.pid not in _cancelled]
+        for child in children:
+            _cancelled[child.pid] = exit_code
+    for child in children:
+        _signal_group(child, signal.SIGTERM)
+    deadline = time.monotonic() + grace
+    alive = [child for child in children if _group_exists(child)]
+    while alive and time.monotonic() < deadline:
+        time.sleep(GROUP_POLL_INTERVAL)
+        alive = [child for child in alive if _group_exists(child)]
+    for child in alive:
+        _signal_group(child, signal.SIGKILL)
+
+
+def cancel_all(grace: float = KILL_GRACE):
+    """
+    Cancel all commands being run by this process, e.g. when pymigrate itself is interrupted.
+    Commands run in their own sessions, so they don't get SIGINT from terminal along with pymigrate.
+    """
+    _cancelling.set()
+    with _running_lock:
+        children = list(_running.values())
+    cancel(children, INTERRUPTED_EXIT_CODE, grace)
+
+
+def wait_cancelled(timeout: float) -> bool:
+    """
+    Sleep for :param timeout: seconds unless cancel_all is called meanwhile.
+
+    :return: True if cancel_all was called, False otherwise.
+    """
+    return _cancelling.wait(timeout)
+
+
+def _watch(child: subprocess.Popen, finished: threading.Event, timeout: float, grace: float, heartbeat,
+           heartbeat_interval: float):
+    started = time.monotonic()
+    next_beat = started + heartbeat_interval if heartbeat else None
+    expires = started + timeout if timeout else None
+    while True:
+        wake = min(moment for moment in (next_beat, expires) if moment is not None)
+        if finished.wait(max(wake - time.monotonic(), 0)):
+            return
+        now = time.monotonic()
+        if next_beat is not None and now >= next_beat:
+            if heartbeat() is False:
+                cancel([child], INTERRUPTED_EXIT_CODE, grace)
+                return
+            next_beat = now + heartbeat_interval
+        if expires is not None and now >= expires:
+            cancel([child], TIMEOUT_EXIT_CODE, grace)
+            return
+
+
+def run_streaming(cmd: str, env: dict, sink=write_stdout, timeout: float = 0, grace: float = KILL_GRACE,
+                  heartbeat=None, heartbeat_interval: float = 5.0) -> tuple:
+    """
+    Run shell command :param cmd: and forward its combined stdout and stderr to :param sink: line by line
+    as soon as it's produced. Command is run in a new session, so the whole process group it starts can be
+    cancelled on timeout or interruption.
+
+    :param cmd: shell command to run.
+    :param env: environment for the command.
+    :param sink: callable accepting line bytes.
+    :param timeout: cancel command after this many seconds, 0 means no timeout.
+    :param grace: seconds cancelled command has to exit after SIGTERM before it gets SIGKILL.
+    :param heartbeat: callable without arguments called every :param heartbeat_interval: seconds while command runs,
+    command is cancelled if it returns False.
+    :param heartbeat_interval: seconds between heartbeat calls.
+
+    :return: tuple of command exit code and amount of output bytes. Exit code is TIMEOUT_EXIT_CODE or
+    INTERRUPTED_EXIT_CODE if command was cancelled or cancel_all was called before it was started.
+    """
+    if _cancelling.is_set():
+        return INTERRUPTED_EXIT_CODE, 0
+    child = subprocess.Popen(cmd,
+                             shell=True,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.STDOUT,
+                             env=env,
+                             start_new_session=True)
+    return supervise(child, child.stdout, child.wait, sink, timeout, grace, heartbeat, heartbeat_interval)
+
+
+def supervise(child: subprocess.Popen, output, wait, sink=write_stdout, timeout: float = 0, grace: float = KILL_GRACE,
+              heartbeat=None, heartbeat_interval: float = 5.0) -> tuple:
+    """
+    Forward everything :param child: writes to :param output: to :param sink: line by line and get exit code
+    of the work it does from :param wait:. Forwarding stops at EOF or, once :param wait: returns, as soon as
+    output already written is read. Process group of :param child: is cancelled on timeout, when heartbeat
+    returns False and by cancel_all, see run_streaming.
+
+    :param child: subprocess.Popen started in a new session.
+    :param output: readable binary file object, closed once EOF is reached.
+    :param wait: callable without arguments returning exit code, called in another thread.
+
+    :return: tuple of exit code and amount of output bytes, see run_streaming.
+    """
+    with _running_lock:
+        _running[child.pid] = child
+        # cancel_all could have been called while child was started
+        late = _cancelling.is_set()
+    if late:
+        cancel([child], INTERRUPTED_EXIT_CODE, grace)
+    finished = threading.Event()
+    watchdog = None
+    if timeout or heartbeat:
+        watchdog = threading.Thread(target=_watch, args=(child, finished, timeout, grace, heartbeat,
+                                                         heartbeat_interval), daemon=True)
+        watchdog.start()
+    # exit code or exception raised by wait
+    exit_codes = []
+    exited_r, exited_w = os.pipe()
+
+    def wait_exit():
+        try:
+            exit_codes.append(wait())
+        except BaseException as e:
+            exit_codes.append(e)
+        finally:
+            os.close(exited_w)
+
+    waiter = threading.Thread(target=wait_exit, daemon=True)
+    waiter.start()
+    try:
+        with output:
+            output_bytes = stream_lines(output.fileno(), sink, exited_r)
+        waiter.join()
+        exit_code = exit_codes[0]
+        if isinstance(exit_code, BaseException):
+            raise exit_code
+    except BaseException:
+        # e.g. KeyboardInterrupt in main thread, don't leave the command running
+        cancel([child], INTERRUPTED_EXIT_CODE, grace)
+        raise
+    finally:
+        os.close(exited_r)
+        finished.set()
+        if watchdog is not None:
+            watchdog.join()
+        with _running_lock:
+            del _running[child.pid]
+            cancelled = _cancelled.pop(child.pid, None)
+    return exit_code if cancelled is None else cancelled, output_bytes
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
@@ -0,0 +1,158 @@
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import sys
+import os
+import csv
+import json
+import time
+import shlex
+import tempfile
+import logger
+import executor
+import output
+from concurrent.futures import ThreadPoolExecutor
+
+# actions which may be run for several environments at once
+ACTIONS = ('migrate', 'plan', 'status')
+# actions whose output is a document in formats other than text, see output.FORMATS
+DOCUMENT_ACTIONS = ('plan', 'status')
+RESULT_COLUMNS = ('environment', 'result', 'exit_code', 'seconds', 'output_bytes')
+
+RUNNER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'runner.py')
+
+
+def run_environment(environment: str, argv: list, env: dict, sink, fmt: str = 'text') -> tuple:
+    """
+    Run pymigrate with command line :param argv: for single :param environment: in a separate process
+    with its own state database.
+
+    :param environment: environment name.
+    :param argv: command line arguments of current invocation.
+    :param env: environment variables of child process.
+    :param sink: callable accepting output line bytes, every line is prefixed with environment name.
+    :param fmt: output format of the action, with formats other than text output of the child is a document
+    which is parsed instead of being passed to :param sink:, while its stderr is passed to stderr.
+
+    :return: tuple of environment name, exit code, wall time, amount of output bytes and columns and rows of
+    the document (None for text).
+    """
+    # the last occurrence of an option wins, so appended ones override what was given on command line
+    cmd = ' '.join(shlex.quote(arg) for arg in [sys.executable, RUNNER] + argv +
+                   ['--environment', environment, '--state-per-environment'])
+    prefix = '[{0}] '.format(environment)
+    started = time.monotonic()
+    if fmt == 'text':
+        exit_code, output_bytes = executor.run_streaming(cmd, env, executor.prefixed(prefix, sink))
+        return environment, exit_code, time.monotonic() - started, output_bytes, None
+
+    lines = []
+    with tempfile.NamedTemporaryFile(prefix='pymigrate-') as errors:
+        # stderr is kept aside, so log messages don't break the document
+        exit_code, output_bytes = executor.run_streaming('{0} 2>{1}'.format(cmd, shlex.quote(errors.name)), env,
+                                                         lines.append)
+        errors.seek(0)
+        for line in errors:
+            write_stderr(prefix.encode() + line)
+    seconds = time.monotonic() - started
+    try:
+        document = parse_document(b''.join(lines).decode(), fmt)
+    except ValueError as e:
+        write_stderr('{0}Unable to parse {1} output: {2}\n'.format(prefix, fmt, e).encode())
+        for line in lines:
+            write_stderr(prefix.encode() + line)
+        return environment, exit_code or 1, seconds, output_bytes, None
+    return environment, exit_code, seconds, output_bytes, document
+
+
+def write_stderr(line: bytes):
+    """
+    Write a single line of child stderr to stderr, see executor.write_stdout.
+    """
+    sys.stderr.buffer.write(line)
+    sys.stderr.buffer.flush()
+
+
+def parse_document(text: str, fmt: str) -> tuple:
+    """
+    Parse output written by output.write_rows in :param fmt:.
+
+    :raise ValueError: if :param text: is not a document in :param fmt:.
+
+    :return: tuple of column names and list of rows.
+    """
+    if fmt == 'csv':
+        try:
+            rows = list(csv.reader(text.splitlines()))
+        except csv.Error as e:
+            raise ValueError(str(e))
+        if not rows:
+            raise ValueError('header is missing')
+        return tuple(rows[0]), [tuple(row) for row in rows[1:]]
+    if fmt == 'json':
+        records = json.loads(text, object_pairs_hook=list)
+    else:
+        records = [json.loads(line, object_pairs_hook=list) for line in text.splitlines() if line.strip()]
+    if not isinstance(records, list) or not all(isinstance(record, list) for record in records):
+        raise ValueError('not a list of records')
+    columns = []
+    for record in records:
+        columns += [key for key, _ in record if key not in columns]
+    return tuple(columns), [tuple(dict(record).get(column) for column in columns) for record in records]
+
+
+def fan_out(environments: list, argv: list, jobs: int, app_logger: logger.Logger,
+            sink=executor.write_stdout, fmt: str = 'text') -> bool:
+    """
+    Run the same action for every environment from :param environments: with at most :param jobs:
+    environments processed concurrently, then print per-environment results and total wall time.
+    With :param fmt: other than text documents printed for every environment are merged into a single one
+    with environment column added, and the summary is printed to stderr.
+
+    :param environments: environment names.
+    :param argv: command line arguments of current invocation.
+    :param jobs: maximum amount of environments processed concurrently.
+    :param app_logger: instance of configured logger.
+    :param sink: callable accepting output line bytes.
+    :param fmt: output format of the action, see DOCUMENT_ACTIONS.
+
+    :return: True if action succeeded in every environment, False otherwise.
+    """
+    app_logger.log_with_ts('Running for environments: {0}', logger.Levels.DEBUG, ', '.join(environments))
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as pool:
+        futures = [pool.submit(run_environment, environment, argv, os.environ.copy(), sink, fmt)
+                   for environment in environments]
+        try:
+            results = [future.result() for future in futures]
+        except KeyboardInterrupt:
+            # every environment process cancels its own migrations on SIGTERM, give it time to do so
+            executor.cancel_all(2 * executor.KILL_GRACE)
+            raise
+    total = time.monotonic() - started
+
+    summary = sys.stdout
+    if fmt != 'text':
+        summary = sys.stderr
+        columns = ()
+        for _, _, _, _, document in results:
+            if document is not None:
+                columns += tuple(column for column in document[0] if column not in columns)
+        rows = ((environment,) + tuple(dict(zip(document[0], row)).get(column) for column in columns)
+                for environment, _, _, _, document in results if document is not None
+                for row in document[1])
+        output.write_rows(('environment',) + columns, rows, fmt)
+
+    summary.write('Environments summary (total {0:.3f}s):\n'.format(total))
+    output.write_rows(RESULT_COLUMNS,
+                      ((environment, 'OK' if exit_code == 0 else 'FAILED', exit_code, '%.3f' % seconds, output_bytes)
+                       for environment, exit_code, seconds, output_bytes, _ in results),
+                      'text', summary, widths=(11, 6, 9, 7, 12))
+    return all(exit_code == 0 for _, exit_code, _, _, _ in results)
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
@@ -6,6 +6,204 @@ __email__ = 'makcimkos@gmail.com'
 import sys
 import os
 import subprocess
+import threading
+import profiling
+
+# git directory found for every project root asked so far
+_git_dirs = {}
+# HEAD resolution per git directory: (stamp of files it was read from, ref HEAD points to, branch, commit sha)
+_heads = {}
+_lock = threading.Lock()
+
+
+def find_git_dir(project_root: str) -> str:
+    """
+    Find git directory of repository containing :param project_root: by walking up the directory tree.
+    Both regular .git directories and .git files pointing elsewhere (worktrees, submodules) are supported.
+
+    :param project_root: path inside local git repo
+
+    :return: absolute path to git directory or None if :param project_root: is not inside git repo.
+    """
+    path = os.path.realpath(project_root)
+    while True:
+        dot_git = os.path.join(path, '.git')
+        if os.path.isdir(dot_git):
+            return dot_git
+        if os.path.isfile(dot_git):
+            with open(dot_git, 'r') as f:
+                content = f.read().strip()
+            if content.startswith('gitdir:'):
+                return os.path.normpath(os.path.join(path, content[len('gitdir:'):].strip()))
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def get_common_dir(git_dir: str) -> str:
+    """
+    Return directory holding refs shared between worktrees, which is git_dir itself for regular repositories.
+
+    :param git_dir: absolute path to git directory
+    """
+    commondir = os.path.join(git_dir, 'commondir')
+    if os.path.isfile(commondir):
+        with open(commondir, 'r') as f:
+            return os.path.normpath(os.path.join(git_dir, f.read().strip()))
+    return git_dir
+
+
+def resolve_ref(git_dir: str, ref: str) -> str:
+    """
+    Resolve :param ref: (e.g. refs/heads/master) to commit sha1 using loose refs first and packed-refs then.
+
+    :param git_dir: absolute path to git directory
+    :param ref: full ref name
+
+    :return: sha1 string or None if ref can't be resolved.
+    """
+    for base in (git_dir, get_common_dir(git_dir)):
+        loose = os.path.join(base, ref)
+        if os.path.isfile(loose):
+            with open(loose, 'r') as f:
+                content = f.read().strip()
+            if content.startswith('ref:'):
+                return resolve_ref(git_dir, content[len('ref:'):].strip())
+            return content or None
+
+    packed_refs = os.path.join(get_common_dir(git_dir), 'packed-refs')
+    if os.path.isfile(packed_refs):
+        with open(packed_refs, 'r') as f:
+            for line in f:
+                if line.startswith('#') or line.startswith('^'):
+                    continue
+                parts = line.split()
+                if len(parts) == 2 and parts[1] == ref:
+                    return parts[0]
+    return None
+
+
+def read_head(git_dir: str) -> tuple:
+    """
+    Read HEAD of git repository without calling git.
+
+    :param git_dir: absolute path to git directory
+
+    :return: tuple of branch name ('unknown' for detached HEAD) and commit sha1 (None if branch has no commits yet).
+    """
+    with open(os.path.join(git_dir, 'HEAD'), 'r') as f:
+        head = f.read().strip()
+    if head.startswith('ref:'):
+        ref = head[len('ref:'):].strip()
+        branch = ref[len('refs/heads/'):] if ref.startswith('refs/heads/') else ref
+        return branch, resolve_ref(git_dir, ref)
+    return 'unknown', head or None
+
+
+def run_git(project_root: str, *args) -> str:
+    """
+    Run git with :param args: in :param project_root: and return its stripped output.
+
+    :param project_root: path to local git repo
+
+    :return: git output or None if git failed.
+    """
+    try:
+        child = subprocess.Popen(('git',) + args,
+                                 cwd=project_root,
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.DEVNULL)
+    except OSError:
+        return None
+    output = child.communicate()[0].decode().strip()
+    return output if child.returncode == 0 and output else None
+
+
+def get_head(project_root: str) -> tuple:
+    """
+    Resolve branch and commit HEAD of repo containing :param project_root: is pointing to. Result is memoized
+    per process and is read again only when HEAD, the ref it points to or packed-refs change. If git metadata
+    can't be read directly, fall back to calling git.
+
+    :param project_root: path to local git repo
+
+    :return: tuple of branch name and commit sha1, 'unknown' is used for values which can't be resolved.
+    """
+    with profiling.phase('git'):
+        return _resolve_head(project_root)
+
+
+def _resolve_head(project_root: str) -> tuple:
+    key = os.path.abspath(project_root)
+    with _lock:
+        if key not in _git_dirs:
+            _git_dirs[key] = find_git_dir(key)
+        git_dir = _git_dirs[key]
+
+    if git_dir is not None:
+        try:
+            with _lock:
+                cached = _heads.get(git_dir)
+            if cached and cached[0] == _stamp(git_dir, cached[1]):
+                return cached[2], cached[3]
+            ref = read_head_ref(git_dir)
+            stamp = _stamp(git_dir, ref)
+            branch, sha = read_head(git_dir)
+            with _lock:
+                _heads[git_dir] = (stamp, ref, branch, sha or 'unknown')
+            return branch, sha or 'unknown'
+        except OSError:
+            pass
+
+    # git metadata is not readable directly (e.g. GIT_DIR is set), ask git once per process
+    with _lock:
+        cached = _heads.get(key)
+    if cached:
+        return cached[2], cached[3]
+    branch = run_git(key, 'rev-parse', '--abbrev-ref', 'HEAD')
+    sha = run_git(key, 'rev-parse', 'HEAD')
+    res = (branch if branch and branch != 'HEAD' else 'unknown', sha or 'unknown')
+    with _lock:
+        _heads[key] = (None, None) + res
+    return res
+
+
+def read_head_ref(git_dir: str) -> str:
+    """
+    :return: full name of ref HEAD of :param git_dir: points to or None if HEAD is detached.
+    """
+    with open(os.path.join(git_dir, 'HEAD'), 'r') as f:
+        head = f.read().strip()
+    return head[len('ref:'):].strip() if head.startswith('ref:') else None
+
+
+def _stamp(git_dir: str, ref: str) -> tuple:
+    # a commit rewrites the ref file (or packed-refs) rather than HEAD, so all of them are watched
+    paths = [os.path.join(git_dir, 'HEAD'), os.path.join(get_common_dir(git_dir), 'packed-refs')]
+    if ref is not None:
+        paths += [os.path.join(git_dir, ref), os.path.join(get_common_dir(git_dir), ref)]
+    stamp = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stamp.append((stat.st_mtime_ns, stat.st_ino, stat.st_size))
+        except FileNotFoundError:
+            stamp.append(None)
+    return tuple(stamp)
+
+
+def read_version_file(project_root: str) -> str:
+    """
+    Read VERSION file located two levels above :param project_root:.
+
+    :return: contents of VERSION file or None if it does not exist.
+    """
+    version_file = os.path.join(os.path.abspath(project_root), os.pardir, os.pardir) + '/VERSION'
+    if os.path.isfile(version_file):
+        with open(version_file) as f:
+            return f.read().replace('\n', '')
+    return None
 
 
 def get_branch(project_root: str) -> str:
@@ -17,24 +215,21 @@ def get_branch(project_root: str) -> str:
 
     :return: Return current branch name if possible, 'unknown' otherwise.
     """
-    if os.path.isfile(os.path.join(os.path.abspath(project_root), os.pardir, os.pardir) + '/VERSION'):
-        with open(os.path.join(os.path.abspath(project_root), os.pardir, os.pardir) + '/VERSION') as f:
-            return f.read().replace('\n', '')
+    version = read_version_file(project_root)
+    if version is not None:
+        return version
+    return get_head(project_root)[0]
+
+
+def get_commit(project_root: str) -> str:
+    """
+    Read sha1 of commit HEAD is currently pointing to.
 
-    child = subprocess.Popen('cd {0} && git rev-parse --abbrev-ref HEAD'.format(project_root),
-                             shell=True,
-                             stdout=subprocess.PIPE,
-                             stderr=subprocess.DEVNULL)
-    exit_code = child.wait()
-    branch = child.stdout.read().decode()
-    if len(branch) != 0:
-        branch = branch.replace('\n', '')
-    else:
-        return 'unknown'
-    if exit_code == 0 and branch != 'HEAD':
-        return branch
-    else:
-        return 'unknown'
+    :param project_root: path to local git repo
+
+    :return: sha1 commit string if possible, 'unknown' otherwise.
+    """
+    return get_head(project_root)[1]
 
 
 def get_latest_sha(project_dir: str, branch: str) -> str:
@@ -46,16 +241,12 @@ def get_latest_sha(project_dir: str, branch: str) -> str:
 
     :return: sha1 commint string
     """
-    child = subprocess.Popen('cd {0} && git rev-parse -q --short origin/{1}'.format(project_dir, branch),
-                             shell=True,
-                             stdout=subprocess.PIPE,
-                             stderr=subprocess.DEVNULL)
-    exit_code = child.wait()
-    sha1 = child.stdout.read().replace('\n', '')
-    if exit_code == 0:
-        return sha1
-    else:
-        return 'unknown'
+    git_dir = find_git_dir(project_dir)
+    sha1 = resolve_ref(git_dir, 'refs/remotes/origin/' + branch) if git_dir else None
+    if sha1:
+        return sha1[:7]
+    sha1 = run_git(project_dir, 'rev-parse', '-q', '--short', 'origin/' + branch)
+    return sha1 if sha1 else 'unknown'
 
 
 if __name__ == '__main__':
@@ -0,0 +1,62 @@
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import sys
+import time
+import store
+from enum import Enum
+from enum import auto
+
+# seconds between attempts to claim migration leased by another process, may be overridden by CLAIM_RETRY_INTERVAL
+CLAIM_RETRY_INTERVAL = 1.0
+
+
+class Claim(Enum):
+    CLAIMED = auto()
+    # migration was finished by another process meanwhile
+    DONE = auto()
+    # migration is RUNNING in another process which holds a live lease on it
+    BUSY = auto()
+    # migration status was changed by somebody else meanwhile
+    CHANGED = auto()
+
+
+def owner(host: str, pid: int) -> str:
+    """
+    Build ID of lease owner from host name and process ID, so leases of a run can be found by its host and pid.
+    """
+    return '{0}:{1}'.format(host, pid)
+
+
+def claim(migration_store: store.MigrationStore, migration_id: str, expected: store.Status, lease_owner: str,
+          ttl: float) -> tuple:
+    """
+    Claim migration :param migration_id: for :param lease_owner: for :param ttl: seconds, see
+    store.MigrationStore.claim. The lease must be renewed before it expires, otherwise another process may
+    claim the migration.
+
+    :param migration_store: migrations store.
+    :param migration_id: ID of migration to claim.
+    :param expected: status migration was seen in.
+    :param lease_owner: ID of claiming process as returned by owner.
+    :param ttl: lease duration in seconds.
+
+    :return: tuple of Claim and current status name of the migration.
+    """
+    now = time.time()
+    if migration_store.claim(migration_id, expected, lease_owner, now, now + ttl):
+        return Claim.CLAIMED, store.Status.RUNNING.name
+    record = migration_store.get(migration_id)
+    status = record.status if record else store.Status.UNKNOWN.name
+    if status in (store.Status.DONE.name, store.Status.SKIP.name):
+        return Claim.DONE, status
+    if status == store.Status.RUNNING.name:
+        return Claim.BUSY, status
+    return Claim.CHANGED, status
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
@@ -5,8 +5,14 @@ __email__ = 'makcimkos@gmail.com'
 
 import datetime
 import sys
+import threading
+import time
 from enum import IntEnum
 
+FORMATS = ('text', 'json')
+# size of log file write buffer in bytes
+BUFFER_SIZE = 65536
+
 
 class Levels(IntEnum):
     """
@@ -22,11 +28,28 @@ class Logger:
     """
     Logger class is responsible for logging messages to specified TextIOWrapper object.
     Each message is tagged by some log level from Level enum.
+
+    Level is checked before any other work, so messages above configured level cost a single comparison.
+    Messages are formatted lazily: positional arguments passed after level are substituted with str.format
+    only if the message is going to be written. Log file is opened once and written through a buffer,
+    which is flushed every :param flush_interval: seconds by a background thread if the latter is positive,
+    when the buffer is full and on close().
     """
 
-    def __init__(self, path_to_log: str = None, level: Levels = Levels.INFO):
+    def __init__(self, path_to_log: str = None, level: Levels = Levels.INFO, fmt: str = 'text',
+                 flush_interval: float = 0):
+        if fmt not in FORMATS:
+            raise ValueError("invalid log format: '%s'" % fmt)
         self.path_to_log = path_to_log
         self.level = level
+        self.fmt = fmt
+        self._lock = threading.Lock()
+        self._file = open(path_to_log, 'a', buffering=BUFFER_SIZE) if path_to_log is not None else None
+        self._stop = threading.Event()
+        self._flusher = None
+        if self._file is not None and flush_interval > 0:
+            self._flusher = threading.Thread(target=self._flush_every, args=(flush_interval,), daemon=True)
+            self._flusher.start()
 
     def __repr__(self):
         return '[ {0}: {1}, {2}: {3} ]'.format('path_to_log',
@@ -34,43 +57,86 @@ class Logger:
                                                'level',
                                                self.level.name)
 
+    def is_enabled(self, level: Levels) -> bool:
+        """
+        Check whether messages of :param level: are written, use it to skip computing expensive log arguments.
+        """
+        return level <= self.level
+
+    def _flush_every(self, interval: float):
+        while not self._stop.wait(interval):
+            self.flush()
+
+    def _write(self, stream, line: str) -> int:
+        with self._lock:
+            return stream.write(line)
+
+    def _render(self, msg: str, level: Levels, args: tuple, ts: bool) -> str:
+        if args:
+            msg = msg.format(*args)
+        if self.fmt == 'json':
+            import json
+            record = {'ts': time.time(), 'level': level.name, 'msg': msg} if ts else {'level': level.name, 'msg': msg}
+            return json.dumps(record) + '\n'
+        if ts:
+            return '[{0}] {1}: {2}\n'.format(datetime.datetime.now().astimezone().isoformat(), level.name, msg)
+        return '{0}\n'.format(msg)
+
     # TODO: add function to print user-friendly formatted messages and replace all print() calls
-    def log_with_ts(self, msg: str, level: Levels) -> int:
+    def log_with_ts(self, msg: str, level: Levels, *args) -> int:
         """
         Write :param msg: to self.path_to_log if latter was passed to class constructor. Will write
         to stderr otherwise. This function also add a timestamp according to ISO. If log level requested
         is greater than the one used to create a Logger object then the message will be ignored.
 
-        :param msg: log message to write.
+        :param msg: log message to write, may contain str.format placeholders for :param args:.
         :param level: log level to tag the message.
+        :param args: values substituted into :param msg: only if the message is written.
 
         :return: amount of bytes written to TextIOWrapper object.
         """
-        ts = datetime.datetime.now().astimezone().isoformat()
-        if level <= self.level:
-            if self.path_to_log is None:
-                return sys.stderr.write('[{0}] {1}: {2}\n'.format(ts, self.level.name, msg))
-            else:
-                with open(self.path_to_log, 'rw') as f:
-                    return f.write('[{0}] {1}\n'.format(self.level.name, msg))
-
-    def log_plain(self, msg: str, level: Levels) -> int:
+        if level > self.level:
+            return 0
+        return self._write(self._file or sys.stderr, self._render(msg, level, args, True))
+
+    def log_plain(self, msg: str, level: Levels, *args) -> int:
         """
         Write :param msg: to self.path_to_log if latter was passed to class constructor. Will write
-        to stdin otherwise. If log level requested is greater than the one used to create a Logger
-        object then the message will be ignored. This method won't append log level tag.
+        to stdout otherwise. If log level requested is greater than the one used to create a Logger
+        object then the message will be ignored. This method won't add a timestamp.
 
-        :param msg: log message to write.
+        :param msg: log message to write, may contain str.format placeholders for :param args:.
         :param level: log level to tag the message.
+        :param args: values substituted into :param msg: only if the message is written.
 
         :return: amount of bytes written to TextIOWrapper object.
         """
-        if level <= self.level:
-            if self.path_to_log is None:
-                return sys.stdout.write('{0}\n'.format(msg))
-            else:
-                with open(self.path_to_log, 'rw') as f:
-                    return f.write('[{0}] {1}\n'.format(self.level.name, msg))
+        if level > self.level:
+            return 0
+        line = self._render(msg, level, args, False)
+        if self._file is None:
+            return self._write(sys.stdout, line)
+        return self._write(self._file, line if self.fmt == 'json' else '[{0}] {1}'.format(level.name, line))
+
+    def flush(self):
+        """
+        Write buffered messages to log file.
+        """
+        if self._file is not None:
+            with self._lock:
+                if not self._file.closed:
+                    self._file.flush()
+
+    def close(self):
+        """
+        Stop background flushing and close log file.
+        """
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        if self._file is not None:
+            with self._lock:
+                self._file.close()
 
 
 if __name__ == '__main__':
@@ -5,29 +5,36 @@ __email__ = 'makcimkos@gmail.com'
 
 import sys
 import os
-import sqlite3
+import functools
+import socket
 import git
+import store
 import logger
 import shutil
 import util
 import time
 import templates
-import io
-import subprocess
-from enum import Enum
-from enum import auto
+import executor
+import profiling
+import scanner
+import checksum
+import retry
+import runlog
+import lease
+import baseline
+import workers
 
 
-class Status(Enum):
-    """
-    Enum representing possible migration states.
-    """
-    DONE = auto()
-    FAILED = auto()
-    MANUAL = auto()
-    PENDING = auto()
-    SKIP = auto()
-    UNKNOWN = auto()
+Status = store.Status
+
+# file in migration directory holding its time limit in seconds, overrides MIGRATION_TIMEOUT
+TIMEOUT_FILE = 'timeout'
+# seconds between heartbeats of running migration, may be overridden by HEARTBEAT_INTERVAL
+HEARTBEAT_INTERVAL = 5.0
+# run without heartbeat for this many seconds is considered abandoned, may be overridden by STALE_AFTER
+STALE_AFTER = 3 * HEARTBEAT_INTERVAL
+
+HOST = socket.gethostname()
 
 
 def set_status(migration_id: str, path_to_db_dir: str, status: Status, app_logger: logger.Logger) -> bool:
@@ -41,26 +48,17 @@ def set_status(migration_id: str, path_to_db_dir: str, status: Status, app_logge
 
     :return: True on success, False otherwise
     """
-    query_template = "UPDATE migrations SET migration_id='{0}', branch='{1}', status='{2}' where migration_id='{3}'"
-
     if not path_to_db_dir:
-        db = os.path.dirname(os.path.realpath(__file__)) + '/' + os.path.join(os.pardir, 'migrations.db')
-        if not os.path.isfile(db):
-            db_init(os.path.dirname(db), app_logger)
-        branch = git.get_branch(os.path.dirname(db))
-    else:
-        db = path_to_db_dir + '/migrations.db'
-        if not os.path.isfile(db):
-            db_init(path_to_db_dir, app_logger)
-        branch = git.get_branch(path_to_db_dir)
-
-    if check_status(migration_id, db, app_logger) == 'UNKNOWN':
+        path_to_db_dir = os.path.dirname(os.path.realpath(__file__)) + '/' + os.pardir
+    if not store.exists(path_to_db_dir):
+        db_init(path_to_db_dir, app_logger)
+    branch = git.get_branch(path_to_db_dir)
+    commit_sha = git.get_commit(path_to_db_dir)
+
+    migration_store = store.open_store(path_to_db_dir, app_logger)
+    if not migration_store.set_status(migration_id, status, branch, commit_sha):
         print("Migration not found: %s" % migration_id)
         return False
-    with sqlite3.connect(db) as conn:
-        c = conn.cursor()
-        c.execute(query_template.format(migration_id, branch, status.name, migration_id))
-        conn.commit()
     return True
 
 
@@ -140,17 +138,13 @@ def check_status(migration_id: str, path_to_db: str, app_logger: logger.Logger)
 
     :return: :type migration.Status: of migration :param migration_id:
     """
-    query = "SELECT status from migrations where migration_id='{0}'"
-
-    if not os.path.isfile(path_to_db):
-        app_logger.log_with_ts("DB not found: {0}".format(path_to_db), logger.Levels.INFO)
+    if not store.exists(os.path.dirname(path_to_db)):
+        app_logger.log_with_ts("DB not found: {0}", logger.Levels.INFO, path_to_db)
         return Status.PENDING
 
-    # TODO: handle io, sqlite db exceptions
-    with sqlite3.connect(path_to_db) as conn:
-        c = conn.cursor()
-        res = c.execute(query.format(migration_id)).fetchone()[0].replace('\n', '')
-        return Status.__members__[res] if res and res in Status.__members__ else Status.UNKNOWN
+    record = store.open_store(os.path.dirname(path_to_db), app_logger).get(migration_id)
+    res = record.status.replace('\n', '') if record and record.status else None
+    return Status.__members__[res] if res and res in Status.__members__ else Status.UNKNOWN
 
 
 def get_statuses(path_to_db: str, app_logger: logger.Logger) -> dict:
@@ -158,30 +152,25 @@ def get_statuses(path_to_db: str, app_logger: logger.Logger) -> dict:
     Generate key-value pairs by selecting all rows from migrations table thus presenting
     a migration status summary.
 
-    :param path_to_db: absolute path to sqlite db file
+    :param path_to_db: absolute path to database file in migrations directory, see store.state_path
     :param app_logger: instance of configured logger
 
     :return: dict where key is migrationId and value is a tuple of all the rest columns
     """
     res = {}
-    with sqlite3.connect(path_to_db) as conn:
-        stmt = 'SELECT * from migrations ORDER BY migration_id'
-        try:
-            # TODO: deal with potentially big migrations table
-            from_db = dict({(lambda t: (t[0], tuple(t[1:])))(row) for row in conn.cursor().execute(stmt)})
-            # TODO: need more elegant solution here
-            if len(from_db) != 0:
-                res = from_db
-        except sqlite3.OperationalError:
-            app_logger.log_with_ts('Migrations database not found at: {0}'.format(path_to_db), logger.Levels.WARNING)
-        finally:
-            return res
+    try:
+        migration_store = store.open_store(os.path.dirname(path_to_db), app_logger)
+        with profiling.phase(store.STATE_BACKEND + '.read_statuses'):
+            res = {record.migration_id: tuple(record[1:]) for record in migration_store.iterate()}
+    except store.ERRORS as e:
+        app_logger.log_with_ts('Failed to read migrations state at {0}: {1}', logger.Levels.WARNING, path_to_db, e)
+    return res
 
 
 # TODO: add some debug logging here
 def db_init(path_to_db_dir: str, app_logger: logger.Logger) -> bool:
     """
-    Initialize sqlite3 database with migrations metadata at given absolute path.
+    Initialize migrations state kept by store.STATE_BACKEND at given absolute path.
 
     :param path_to_db_dir: absolute path to migrations directory
     :param app_logger: instance of configured logger
@@ -189,72 +178,125 @@ def db_init(path_to_db_dir: str, app_logger: logger.Logger) -> bool:
     :return: True on success, False otherwise
     """
     if not os.path.isdir(path_to_db_dir):
-        app_logger.log_with_ts('Migrations directory does not exist, creating at {0}'.format(path_to_db_dir),
-                               logger.Levels.WARNING)
+        app_logger.log_with_ts('Migrations directory does not exist, creating at {0}', logger.Levels.WARNING,
+                               path_to_db_dir)
         os.makedirs(path_to_db_dir, 0o775)
-    migration_names = [migration for migration in os.listdir(path_to_db_dir) if
-                       os.path.isdir(os.path.join(path_to_db_dir, migration))]
-    # TODO: handle io, sqlite db exceptions
-    with sqlite3.connect(path_to_db_dir + '/migrations.db') as conn:
-        app_logger.log_with_ts('Initializing sqlite database', logger.Levels.DEBUG)
-        c = conn.cursor()
-        c.execute('CREATE TABLE IF NOT EXISTS migrations (migration_id, status, presence, branch)')
-        branch = git.get_branch(path_to_db_dir)
-        for migration_id in migration_names:
-            c.execute("INSERT INTO migrations VALUES ('{0}', 'PENDING', 'PRESENT', '{1}')".format(migration_id, branch))
-        conn.commit()
+    migration_names = scan_migrations_dir(path_to_db_dir)
+    app_logger.log_with_ts('Initializing migrations state', logger.Levels.DEBUG)
+    branch = git.get_branch(path_to_db_dir)
+    commit_sha = git.get_commit(path_to_db_dir)
+    migration_store = store.open_store(path_to_db_dir, app_logger)
+    with migration_store.transaction():
+        migration_store.add(store.MigrationRecord(migration_id, Status.PENDING.name, 'PRESENT', branch, commit_sha)
+                            for migration_id in migration_names)
+        sync_baseline(path_to_db_dir, app_logger)
+    return True
+
+
+def sync_baseline(migrations_directory_path: str, app_logger: logger.Logger, from_db: dict = None) -> bool:
+    """
+    Bring migrations state in line with the baseline of migrations directory, if there is one: add the baseline
+    migration and forget migrations squashed into it, see baseline.reconcile.
+
+    :param migrations_directory_path: path to migrations directory.
+    :param app_logger: instance of configured logger.
+    :param from_db: dict of store.MigrationRecord of all migrations, read from migrations state if None.
+
+    :return: True if there is a baseline, False otherwise.
+    """
+    try:
+        manifest = baseline.load(migrations_directory_path)
+    except ValueError as e:
+        app_logger.log_with_ts(str(e), logger.Levels.ERROR)
+        return False
+    if manifest is None:
+        return False
+    migration_store = store.open_store(migrations_directory_path, app_logger)
+    with migration_store.transaction():
+        if from_db is None:
+            from_db = {record.migration_id: record for record in migration_store.iterate()}
+        status, folded = baseline.reconcile(manifest, from_db)
+        if status is not None and baseline.BASELINE_ID in from_db:
+            migration_store.set_status(baseline.BASELINE_ID, Status[status])
+        elif status is not None:
+            migration_store.add([store.MigrationRecord(baseline.BASELINE_ID, status, 'PRESENT',
+                                                       git.get_branch(migrations_directory_path),
+                                                       git.get_commit(migrations_directory_path))])
+        for migration_id in sorted(folded):
+            migration_store.delete(migration_id)
+    if folded:
+        app_logger.log_with_ts('Folded {0} migrations into baseline', logger.Levels.DEBUG, len(folded))
+    if status == Status.MANUAL.name:
+        app_logger.log_with_ts('Migrations squashed into baseline up to {0} were run here only partially, apply '
+                               'the rest by hand and set {1} DONE', logger.Levels.WARNING, manifest.to,
+                               baseline.BASELINE_ID)
     return True
 
 
+def scan_migrations_dir(migrations_directory_path: str) -> set:
+    """
+    List migrations found on disk with a single pass over migrations directory. Every directory is
+    considered a migration except hidden ones, which are reserved for pymigrate own data.
+
+    :param migrations_directory_path: path to migrations directory
+
+    :return: set of migration IDs
+    """
+    with os.scandir(migrations_directory_path) as entries:
+        return set(entry.name for entry in entries if not entry.name.startswith('.') and entry.is_dir())
+
+
 # TODO: Do we really need to pass config dict here or it'd be better to do as in db_init function
-# TODO: add some debug logging here
-# TODO: consider using this function as a context manager
 def db_update(config: dict, app_logger: logger.Logger) -> bool:
     """
     Check migrations directory for new migrations since last run and update migrations database.
+    Changes are computed as a set difference between migrations on disk and in database and written
+    in a single transaction. Files found in migration directories are taken from scan cache, see scanner.scan.
 
     :param config: pymigrate configuration
     :param app_logger: instance of configured logger
 
-    :return:
+    :return: True on success, False otherwise
     """
     app_logger.log_with_ts('Starting migration database update process', logger.Levels.DEBUG)
     migrations_directory_path = os.path.join(os.pardir, config['PROJECT_DIR'] + '/' + config['MIGRATIONS_DIR'])
-    migration_ids = [migration_id for migration_id in os.listdir(migrations_directory_path) if
-                     os.path.isdir(os.path.join(migrations_directory_path, migration_id))]
-
-    migrations_from_db = get_statuses(migrations_directory_path + '/migrations.db', app_logger)
+    migration_store = store.open_store(migrations_directory_path, app_logger)
+    with profiling.phase('db_update.scan'):
+        scans = scanner.scan(migrations_directory_path, migration_store)
+    on_disk = set(scans)
+    has_baseline = os.path.isfile(os.path.join(baseline.baseline_dir(migrations_directory_path),
+                                               baseline.MANIFEST_FILE))
+    if has_baseline:
+        on_disk.add(baseline.BASELINE_ID)
+
+    with profiling.phase('db_update.read'):
+        from_db = {record.migration_id: record for record in migration_store.iterate()}
     branch = git.get_branch(migrations_directory_path)
-    app_logger.log_with_ts('Got git branch: {0}'.format(branch), logger.Levels.DEBUG)
-
-    # TODO: handle io, sqlite db exceptions
-    with sqlite3.connect(migrations_directory_path + '/migrations.db') as conn:
-        c = conn.cursor()
-        for migration_id, status in migrations_from_db.items():
-            if migration_id not in migration_ids:
-                app_logger.log_with_ts('Migration {0} is missing on disk, marking it ABSENT'.format(migration_id),
-                                       logger.Levels.DEBUG)
-                c.execute(
-                    "UPDATE migrations SET presence='ABSENT' where migration_id='{0}'".format(migration_id))
-            elif migration_id not in migration_ids and status == 'ABSENT':
-                app_logger.log_with_ts('Migration re-appeared: {0}'.format(migration_id), logger.Levels.DEBUG)
-                c.execute("UPDATE migrations SET presence='PRESENT' where migration_id='{0}'".format(migration_id))
-
-        for migration_id in migration_ids:
-            if migration_id not in migrations_from_db:
-                app_logger.log_with_ts('New migration detected: {0}'.format(migration_id), logger.Levels.DEBUG)
-                c.execute(
-                    "INSERT INTO migrations VALUES ('{0}', 'PENDING', 'PRESENT', '{1}')".format(migration_id, branch))
-
-            # Set migration status MANUAL if readme.* is present
-            check_query = "SELECT status from migrations where migration_id='{0}'"
-            readme_files = util.find_files('readme*', migrations_directory_path + '/' + migration_id, False)
-            if len(readme_files) != 0 and os.path.isfile(readme_files[0]) and \
-                            c.execute(check_query.format(migration_id)).fetchone()[0].replace('\n', '') not in (
-                            Status.DONE.name, Status.FAILED.name, Status.SKIP.name):
-                app_logger.log_with_ts('Readme file detected for migration: {0}'.format(migration_id),
-                                       logger.Levels.DEBUG)
-                c.execute("UPDATE migrations SET status='MANUAL' where migration_id='{0}'".format(migration_id))
+    commit_sha = git.get_commit(migrations_directory_path)
+    app_logger.log_with_ts('Got git branch: {0}, commit: {1}', logger.Levels.DEBUG, branch, commit_sha)
+
+    # baseline is added by sync_baseline, which decides whether it has to be run
+    new = on_disk.difference(from_db).difference((baseline.BASELINE_ID,))
+    absent = set(migration_id for migration_id, record in from_db.items()
+                 if migration_id not in on_disk and record.presence != 'ABSENT')
+    reappeared = set(migration_id for migration_id, record in from_db.items()
+                     if migration_id in on_disk and record.presence == 'ABSENT')
+    # Set migration status MANUAL if readme.* is present
+    final_statuses = (Status.DONE.name, Status.FAILED.name, Status.SKIP.name, Status.MANUAL.name, Status.RUNNING.name)
+    manual = set(migration_id for migration_id in scans
+                 if (migration_id in new or from_db[migration_id].status not in final_statuses) and
+                 scans[migration_id].readme)
+    app_logger.log_with_ts('Migrations new: {0}, absent: {1}, re-appeared: {2}, manual: {3}', logger.Levels.DEBUG,
+                           len(new), len(absent), len(reappeared), len(manual))
+
+    with profiling.phase('db_update.write'), migration_store.transaction():
+        migration_store.add(store.MigrationRecord(migration_id, Status.PENDING.name, 'PRESENT', branch, commit_sha)
+                            for migration_id in sorted(new))
+        migration_store.set_presence(absent, 'ABSENT')
+        migration_store.set_presence(reappeared, 'PRESENT')
+        migration_store.set_statuses(manual, Status.MANUAL)
+        if has_baseline:
+            sync_baseline(migrations_directory_path, app_logger, from_db)
     return True
 
 
@@ -267,21 +309,16 @@ def delete_migration(migration_id: str, migrations_directory_path: str, app_logg
     :param db_path: absolute path to migrations directory
     :param app_logger: instance of configured logger
     """
-    db = migrations_directory_path + '/migrations.db'
-    if os.path.isfile(db):
-        delete_query = "DELETE from migrations WHERE migration_id='{0}'".format(migration_id)
-
-        with sqlite3.connect(db) as conn:
-            c = conn.cursor()
-            app_logger.log_with_ts('Executing query:\n{0}'.format(delete_query), logger.Levels.DEBUG)
-            c.execute(delete_query)
-            conn.commit()
+    if store.exists(migrations_directory_path):
+        app_logger.log_with_ts('Deleting {0} from migrations database', logger.Levels.DEBUG, migration_id)
+        store.open_store(migrations_directory_path, app_logger).delete(migration_id)
 
     try:
         shutil.rmtree(migrations_directory_path + '/' + migration_id)
-        app_logger.log_with_ts('Deleted {0}'.format(migration_id), logger.Levels.DEBUG)
+        shutil.rmtree(os.path.join(migrations_directory_path, runlog.LOG_DIR, migration_id), ignore_errors=True)
+        app_logger.log_with_ts('Deleted {0}', logger.Levels.DEBUG, migration_id)
     except OSError:
-        app_logger.log_with_ts('Failed to delete migration {0}'.format(migration_id), logger.Levels.ERROR)
+        app_logger.log_with_ts('Failed to delete migration {0}', logger.Levels.ERROR, migration_id)
         return False
 
     return True
@@ -335,54 +372,341 @@ def create_migration(config: dict, app_logger: logger.Logger) -> bool:
         return False
 
 
-def run_migration(migration_id: str, config: dict, app_logger: logger.Logger) -> bool:
+def read_timeout(migration_dir: str) -> float:
+    """
+    Read time limit of migration located at :param migration_dir: from its TIMEOUT_FILE.
+
+    :param migration_dir: path to migration directory.
+
+    :return: time limit in seconds, 0 means no limit, or None if there is no TIMEOUT_FILE.
+    """
+    timeout_file = os.path.join(migration_dir, TIMEOUT_FILE)
+    if not os.path.isfile(timeout_file):
+        return None
+    with open(timeout_file, 'r') as f:
+        return float(f.read().strip() or 0)
+
+
+def run_deadline(config: dict) -> float:
+    """
+    Compute time.monotonic() value by which migrate action must finish according to config['RUN_TIMEOUT'].
+
+    :return: deadline or None if run time is not limited.
+    """
+    run_timeout = float(config.get('RUN_TIMEOUT', '0'))
+    return time.monotonic() + run_timeout if run_timeout > 0 else None
+
+
+def is_alive(pid: int) -> bool:
+    """
+    Check whether process :param pid: exists on this host.
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def find_stale_runs(migration_store: store.MigrationStore, config: dict) -> list:
+    """
+    Find runs abandoned by crashed or killed pymigrate processes, i.e. runs without heartbeat for
+    config['STALE_AFTER'] seconds or started on this host by a process which does not exist anymore.
+    Migrations left RUNNING by a process which died while waiting to retry them are detected by heartbeat
+    of their last, already finished, run.
+
+    :param migration_store: migrations store.
+    :param config: pymigrate configuration.
+
+    :return: list of store.RunRecord ordered by run ID.
+    """
+    stale_after = float(config.get('STALE_AFTER', STALE_AFTER))
+    now = time.time()
+    candidates = {run.run_id: run for run in migration_store.get_last_runs(Status.RUNNING)}
+    candidates.update((run.run_id, run) for run in migration_store.iterate_unfinished_runs())
+    stale = []
+    for run_id in sorted(candidates):
+        run = candidates[run_id]
+        if now - (run.heartbeat_at or run.started_at) >= stale_after or \
+                (run.host == HOST and run.pid and not is_alive(run.pid)):
+            stale.append(run)
+    return stale
+
+
+def reclaim_stale_runs(migrations_directory_path: str, config: dict, app_logger: logger.Logger) -> list:
+    """
+    Finish runs abandoned by crashed or killed pymigrate processes, see find_stale_runs. Migrations of such runs
+    which are still RUNNING and not claimed by another process are set to FAILED and their leases are dropped.
+    Exit code of reclaimed runs is unknown and is left empty.
+
+    :param migrations_directory_path: path to migrations directory.
+    :param config: pymigrate configuration.
+    :param app_logger: instance of configured logger.
+
+    :return: list of reclaimed store.RunRecord.
     """
-    Run migration :param migration_id:.
+    migration_store = store.open_store(migrations_directory_path, app_logger)
+    reclaimed = find_stale_runs(migration_store, config)
+    now = time.time()
+    for run in reclaimed:
+        with migration_store.transaction():
+            if run.finished_at is None:
+                migration_store.finish_run(run.run_id, now, now - run.started_at, None, run.output_bytes)
+            # the migration is left alone if another process has claimed it already
+            migration_store.release(run.migration_id, lease.owner(run.host, run.pid), Status.FAILED)
+        app_logger.log_with_ts('Reclaimed abandoned run of migration {0} by pid {1} on {2}, '
+                               'last heartbeat {3:.0f}s ago', logger.Levels.WARNING,
+                               run.migration_id, run.pid, run.host or 'unknown host',
+                               now - (run.heartbeat_at or run.started_at))
+    return reclaimed
+
+
+def time_limit(timeout: float, deadline: float) -> float:
+    """
+    Combine time limit of a single migration attempt with deadline of the whole run.
+
+    :param timeout: time limit of migration in seconds, 0 means no limit.
+    :param deadline: time.monotonic() value by which the whole run must finish or None.
+
+    :return: seconds the attempt may take, 0 means no limit, negative value means deadline has passed.
+    """
+    if deadline is None:
+        return timeout
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        return -1
+    return min(timeout, remaining) if timeout > 0 else remaining
+
+
+def run_migration(migration_id: str, config: dict, app_logger: logger.Logger, deadline: float = None,
+                  expected: str = None, rollback_script: str = None) -> bool:
+    """
+    Run migration :param migration_id:. The migration is claimed first (see lease.claim), so it is never run
+    by two processes sharing migrations database at once. Migration is RUNNING while its script runs, the run gets
+    a heartbeat and the lease is renewed for config['STALE_AFTER'] seconds every config['HEARTBEAT_INTERVAL']
+    seconds. Script is cancelled if the lease is lost. Script is cancelled after its time limit (see read_timeout and
+    config['MIGRATION_TIMEOUT']) or at :param deadline:, whichever comes first. Failed script is run again
+    according to migration's retry policy (see retry.load), every attempt is recorded as a separate run.
+    Output of every attempt is saved to compressed log, see runlog. Python unit (see workers.find_unit) is run
+    by a prewarmed worker instead of shell.
+    With :param rollback_script: the migration is rolled back the same way instead: the script (or rollback function
+    of rollback.py unit) is run once, the run is recorded as store.RUN_ROLLBACK and the migration is PENDING
+    on success.
 
     :param migration_id: id of migration to run
     :param config: pymigrate configuration
     :param app_logger: instance of configured logger
+    :param deadline: time.monotonic() value by which the whole run must finish, see run_deadline
+    :param expected: status name the migration was planned in, current status if None
+    :param rollback_script: path to rollback executable of the migration, see rollback.find_script
+
+    :return: True on success, False on failure, None if the migration is RUNNING in another process
     """
     migration_dir = os.path.join(os.pardir, config['PROJECT_DIR'] +
                                  '/' + config['MIGRATIONS_DIR'] +
                                  '/' + migration_id)
-    app_logger.log_with_ts("Running migration {0} from directory {1}".format(migration_id, migration_dir),
-                           logger.Levels.DEBUG)
-
-    # we do not expect more than one migrate* exec
-    # TODO: may be we shall exec only migrate.sh if it exists and don't touch other migrate* executables there
-    migrate_executable = util.find_files('migrate*', migration_dir, True).pop()
-    tmp_file = '/tmp/.migration_runner_stream.tmp'
-    cmd = migrate_executable + " {0} ".format(config['ENVIRONMENT'])
-    with io.open(tmp_file, 'wb') as writer, io.open(tmp_file, 'rb', 1) as reader:
-        child = subprocess.Popen(cmd,
-                                 shell=True,
-                                 stdout=writer,
-                                 stderr=subprocess.STDOUT,
-                                 env=config)
-        print('stdout:')
-        while child.poll() is None:
-            print(bytes(reader.read()).decode())
-            time.sleep(0.5)
-        print(bytes(reader.read()).decode())
-        exit_code = child.returncode
-        app_logger.log_with_ts("Migration executable exit code: {0}".format(exit_code), logger.Levels.DEBUG)
-        os.remove(tmp_file)
+    app_logger.log_with_ts("Running migration {0} from directory {1}", logger.Levels.DEBUG,
+                           migration_id, migration_dir)
+
+    timeout = read_timeout(migration_dir)
+    if timeout is None:
+        timeout = float(config.get('MIGRATION_TIMEOUT', '0'))
+    if rollback_script is None:
+        try:
+            policy = retry.load(migration_dir, config)
+        except ValueError as e:
+            app_logger.log_with_ts("Invalid retry policy of migration {0}: {1}", logger.Levels.ERROR, migration_id, e)
+            return False
+    else:
+        policy = retry.RetryPolicy()
+    limit = time_limit(timeout, deadline)
+    if limit < 0:
+        app_logger.log_with_ts("Run timeout reached, migration {0} is not started", logger.Levels.ERROR,
+                               migration_id)
+        return False
+
+    # python unit is run by a prewarmed worker, anything else is run by shell
+    if rollback_script is None:
+        entry_point = workers.ENTRY_POINT
+        unit = workers.find_unit(migration_dir)
+    else:
+        entry_point = workers.ROLLBACK_ENTRY_POINT
+        unit = rollback_script if workers.is_unit(rollback_script, entry_point) else None
+    if unit is not None:
+        run = functools.partial(workers.get_pool(config).run, unit, migration_id, config, entry_point=entry_point)
+    else:
+        if rollback_script is None:
+            # we do not expect more than one migrate* exec
+            # TODO: may be we shall exec only migrate.sh if it exists and don't touch other migrate* executables there
+            migrate_executable = util.find_files('migrate*', migration_dir, True).pop()
+        else:
+            migrate_executable = rollback_script
+        run = functools.partial(executor.run_streaming, migrate_executable + " {0} ".format(config['ENVIRONMENT']),
+                                config)
+    action = store.RUN_MIGRATE if rollback_script is None else store.RUN_ROLLBACK
+    sink = executor.write_stdout
+    concurrent = int(config.get('JOBS', '1')) > 1
+    if concurrent:
+        # output of concurrent migrations is interleaved, so tag every line with its migration
+        sink = executor.prefixed('[{0}] '.format(migration_id), sink)
+    keep_logs = int(config.get('LOG_KEEP_RUNS', runlog.KEEP_RUNS))
+    tail_lines = int(config.get('LOG_TAIL_LINES', runlog.TAIL_LINES))
+
+    migrations_directory_path = os.path.join(os.pardir, config['PROJECT_DIR'] + '/' + config['MIGRATIONS_DIR'])
+    migration_store = store.open_store(migrations_directory_path, app_logger)
+    branch = git.get_branch(migrations_directory_path)
+    commit_sha = git.get_commit(migrations_directory_path)
+    if expected is None:
+        record = migration_store.get(migration_id)
+        expected = record.status if record else Status.UNKNOWN.name
+    lease_owner = lease.owner(HOST, os.getpid())
+    lease_ttl = float(config.get('STALE_AFTER', STALE_AFTER))
+    with migration_store.transaction():
+        claim, status = lease.claim(migration_store, migration_id, Status[expected], lease_owner, lease_ttl)
+        if claim == lease.Claim.CLAIMED:
+            run_id = migration_store.start_run(migration_id, time.time(), config['ENVIRONMENT'], branch,
+                                               commit_sha, os.getpid(), HOST, action=action)
+    if claim == lease.Claim.DONE and rollback_script is None:
+        app_logger.log_with_ts("Migration {0} was run by another process", logger.Levels.INFO, migration_id)
+        return True
+    if claim == lease.Claim.BUSY:
+        app_logger.log_with_ts("Migration {0} is RUNNING in another process", logger.Levels.DEBUG, migration_id)
+        return None
+    if claim != lease.Claim.CLAIMED:
+        app_logger.log_with_ts("Migration {0} is {1} now, it was {2}", logger.Levels.ERROR, migration_id, status,
+                               expected)
+        return False
+
+    def heartbeat() -> bool:
+        now = time.time()
+        try:
+            migration_store.heartbeat(run_id, now)
+            if migration_store.renew_lease(migration_id, lease_owner, now + lease_ttl):
+                return True
+        except store.ERRORS as e:
+            app_logger.log_with_ts("Failed to record heartbeat of migration {0}: {1}", logger.Levels.WARNING,
+                                   migration_id, e)
+            return True
+        app_logger.log_with_ts("Lease on migration {0} was lost, cancelling it", logger.Levels.ERROR, migration_id)
+        return False
+
+    def release(final_status: Status):
+        if not migration_store.release(migration_id, lease_owner, final_status, branch, commit_sha):
+            app_logger.log_with_ts("Migration {0} was claimed by another process, its status is left intact",
+                                   logger.Levels.WARNING, migration_id)
+
+    heartbeat_interval = float(config.get('HEARTBEAT_INTERVAL', HEARTBEAT_INTERVAL))
+    attempt = 1
+    running = False
+    # migration is claimed, whatever happens from now on it must not be left RUNNING
+    try:
+        if rollback_script is None:
+            with profiling.phase('migration.checksum'):
+                checksum.record(migrations_directory_path, migration_id, migration_store)
+        if not concurrent:
+            print('stdout:')
+        sys.stdout.flush()
+
+        while True:
+            running = True
+            exit_code, output_bytes = None, 0
+            started = time.monotonic()
+            run_log = runlog.RunLog(runlog.log_path(migrations_directory_path, migration_id, run_id)
+                                    if keep_logs > 0 else None, tail_lines)
+            try:
+                with profiling.phase('migration.script'):
+                    exit_code, output_bytes = run(
+                        runlog.tee(run_log.write, sink), limit,
+                        grace=float(config.get('KILL_GRACE_PERIOD', executor.KILL_GRACE)),
+                        heartbeat=heartbeat,
+                        heartbeat_interval=heartbeat_interval)
+            finally:
+                run_log.close()
+                if keep_logs > 0:
+                    runlog.prune(os.path.dirname(run_log.path), keep_logs,
+                                 float(config.get('LOG_RETENTION_DAYS', runlog.RETENTION_DAYS)))
+            duration = time.monotonic() - started
+            profiling.record_migration(migration_id, duration, exit_code)
+            migration_store.finish_run(run_id, time.time(), duration, exit_code, output_bytes)
+            running = False
+            app_logger.log_with_ts("Migration executable exit code: {0}, output: {1} bytes, took {2:.3f}s",
+                                   logger.Levels.DEBUG, exit_code, output_bytes, duration)
+            if exit_code == executor.TIMEOUT_EXIT_CODE and limit:
+                app_logger.log_with_ts("Migration {0} was cancelled after {1:.0f}s time limit", logger.Levels.ERROR,
+                                       migration_id, limit)
+
+            if not policy.should_retry(attempt, exit_code):
+                break
+            delay = policy.delay(attempt)
+            limit = time_limit(timeout, deadline)
+            if deadline is not None and (limit < 0 or deadline - time.monotonic() <= delay):
+                app_logger.log_with_ts("Run timeout leaves no time to retry migration {0}", logger.Levels.ERROR,
+                                       migration_id)
+                break
+            print('Migration {0} exited with code {1}, retrying in {2:.1f}s (attempt {3} of {4})'
+                  .format(migration_id, exit_code, delay, attempt + 1, policy.max_attempts))
+            sys.stdout.flush()
+            if not backoff(delay, heartbeat, heartbeat_interval):
+                break
+            attempt += 1
+            limit = time_limit(timeout, deadline)
+            run_id = migration_store.start_run(migration_id, time.time(), config['ENVIRONMENT'], branch, commit_sha,
+                                               os.getpid(), HOST, attempt, action)
+
+        if int(exit_code) != 0 and concurrent and run_log.tail:
+            # output of failed migration got mixed with output of others, repeat its end in one piece
+            executor.write_stdout('[{0}] Last {1} lines of output:\n'.format(migration_id, len(run_log.tail))
+                                  .encode() + b''.join(run_log.tail))
+    except BaseException as e:
+        if not isinstance(e, KeyboardInterrupt):
+            app_logger.log_with_ts("Migration {0} failed unexpectedly: {1!r}", logger.Levels.ERROR, migration_id, e)
+        try:
+            if running:
+                migration_store.finish_run(run_id, time.time(), time.monotonic() - started,
+                                           executor.INTERRUPTED_EXIT_CODE if exit_code is None else exit_code,
+                                           output_bytes)
+            release(Status.FAILED)
+        except store.ERRORS as error:
+            app_logger.log_with_ts("Failed to record failure of migration {0}: {1}", logger.Levels.ERROR,
+                                   migration_id, error)
+        raise
+
+    if run_log.path:
+        app_logger.log_with_ts("Output of migration {0} is saved to {1}", logger.Levels.DEBUG, migration_id,
+                               run_log.path)
 
     if int(exit_code) == 0:
-        app_logger.log_with_ts("Migration is considered DONE", logger.Levels.DEBUG)
-        set_status_done(migration_id, app_logger, os.path.join(os.pardir,
-                                                               config['PROJECT_DIR'] + '/' +
-                                                               config['MIGRATIONS_DIR']))
+        final_status = Status.DONE if rollback_script is None else Status.PENDING
+        app_logger.log_with_ts("Migration is considered {0}", logger.Levels.DEBUG, final_status.name)
+        release(final_status)
         return True
     else:
         app_logger.log_with_ts("Migration is considered FAILED", logger.Levels.DEBUG)
-        set_status_failed(migration_id, app_logger, os.path.join(os.pardir,
-                                                                 config['PROJECT_DIR'] + '/' +
-                                                                 config['MIGRATIONS_DIR']))
+        release(Status.FAILED)
         return False
 
 
+def backoff(seconds: float, heartbeat, heartbeat_interval: float) -> bool:
+    """
+    Wait :param seconds: before the next attempt to run a migration calling :param heartbeat: meanwhile,
+    so the migration is not considered abandoned.
+
+    :return: True if waited, False if pymigrate is shutting down (see executor.cancel_all) or heartbeat
+    returned False.
+    """
+    wake = time.monotonic() + seconds
+    while True:
+        left = wake - time.monotonic()
+        if left <= 0:
+            return True
+        if executor.wait_cancelled(min(left, heartbeat_interval)):
+            return False
+        if heartbeat() is False:
+            return False
+
+
 if __name__ == '__main__':
     print("This module is not callable")
     sys.exit(0)
@@ -0,0 +1,70 @@
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import sys
+import csv
+import json
+import itertools
+
+FORMATS = ('text', 'json', 'ndjson', 'csv')
+
+# rows used to compute column widths of text table, the rest of rows is streamed as is
+TEXT_LOOKAHEAD = 500
+
+
+def write_rows(columns: tuple, rows, fmt: str = 'text', stream=None, widths: tuple = None) -> int:
+    """
+    Stream :param rows: to :param stream: in given format without loading them all in memory.
+    Column widths of text table are computed from the first TEXT_LOOKAHEAD rows only.
+
+    :param columns: column names, text table header shows them in upper case.
+    :param rows: iterable of tuples, each tuple holds values for :param columns:.
+    :param fmt: one of FORMATS.
+    :param stream: TextIOWrapper object to write to, stdout by default.
+    :param widths: minimal widths of text table columns.
+
+    :return: amount of rows written.
+    """
+    stream = stream or sys.stdout
+    rows = iter(rows)
+    count = 0
+
+    if fmt == 'json':
+        stream.write('[')
+        for row in rows:
+            stream.write((',\n' if count else '\n') + json.dumps(dict(zip(columns, row))))
+            count += 1
+        stream.write('\n]\n' if count else ']\n')
+    elif fmt == 'ndjson':
+        for row in rows:
+            stream.write(json.dumps(dict(zip(columns, row))) + '\n')
+            count += 1
+    elif fmt == 'csv':
+        writer = csv.writer(stream)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    elif fmt == 'text':
+        head = list(itertools.islice(rows, TEXT_LOOKAHEAD))
+        widths = list(widths or (0,) * len(columns))
+        header = tuple(column.upper() for column in columns)
+        for row in itertools.chain([header], head):
+            for i, value in enumerate(row):
+                widths[i] = max(widths[i], len(str(value)))
+        line_template = ' | '.join('%-' + str(width) + 's' for width in widths)
+        stream.write(line_template % header + '\n')
+        for row in itertools.chain(head, rows):
+            stream.write(line_template % tuple(row) + '\n')
+            count += 1
+    else:
+        raise ValueError("invalid output format: '%s'" % fmt)
+    stream.flush()
+    return count
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
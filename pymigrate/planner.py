@@ -0,0 +1,205 @@
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import sys
+import os
+import heapq
+import logger
+import store
+import stats
+import migration
+import scheduler
+from typing import NamedTuple
+
+COLUMNS = ('order', 'migration_id', 'action', 'reason', 'estimate')
+
+# what migrate does with a migration
+RUN = 'run'
+SKIP = 'skip'
+STOP = 'stop'
+BLOCKED = 'blocked'
+
+# amount of latest successful runs duration estimate is based on
+ESTIMATE_HISTORY = 10
+
+
+class PlanError(Exception):
+    """
+    Raised when migrations can't be planned, e.g. their dependencies are unknown or form a cycle.
+    """
+    pass
+
+
+class Step(NamedTuple):
+    migration_id: str
+    action: str
+    reason: str = ''
+    # seconds, None if migration never succeeded in current environment
+    estimate: float = None
+    # status migration is planned in, migrate claims it from this status, see lease.claim
+    status: str = ''
+
+
+class Plan(NamedTuple):
+    """
+    What migrate is going to do. Steps are ordered as migrate takes them: migrations to run in dispatch order,
+    the migration migrate stops before and the ones it doesn't reach, then skipped migrations.
+    """
+    steps: list
+    # dependency graph of migrations to run
+    graph: dict
+
+    @property
+    def stop(self) -> Step:
+        """
+        Step migrate stops before or None.
+        """
+        return next((step for step in self.steps if step.action == STOP), None)
+
+
+def estimate_durations(runs, history: int = ESTIMATE_HISTORY) -> dict:
+    """
+    Estimate duration of migrations as median of their latest successful runs.
+
+    :param runs: iterable of store.RunRecord ordered by migration ID and start time.
+    :param history: amount of latest successful runs to take into account.
+
+    :return: dict where key is migration ID and value is duration in seconds.
+    """
+    durations = {}
+    for run in runs:
+        if run.exit_code == 0 and run.duration is not None:
+            durations.setdefault(run.migration_id, []).append(run.duration)
+    return {migration_id: stats.percentile(sorted(values[-history:]), 50) for migration_id, values in durations.items()}
+
+
+def build(migrations_dict: dict, migrations_directory_path: str, estimates: dict = None, stale: set = frozenset(),
+          migration_id: str = None, cluster: bool = False) -> Plan:
+    """
+    Plan migrate action. All migrations which are neither DONE, SKIP nor ABSENT are run respecting their
+    dependencies, migrate stops before the first MANUAL migration and before migration RUNNING in another process.
+    In :param cluster: mode migration RUNNING in another process is waited for instead, so processes sharing
+    migrations database split the work between them.
+    A single :param migration_id: is run whatever its status is, unless it is RUNNING in another process.
+
+    :param migrations_dict: migration statuses as returned by migration.get_statuses.
+    :param migrations_directory_path: path to migrations directory.
+    :param estimates: dict of estimated durations as returned by estimate_durations.
+    :param stale: IDs of RUNNING migrations abandoned by their processes, migrate reclaims them before running.
+    :param migration_id: plan running this migration only.
+    :param cluster: whether migrate waits for migrations RUNNING in other processes.
+
+    :raise PlanError: if dependencies are unknown or form a cycle.
+
+    :return: Plan.
+    """
+    estimates = estimates or {}
+
+    def status_of(some_id: str) -> str:
+        status = migrations_dict[some_id][0]
+        if status == migration.Status.RUNNING.name and some_id in stale:
+            return migration.Status.FAILED.name
+        return status
+
+    if migration_id is not None:
+        if migration_id in migrations_dict and status_of(migration_id) == migration.Status.RUNNING.name:
+            return Plan([Step(migration_id, STOP, 'RUNNING in another process')], {})
+        status = status_of(migration_id) if migration_id in migrations_dict else migration.Status.UNKNOWN.name
+        return Plan([Step(migration_id, RUN, status, estimates.get(migration_id), status)], {migration_id: set()})
+
+    skipped = []
+    to_run = set()
+    for some_id in sorted(migrations_dict):
+        if migrations_dict[some_id][1] == 'ABSENT':
+            skipped.append(Step(some_id, SKIP, 'ABSENT'))
+        elif status_of(some_id) in (migration.Status.DONE.name, migration.Status.SKIP.name):
+            skipped.append(Step(some_id, SKIP, status_of(some_id)))
+        else:
+            to_run.add(some_id)
+
+    graph = scheduler.build_graph(list(migrations_dict.keys()), migrations_directory_path)
+    unknown = sorted(dep for some_id in to_run for dep in graph[some_id] if dep not in graph)
+    if unknown:
+        raise PlanError('Unknown migrations in dependencies: {0}'.format(', '.join(unknown)))
+    graph = scheduler.prune_graph(graph, to_run)
+    try:
+        order = scheduler.topological_order(graph)
+    except scheduler.CycleError as e:
+        raise PlanError(str(e))
+
+    steps = []
+    stop = None
+    for some_id in order:
+        status = status_of(some_id)
+        if stop is not None:
+            steps.append(Step(some_id, BLOCKED, 'after {0}'.format(stop), estimates.get(some_id)))
+        elif status == migration.Status.MANUAL.name:
+            stop = some_id
+            steps.append(Step(some_id, STOP, status))
+        elif status == migration.Status.RUNNING.name and cluster:
+            steps.append(Step(some_id, RUN, 'RUNNING in another process, wait', estimates.get(some_id), status))
+        elif status == migration.Status.RUNNING.name:
+            stop = some_id
+            steps.append(Step(some_id, STOP, 'RUNNING in another process'))
+        else:
+            steps.append(Step(some_id, RUN, status, estimates.get(some_id), status))
+    # migrations before the stop are a prefix of topological order, so their dependencies are run as well
+    to_run = set(step.migration_id for step in steps if step.action == RUN)
+    return Plan(steps + skipped, scheduler.prune_graph(graph, to_run))
+
+
+def estimate_total(migration_plan: Plan, jobs: int = 1) -> float:
+    """
+    Estimate wall time of running :param migration_plan: on :param jobs: workers, dispatching migrations
+    the way scheduler.execute does. Migrations without estimate are counted as instant.
+
+    :return: seconds.
+    """
+    durations = {step.migration_id: step.estimate or 0.0 for step in migration_plan.steps if step.action == RUN}
+    remaining = {migration_id: len(deps) for migration_id, deps in migration_plan.graph.items()}
+    dependants = scheduler.get_dependants(migration_plan.graph)
+    ready = [migration_id for migration_id, count in remaining.items() if count == 0]
+    heapq.heapify(ready)
+    running = []
+    now = 0.0
+    while ready or running:
+        while ready and len(running) < max(jobs, 1):
+            migration_id = heapq.heappop(ready)
+            heapq.heappush(running, (now + durations[migration_id], migration_id))
+        now, migration_id = heapq.heappop(running)
+        for dependant in dependants[migration_id]:
+            remaining[dependant] -= 1
+            if remaining[dependant] == 0:
+                heapq.heappush(ready, dependant)
+    return now
+
+
+def load(config: dict, app_logger: logger.Logger) -> Plan:
+    """
+    Plan migrate action for current state of migrations database, see build. Duration estimates are based
+    on runs in current environment. If config['MIGRATION_ID'] is specified then running this migration only
+    is planned. config['CLUSTER'] enables cluster mode.
+
+    :param config: pymigrate configuration.
+    :param app_logger: instance of configured logger.
+
+    :raise PlanError: if dependencies are unknown or form a cycle.
+
+    :return: Plan.
+    """
+    migrations_directory_path = os.path.join(os.pardir, config['PROJECT_DIR'] + '/' + config['MIGRATIONS_DIR'])
+    migration_store = store.open_store(migrations_directory_path, app_logger)
+    estimates = estimate_durations(migration_store.iterate_runs(environment=config['ENVIRONMENT'],
+                                                                action=store.RUN_MIGRATE))
+    stale = set(run.migration_id for run in migration.find_stale_runs(migration_store, config))
+    migration_id = config['MIGRATION_ID'] if config.get('MIGRATION_ID', 'None') != 'None' else None
+    migrations_dict = migration.get_statuses(migrations_directory_path + '/' + store.DB_FILE, app_logger)
+    return build(migrations_dict, migrations_directory_path, estimates, stale, migration_id,
+                 config.get('CLUSTER', 'False') == 'True')
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
@@ -0,0 +1,155 @@
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import sys
+import time
+import threading
+from contextlib import contextmanager
+
+PHASE_COLUMNS = ('phase', 'calls', 'total', 'max')
+MIGRATION_COLUMNS = ('migration_id', 'seconds', 'exit_code')
+
+# profiler of current process, None unless enabled by runner --profile
+_active = None
+
+
+class Profiler:
+    """
+    Profiler collects wall time of named phases and of every migration run. Phases may be nested, so time of
+    outer phase includes time of inner ones. Optionally runner's own overhead is captured by cProfile, note that
+    cProfile sees the thread it was enabled in only.
+    """
+
+    def __init__(self, capture: bool = False):
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.total = None
+        self.phases = {}
+        self.migrations = []
+        self._lock = threading.Lock()
+        self._cprofile = None
+        if capture:
+            import cProfile
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def __repr__(self):
+        return '[ {0}: {1}, {2}: {3} ]'.format('phases', len(self.phases), 'migrations', len(self.migrations))
+
+    def add(self, name: str, seconds: float):
+        """
+        Account :param seconds: spent in phase :param name:.
+        """
+        with self._lock:
+            calls, total, longest = self.phases.get(name, (0, 0.0, 0.0))
+            self.phases[name] = (calls + 1, total + seconds, max(longest, seconds))
+
+    def add_migration(self, migration_id: str, seconds: float, exit_code: int):
+        """
+        Account single run of migration :param migration_id:.
+        """
+        with self._lock:
+            self.migrations.append((migration_id, seconds, exit_code))
+
+    def stop(self):
+        """
+        Stop cProfile capture and fix total wall time.
+        """
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        self.total = time.perf_counter() - self._started
+
+    def report(self, stream=None):
+        """
+        Write phase and migration timings as text tables to :param stream:, stderr by default.
+        """
+        import output
+        stream = stream or sys.stderr
+        total = self.total if self.total is not None else time.perf_counter() - self._started
+        stream.write('Profile, total {0:.3f}s:\n'.format(total))
+        rows = ((name, calls, '%.4f' % seconds, '%.4f' % longest)
+                for name, (calls, seconds, longest) in sorted(self.phases.items(), key=lambda item: -item[1][1]))
+        output.write_rows(PHASE_COLUMNS, rows, 'text', stream)
+        if self.migrations:
+            rows = ((migration_id, '%.4f' % seconds, exit_code)
+                    for migration_id, seconds, exit_code in sorted(self.migrations, key=lambda item: -item[1]))
+            output.write_rows(MIGRATION_COLUMNS, rows, 'text', stream)
+
+    def dump(self, prefix: str) -> list:
+        """
+        Write timings to :param prefix:.json and, if cProfile capture was enabled, cProfile stats to
+        :param prefix:.pstats to be loaded with pstats module.
+
+        :return: list of written file paths.
+        """
+        import json
+        res = [prefix + '.json']
+        with open(prefix + '.json', 'w') as f:
+            json.dump({'argv': sys.argv,
+                       'started_at': self.started_at,
+                       'total': self.total,
+                       'phases': [dict(zip(PHASE_COLUMNS, (name,) + values))
+                                  for name, values in sorted(self.phases.items())],
+                       'migrations': [dict(zip(MIGRATION_COLUMNS, values)) for values in self.migrations]}, f, indent=2)
+        if self._cprofile is not None:
+            self._cprofile.dump_stats(prefix + '.pstats')
+            res.append(prefix + '.pstats')
+        return res
+
+
+def enable(capture: bool = False) -> Profiler:
+    """
+    Start profiling of current process.
+
+    :param capture: also capture runner's own overhead with cProfile.
+
+    :return: active Profiler object.
+    """
+    global _active
+    _active = Profiler(capture)
+    return _active
+
+
+def disable() -> Profiler:
+    """
+    Stop profiling of current process.
+
+    :return: Profiler object which was active or None.
+    """
+    global _active
+    res, _active = _active, None
+    if res is not None:
+        res.stop()
+    return res
+
+
+@contextmanager
+def phase(name: str):
+    """
+    Time the block as phase :param name:. Does nothing unless profiling is enabled.
+    """
+    profiler = _active
+    if profiler is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.add(name, time.perf_counter() - started)
+
+
+def record_migration(migration_id: str, seconds: float, exit_code: int):
+    """
+    Account single run of migration script. Does nothing unless profiling is enabled.
+    """
+    profiler = _active
+    if profiler is not None:
+        profiler.add_migration(migration_id, seconds, exit_code)
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
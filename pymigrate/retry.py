@@ -0,0 +1,118 @@
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import sys
+import os
+import random
+import executor
+from typing import NamedTuple
+
+# file in migration directory with key=value lines overriding retry settings of pymigrate.conf for this migration
+RETRY_FILE = 'retry'
+# retry file keys and pymigrate.conf settings they override
+CONFIG_KEYS = {'max_attempts': 'RETRY_MAX_ATTEMPTS',
+               'backoff': 'RETRY_BACKOFF',
+               'max_backoff': 'RETRY_MAX_BACKOFF',
+               'jitter': 'RETRY_JITTER',
+               'retry_on': 'RETRY_ON'}
+
+
+class RetryPolicy(NamedTuple):
+    """
+    How failed migration is run again. Delay before attempt N + 1 is backoff * 2 ^ (N - 1) seconds capped by
+    max_backoff, randomly shortened by up to jitter fraction of it, so migrations failed on the same lock don't
+    retry in lockstep. The default policy makes a single attempt.
+    """
+    max_attempts: int = 1
+    backoff: float = 1.0
+    max_backoff: float = 60.0
+    jitter: float = 0.5
+    # exit codes worth another attempt, empty means any non-zero exit code
+    retry_on: frozenset = frozenset()
+
+    def should_retry(self, attempt: int, exit_code: int) -> bool:
+        """
+        Decide whether migration which exited with :param exit_code: on attempt :param attempt: is run again.
+        Migrations interrupted by SIGINT or SIGTERM are never retried.
+        """
+        return (attempt < self.max_attempts and exit_code != 0 and exit_code != executor.INTERRUPTED_EXIT_CODE and
+                (not self.retry_on or exit_code in self.retry_on))
+
+    def delay(self, attempt: int, rand=random.random) -> float:
+        """
+        Compute seconds to wait after failed attempt :param attempt:.
+
+        :param attempt: number of failed attempt starting from 1.
+        :param rand: callable returning random float in [0, 1).
+        """
+        return min(self.max_backoff, self.backoff * 2 ** (attempt - 1)) * (1 - self.jitter * rand())
+
+
+def parse(settings: dict, policy: RetryPolicy = RetryPolicy()) -> RetryPolicy:
+    """
+    Override fields of :param policy: with string :param settings:.
+
+    :param settings: dict where key is one of CONFIG_KEYS and value is its string representation,
+    retry_on is a comma-separated list of exit codes.
+    :param policy: policy to take the rest of fields from.
+
+    :raise ValueError: if key is unknown or value is invalid.
+
+    :return: RetryPolicy.
+    """
+    values = {}
+    for key, value in settings.items():
+        if key not in CONFIG_KEYS:
+            raise ValueError('unknown retry setting: {0}'.format(key))
+        if key == 'retry_on':
+            values[key] = frozenset(int(code) for code in value.split(',') if code.strip())
+        elif key == 'max_attempts':
+            values[key] = int(value)
+        else:
+            values[key] = float(value)
+    policy = policy._replace(**values)
+    if policy.max_attempts < 1 or policy.backoff < 0 or policy.max_backoff < 0 or not 0 <= policy.jitter <= 1:
+        raise ValueError('invalid retry policy: {0}'.format(policy))
+    return policy
+
+
+def read_retry_file(migration_dir: str) -> dict:
+    """
+    Read RETRY_FILE of migration located at :param migration_dir:. Empty lines and lines starting with '#'
+    are ignored.
+
+    :return: dict of settings, empty if there is no RETRY_FILE.
+    """
+    retry_file = os.path.join(migration_dir, RETRY_FILE)
+    settings = {}
+    if os.path.isfile(retry_file):
+        with open(retry_file, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    key, value = line.split('=', 1)
+                    settings[key.strip()] = value.strip()
+    return settings
+
+
+def load(migration_dir: str, config: dict) -> RetryPolicy:
+    """
+    Build retry policy of migration located at :param migration_dir: from pymigrate configuration
+    overridden by migration's RETRY_FILE.
+
+    :param migration_dir: path to migration directory.
+    :param config: pymigrate configuration.
+
+    :raise ValueError: if some setting is invalid.
+
+    :return: RetryPolicy.
+    """
+    policy = parse({key: config[config_key] for key, config_key in CONFIG_KEYS.items() if config_key in config})
+    return parse(read_retry_file(migration_dir), policy)
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
@@ -0,0 +1,166 @@
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import sys
+import os
+import time
+import logger
+import util
+import store
+import workers
+import profiling
+import migration
+import scheduler
+from typing import NamedTuple
+
+# name pattern of rollback executable within migration directory
+ROLLBACK_EXECUTABLE = 'rollback*'
+COLUMNS = ('order', 'migration_id', 'status', 'action', 'script')
+
+# what rollback does with a migration
+ROLLBACK = 'rollback'
+STOP = 'stop'
+BLOCKED = 'blocked'
+
+
+class Step(NamedTuple):
+    migration_id: str
+    status: str
+    # path to rollback executable, None if migration has none
+    script: str = None
+
+
+def find_script(migration_dir: str) -> str:
+    """
+    Find rollback executable of migration located at :param migration_dir:. Only files directly
+    in migration directory are considered, rollback.py unit (see workers.ROLLBACK_UNIT_FILE) is preferred,
+    otherwise the first one in sorted order is taken.
+
+    :return: path to rollback executable or None.
+    """
+    unit = workers.find_unit(migration_dir, workers.ROLLBACK_UNIT_FILE, workers.ROLLBACK_ENTRY_POINT)
+    if unit is not None:
+        return unit
+    scripts = sorted(path for path in util.find_files(ROLLBACK_EXECUTABLE, migration_dir, True)
+                     if os.path.dirname(path) == migration_dir.rstrip('/'))
+    return scripts[0] if scripts else None
+
+
+def select(migrations_dict: dict, migrations_directory_path: str, last: int = 0, to: str = None,
+           migration_id: str = None) -> list:
+    """
+    Select migrations to roll back in order they must be rolled back in, i.e. reversed order migrate runs them in.
+    Ranges include DONE migrations only, a single :param migration_id: is rolled back whatever its status is
+    unless it is RUNNING.
+
+    :param migrations_dict: migration statuses as returned by migration.get_statuses.
+    :param migrations_directory_path: path to migrations directory.
+    :param last: select this many latest DONE migrations.
+    :param to: select DONE migrations following this one, the migration itself is kept.
+    :param migration_id: select this migration only.
+
+    :raise ValueError: if range is not specified or refers to unknown or RUNNING migration.
+
+    :return: list of Step.
+    """
+    for some_id in (migration_id, to):
+        if some_id is not None and some_id not in migrations_dict:
+            raise ValueError('Migration not found: {0}'.format(some_id))
+    if migration_id is not None:
+        if migrations_dict[migration_id][0] == migration.Status.RUNNING.name:
+            raise ValueError('Migration {0} is {1}'.format(migration_id, migration.Status.RUNNING.name))
+        selected = [migration_id]
+    elif last > 0 or to is not None:
+        graph = scheduler.build_graph(list(migrations_dict.keys()), migrations_directory_path)
+        try:
+            order = scheduler.topological_order(scheduler.prune_graph(graph, set(migrations_dict)))
+        except scheduler.CycleError as e:
+            raise ValueError(str(e))
+        if to is not None:
+            order = order[order.index(to) + 1:]
+        selected = [some_id for some_id in order
+                    if migrations_dict[some_id][0] == migration.Status.DONE.name and
+                    migrations_dict[some_id][1] != 'ABSENT']
+        if last > 0:
+            selected = selected[-last:]
+    else:
+        raise ValueError('Specify migration to roll back with --migration-id, --last or --to')
+
+    return [Step(some_id, migrations_dict[some_id][0], find_script(os.path.join(migrations_directory_path, some_id)))
+            for some_id in reversed(selected)]
+
+
+def describe(steps: list):
+    """
+    Describe what run would do with :param steps: without running anything.
+
+    :return: generator of tuples with values for COLUMNS, order and script are None where not applicable.
+    """
+    stop = None
+    for order, step in enumerate(steps, 1):
+        if stop is not None:
+            yield order, step.migration_id, step.status, BLOCKED, None
+        elif step.script is None:
+            stop = step.migration_id
+            yield order, step.migration_id, step.status, STOP, None
+        else:
+            yield order, step.migration_id, step.status, ROLLBACK, os.path.basename(step.script)
+
+
+def run(steps: list, config: dict, app_logger: logger.Logger) -> bool:
+    """
+    Run rollback executables of :param steps: one by one the way migrate runs migrate executables, see
+    migration.run_migration: migration is claimed for the duration of its rollback, the run is recorded in runs
+    history and its output is saved to compressed log. Rolled back migration is set to PENDING, so migrate
+    runs it again, migration whose rollback failed is set to FAILED. Execution stops before the first migration
+    without rollback executable, after the first failure and once config['RUN_TIMEOUT'] is reached.
+    Rollback executables get the same time limits as migrate executables, see migration.read_timeout.
+
+    :param steps: list of Step as returned by select.
+    :param config: pymigrate configuration.
+    :param app_logger: instance of configured logger.
+
+    :return: True if all steps were rolled back, False otherwise.
+    """
+    migrations_directory_path = os.path.join(os.pardir, config['PROJECT_DIR'] + '/' + config['MIGRATIONS_DIR'])
+    deadline = migration.run_deadline(config)
+    total = 0.0
+    for step in steps:
+        if step.script is None:
+            print('Migration {0} has no rollback executable, stopping'.format(step.migration_id))
+            return False
+        timeout = migration.read_timeout(os.path.join(migrations_directory_path, step.migration_id))
+        if timeout is None:
+            timeout = float(config.get('MIGRATION_TIMEOUT', '0'))
+        if migration.time_limit(timeout, deadline) < 0:
+            print('Run timeout reached before migration {0}, stopping'.format(step.migration_id))
+            return False
+
+        print('Rolling back migration {0}'.format(step.migration_id))
+        sys.stdout.flush()
+        app_logger.log_with_ts('Running {0}', logger.Levels.DEBUG, step.script)
+        started = time.monotonic()
+        with profiling.phase('rollback.script'):
+            res = migration.run_migration(step.migration_id, config, app_logger, deadline, step.status, step.script)
+        duration = time.monotonic() - started
+        total += duration
+        if res is None:
+            print('Migration {0} is {1} in another process, stopping'.format(step.migration_id,
+                                                                          migration.Status.RUNNING.name))
+            return False
+        if not res:
+            record = store.open_store(migrations_directory_path, app_logger).get(step.migration_id)
+            print('Migration {0}: rollback failed after {1:.3f}s, {2}'.format(
+                step.migration_id, duration, record.status if record else migration.Status.UNKNOWN.name))
+            return False
+        print('Migration {0}: rolled back in {1:.3f}s, {2}'.format(step.migration_id, duration,
+                                                                   migration.Status.PENDING.name))
+    print('Rolled back {0} migrations in {1:.3f}s'.format(len(steps), total))
+    return True
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
@@ -0,0 +1,111 @@
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import sys
+import os
+import time
+import gzip
+from collections import deque
+
+# directory within migrations directory keeping output of migration runs, one subdirectory per migration
+LOG_DIR = '.logs'
+# how many logs of every migration are kept, may be overridden by LOG_KEEP_RUNS, 0 disables logs
+KEEP_RUNS = 10
+# logs older than this many days are removed, may be overridden by LOG_RETENTION_DAYS, 0 means no age limit
+RETENTION_DAYS = 30
+# amount of last output lines kept in memory for failure summary, may be overridden by LOG_TAIL_LINES
+TAIL_LINES = 20
+# longer lines are truncated in the tail, so its memory footprint stays bounded however migration writes
+TAIL_LINE_BYTES = 1024
+# compressed output is written in blocks of this size
+BUFFER_SIZE = 65536
+
+
+def log_path(migrations_directory_path: str, migration_id: str, run_id: int) -> str:
+    """
+    Return path of output log of run :param run_id: of migration :param migration_id:.
+    """
+    return os.path.join(migrations_directory_path, LOG_DIR, migration_id, '{0:08d}.log.gz'.format(run_id))
+
+
+class RunLog:
+    """
+    Output of a single migration run compressed to gzip file as it is produced. Only a short tail of output
+    is kept in memory.
+    """
+
+    def __init__(self, path: str = None, tail_lines: int = TAIL_LINES):
+        """
+        :param path: path of gzip file to write, output is not written anywhere if None.
+        :param tail_lines: amount of last lines to keep in memory.
+        """
+        self.path = path
+        self.tail = deque(maxlen=tail_lines)
+        self._buffer = bytearray()
+        self._file = None
+        if path:
+            os.makedirs(os.path.dirname(path), 0o775, exist_ok=True)
+            self._file = gzip.open(path, 'wb')
+
+    def write(self, line: bytes):
+        """
+        Append a line of output, see executor.run_streaming for sink interface.
+        """
+        self.tail.append(line if len(line) <= TAIL_LINE_BYTES else line[:TAIL_LINE_BYTES] + b'...\n')
+        if self._file is not None:
+            self._buffer += line
+            if len(self._buffer) >= BUFFER_SIZE:
+                self._file.write(self._buffer)
+                self._buffer.clear()
+
+    def close(self):
+        if self._file is not None:
+            self._file.write(self._buffer)
+            self._buffer.clear()
+            self._file.close()
+            self._file = None
+
+
+def tee(*sinks):
+    """
+    Combine :param sinks: into a single sink passing every line to each of them.
+    """
+    def write(line: bytes):
+        for sink in sinks:
+            sink(line)
+
+    return write
+
+
+def prune(migration_log_dir: str, keep: int = KEEP_RUNS, retention_days: float = RETENTION_DAYS) -> list:
+    """
+    Remove all but :param keep: latest logs of a migration and logs older than :param retention_days:.
+
+    :param migration_log_dir: directory with logs of single migration.
+    :param keep: amount of latest logs to keep.
+    :param retention_days: maximum age of logs in days, 0 means no age limit.
+
+    :return: list of removed paths.
+    """
+    if not os.path.isdir(migration_log_dir):
+        return []
+    # file names are zero-padded run IDs, so they sort in order runs were started
+    names = sorted((name for name in os.listdir(migration_log_dir) if name.endswith('.log.gz')), reverse=True)
+    expired_before = time.time() - retention_days * 86400 if retention_days > 0 else None
+    removed = []
+    for i, name in enumerate(names):
+        path = os.path.join(migration_log_dir, name)
+        try:
+            if i >= keep or (expired_before is not None and os.stat(path).st_mtime < expired_before):
+                os.remove(path)
+                removed.append(path)
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
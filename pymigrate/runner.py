@@ -5,12 +5,20 @@ __email__ = 'makcimkos@gmail.com'
 
 import os
 import sys
-import traceback
 import time
+import signal
 from argparse import ArgumentParser
 import util
-import cli_commands
+import commands
 import logger
+import output
+import profiling
+
+# seconds between background flushes of log file buffer
+LOG_FLUSH_INTERVAL = 1.0
+
+# signal pymigrate was interrupted by, it exits with 128 + signal number as shells report it
+_interrupted_by = signal.SIGINT
 
 
 def main() -> int:
@@ -22,17 +30,36 @@ def main() -> int:
     # TODO: add meaningful description
     parser = ArgumentParser(description="""\r
         ***YOUR_HELP_MESSAGE_HERE***.\r
-    """)
+    """,
+                            epilog='actions: ' + '; '.join('{0} - {1}'.format(command.name, command.help)
+                                                           for command in commands.COMMANDS))
     parser.add_argument('--do',
                         dest='do',
-                        choices=["%s" % action for action in util.get_available_actions()],
+                        choices=commands.names(),
                         help='Specify action.',
                         required=True)
     parser.add_argument('--environment',
                         '-e',
                         dest='environment',
-                        help='Specify environment. Default: dev',
+                        help='Specify environment or comma-separated list of environments to run migrate or status '
+                             'for concurrently. Default: dev',
                         default='dev')
+    parser.add_argument('--env-jobs',
+                        dest='env_jobs',
+                        type=int,
+                        help='Specify how many environments may be processed concurrently. Default: 4',
+                        default=4)
+    parser.add_argument('--state-per-environment',
+                        dest='state_per_environment',
+                        action='store_true',
+                        help='Keep migrations state in a separate database file for every environment. '
+                             'Such file is used automatically once it exists.',
+                        default=False)
+    parser.add_argument('--no-daemon',
+                        dest='no_daemon',
+                        action='store_true',
+                        help='Run action in this process even if pymigrate daemon (see serve action) is running.',
+                        default=False)
     parser.add_argument('--project-dir',
                         '-d',
                         dest='project_dir',
@@ -43,32 +70,205 @@ def main() -> int:
                         dest='migration_id',
                         help='Specify migration ID to work with.',
                         default=None)
+    parser.add_argument('--jobs',
+                        '-j',
+                        dest='jobs',
+                        type=int,
+                        help='Specify how many migrations may run concurrently. Default: 1',
+                        default=1)
+    parser.add_argument('--cluster',
+                        dest='cluster',
+                        action='store_true',
+                        help='Share work of migrate with pymigrate processes on other hosts using the same '
+                             'migrations database: wait for migrations they run instead of stopping.',
+                        default=False)
+    parser.add_argument('--timeout',
+                        dest='timeout',
+                        type=float,
+                        help='Cancel migration which runs longer than this many seconds. Overrides MIGRATION_TIMEOUT, '
+                             'migration may set its own limit in timeout file. Default: no limit',
+                        default=None)
+    parser.add_argument('--run-timeout',
+                        dest='run_timeout',
+                        type=float,
+                        help='Stop migrate action after this many seconds, cancelling running migrations. '
+                             'Overrides RUN_TIMEOUT. Default: no limit',
+                        default=None)
+    parser.add_argument('--last',
+                        dest='rollback_last',
+                        type=int,
+                        help='Roll back this many latest DONE migrations.',
+                        default=None)
+    parser.add_argument('--to',
+                        dest='rollback_to',
+                        help='Roll back DONE migrations following given migration ID.',
+                        default=None)
+    parser.add_argument('--dry-run',
+                        dest='dry_run',
+                        action='store_true',
+                        help='Show what rollback or squash would do without changing anything.',
+                        default=False)
+    parser.add_argument('--format',
+                        dest='output_format',
+                        choices=output.FORMATS,
+                        help='Specify output format of status. Default: text',
+                        default='text')
+    parser.add_argument('--status',
+                        dest='status_filter',
+                        help='Show only migrations with given comma-separated statuses.',
+                        default=None)
+    parser.add_argument('--since',
+                        dest='since',
+                        help='Show only migrations created since given unix timestamp or date (YYYY-MM-DD).',
+                        default=None)
+    parser.add_argument('--limit',
+                        dest='limit',
+                        type=int,
+                        help='Show at most this many migrations. Default: no limit',
+                        default=0)
+    parser.add_argument('--offset',
+                        dest='offset',
+                        type=int,
+                        help='Skip this many migrations. Default: 0',
+                        default=0)
+    parser.add_argument('--profile',
+                        dest='profile',
+                        nargs='?',
+                        const='phases',
+                        choices=('phases', 'cprofile'),
+                        help='Time every phase and migration and print summary to stderr at exit. '
+                             'With cprofile also capture pymigrate own overhead with cProfile.',
+                        default=None)
+    parser.add_argument('--profile-dump',
+                        dest='profile_dump',
+                        help='Write profile to PROFILE_DUMP.json and PROFILE_DUMP.pstats. '
+                             'Default: pymigrate-profile-UNIXTIMESTAMP',
+                        default=None)
     parser.add_argument('--log-level',
                         dest='log_level',
                         choices=["%s" % level for level in logger.Levels.__members__.keys()],
                         help='Specify logging level',
                         default='DEBUG')
+    parser.add_argument('--log-file',
+                        dest='log_file',
+                        help='Append log messages to this file instead of stderr.',
+                        default=None)
+    parser.add_argument('--log-format',
+                        dest='log_format',
+                        choices=logger.FORMATS,
+                        help='Specify log messages format, json writes one JSON object per line. Default: text',
+                        default='text')
 
     args = parser.parse_args()
     # TODO: I have no idea at this point about best practices of adding logging to python application
-    app_logger = logger.Logger(level=logger.Levels[args.log_level])
+    app_logger = logger.Logger(args.log_file,
+                               level=logger.Levels[args.log_level],
+                               fmt=args.log_format,
+                               flush_interval=LOG_FLUSH_INTERVAL)
+    if args.profile:
+        profiling.enable(capture=args.profile == 'cprofile')
+    # handle SIGTERM as SIGINT, so migration scripts being run are cancelled and their runs are recorded
+    signal.signal(signal.SIGTERM, terminate)
+    try:
+        return run(args, app_logger)
+    finally:
+        profiler = profiling.disable()
+        if profiler is not None:
+            profiler.report()
+            for path in profiler.dump(args.profile_dump or 'pymigrate-profile-{0}'.format(int(profiler.started_at))):
+                sys.stderr.write('Profile written to {0}\n'.format(path))
+        app_logger.close()
+
+
+def terminate(signum, frame):
+    global _interrupted_by
+    _interrupted_by = signum
+    raise KeyboardInterrupt
+
+
+def run(args, app_logger: logger.Logger) -> int:
+    """
+    Build configuration from parsed command line :param args: and run requested action.
+
+    :return : 0 on success, 1 otherwise
+    """
+    try:
+        environments = util.parse_environments(args.environment)
+    except ValueError as e:
+        app_logger.log_with_ts(str(e), logger.Levels.ERROR)
+        return 1
+    if len(environments) > 1:
+        import fanout
+        if args.do not in fanout.ACTIONS:
+            app_logger.log_with_ts('Action {0} can be run for a single environment only', logger.Levels.ERROR,
+                                   args.do)
+            return 1
+        fmt = args.output_format if args.do in fanout.DOCUMENT_ACTIONS else 'text'
+        return 0 if fanout.fan_out(environments, sys.argv[1:], args.env_jobs, app_logger, fmt=fmt) else 1
+
     os_env = os.environ
     # TODO: will be great to have immutable config
-    config = util.load_config(os.path.join(os.pardir, args.project_dir + '/pymigrate.conf'), app_logger)
+    with profiling.phase('config'):
+        config = util.load_config(os.path.join(os.pardir, args.project_dir + '/pymigrate.conf'), app_logger)
     # Note that config dict should't have any values of None type
     config['MIGRATION_ID'] = str(args.migration_id) if args.migration_id else 'None'
-    config['ENVIRONMENT'] = str(args.environment)
+    config['ENVIRONMENT'] = environments[0]
+    config['JOBS'] = str(args.jobs)
+    config['OUTPUT_FORMAT'] = str(args.output_format)
+    config['STATUS_FILTER'] = str(args.status_filter) if args.status_filter else 'None'
+    config['SINCE'] = str(args.since) if args.since else 'None'
+    config['LIMIT'] = str(args.limit)
+    config['OFFSET'] = str(args.offset)
+    if args.timeout is not None:
+        config['MIGRATION_TIMEOUT'] = str(args.timeout)
+    if args.run_timeout is not None:
+        config['RUN_TIMEOUT'] = str(args.run_timeout)
+    if args.rollback_last is not None:
+        config['ROLLBACK_LAST'] = str(args.rollback_last)
+    if args.rollback_to is not None:
+        config['ROLLBACK_TO'] = str(args.rollback_to)
+    config['DRY_RUN'] = str(args.dry_run)
+    config['CLUSTER'] = str(args.cluster)
     config['PROJECT_DIR'] = os.path.abspath(args.project_dir)
     if 'MIGRATIONS_DIR' not in config:
         config['MIGRATIONS_DIR'] = args.project_dir + 'migrations'
 
+    migrations_directory_path = os.path.join(os.pardir, config['PROJECT_DIR'] + '/' + config['MIGRATIONS_DIR'])
+    import store
+    if config.get('STATE_BACKEND', 'sqlite') != 'sqlite':
+        try:
+            store.use_backend(config['STATE_BACKEND'])
+        except ValueError as e:
+            app_logger.log_with_ts(str(e), logger.Levels.ERROR)
+            return 1
+    if args.state_per_environment or store.has_environment_state(migrations_directory_path, config['ENVIRONMENT']):
+        db_file = store.environment_db_file(config['ENVIRONMENT'])
+        # environment gets its own state for the first time, it starts with what was run in the shared one
+        if store.seed(migrations_directory_path, db_file):
+            app_logger.log_with_ts('State of environment {0} is initialized from {1}', logger.Levels.INFO,
+                                   config['ENVIRONMENT'], store.file_name(store.DB_FILE))
+        store.use_db_file(db_file)
+    # daemon serves requests for the state it keeps only, see daemon.PINNED_KEYS
+    config['STATE_BACKEND'] = store.STATE_BACKEND
+    config['STATE_DB_FILE'] = store.DB_FILE
+
     final_config = os_env.copy()
     final_config.update(config)
 
-    # app_logger.log_plain('Starting with env:\n{0}'.format(util.get_formatted_env_vars()), logger.Levels.DEBUG)
-    # app_logger.log_plain('Got config:\n{0}'.format(str(config)), logger.Levels.DEBUG)
+    # app_logger.log_plain('Starting with env:\n{0}', logger.Levels.DEBUG, util.get_formatted_env_vars())
+    # app_logger.log_plain('Got config:\n{0}', logger.Levels.DEBUG, config)
+
+    if not args.no_daemon:
+        import daemon
+        if args.do in daemon.ACTIONS:
+            res = daemon.request(daemon.socket_path(config['PROJECT_DIR'], config['ENVIRONMENT']), args.do,
+                                 final_config, app_logger=app_logger)
+            if res is not None:
+                app_logger.log_with_ts('Action {0} was run by daemon', logger.Levels.DEBUG, args.do)
+                return 0 if res else 1
 
-    res = getattr(cli_commands, args.do)(final_config, app_logger)
+    with profiling.phase('action.' + args.do):
+        res = commands.get(args.do)(final_config, app_logger)
 
     return 0 if res else 1
 
@@ -77,10 +277,11 @@ if __name__ == '__main__':
     try:
         sys.exit(main())
     except KeyboardInterrupt:
-        print('Got SIGINT, terminating')
+        print('Got {0}, terminating'.format(signal.Signals(_interrupted_by).name))
         time.sleep(0.2)
-        sys.exit(0)
+        sys.exit(128 + _interrupted_by)
     except Exception:
+        import traceback
         print('Something went wrong, see traceback below')
         traceback.print_exc()
         sys.exit(1)
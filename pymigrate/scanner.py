@@ -0,0 +1,78 @@
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import sys
+import os
+import time
+import fnmatch
+import store
+
+# Directory modified that recently before the scan may get another change within the same mtime tick,
+# which would go unnoticed. Such directories are examined again on the next scan.
+RACY_WINDOW_NS = 2 * 1000000000
+
+
+def examine(migration_dir: str) -> tuple:
+    """
+    Walk migration directory and detect files pymigrate cares about.
+
+    :param migration_dir: path to migration directory.
+
+    :return: tuple of paths relative to :param migration_dir: of first readme* (case-insensitive), migrate* and
+    rollback* files found ('' if there is none) and 1 if directory has subdirectories, 0 otherwise.
+    """
+    readme = migrate = rollback = ''
+    nested = 0
+    for root, dirs, files in os.walk(migration_dir):
+        if dirs:
+            nested = 1
+        for name in sorted(files):
+            path = os.path.relpath(os.path.join(root, name), migration_dir)
+            if not readme and fnmatch.fnmatchcase(name.lower(), 'readme*'):
+                readme = path
+            if not migrate and fnmatch.fnmatchcase(name, 'migrate*'):
+                migrate = path
+            if not rollback and fnmatch.fnmatchcase(name, 'rollback*'):
+                rollback = path
+    return readme, migrate, rollback, nested
+
+
+def scan(migrations_directory_path: str, migration_store: store.MigrationStore) -> dict:
+    """
+    List migrations found on disk together with files detected in them. Results are cached in migrations
+    database and a directory is examined again only if its mtime or inode changed. Since directory mtime
+    does not change when nested directories do, directories with subdirectories are examined every time.
+    Hidden directories are skipped as in migration.scan_migrations_dir.
+
+    :param migrations_directory_path: path to migrations directory.
+    :param migration_store: store of migrations database located in :param migrations_directory_path:.
+
+    :return: dict where key is migration ID and value is store.ScanRecord.
+    """
+    cached = migration_store.get_scans()
+    racy_after = int(time.time() * 1000000000) - RACY_WINDOW_NS
+    res = {}
+    changed = []
+    with os.scandir(migrations_directory_path) as entries:
+        for entry in entries:
+            if entry.name.startswith('.') or not entry.is_dir():
+                continue
+            st = entry.stat()
+            record = cached.get(entry.name)
+            if record is None or record.nested or record.mtime_ns != st.st_mtime_ns or record.inode != st.st_ino:
+                mtime_ns = st.st_mtime_ns if st.st_mtime_ns < racy_after else 0
+                record = store.ScanRecord(entry.name, mtime_ns, st.st_ino, *examine(entry.path))
+                if record != cached.get(entry.name):
+                    changed.append(record)
+            res[entry.name] = record
+    removed = set(cached).difference(res)
+    if changed or removed:
+        migration_store.save_scans(changed, removed)
+    return res
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
@@ -0,0 +1,292 @@
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import sys
+import os
+import time
+import heapq
+import logger
+import executor
+import migration
+import lease
+import baseline
+import workers
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from concurrent.futures import FIRST_COMPLETED
+
+DEPENDS_ON_FILE = 'depends_on'
+
+
+class CycleError(Exception):
+    """
+    Raised when declared migration dependencies form a cycle.
+    """
+    pass
+
+
+def read_dependencies(migration_dir: str) -> list:
+    """
+    Read migration IDs listed in depends_on file of migration located at :param migration_dir:.
+    Each line holds one migration ID, empty lines and lines starting with '#' are ignored.
+
+    :param migration_dir: path to migration directory.
+
+    :return: list of migration IDs or None if depends_on file does not exist.
+    """
+    depends_on = os.path.join(migration_dir, DEPENDS_ON_FILE)
+    if not os.path.isfile(depends_on):
+        return None
+    with open(depends_on, 'r') as f:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
+
+
+def build_graph(migration_ids: list, migrations_directory_path: str) -> dict:
+    """
+    Build dependency graph for migrations. Migration without depends_on file depends on the previous
+    migration in sorted order, so default execution order stays the same as in sequential mode.
+    Empty depends_on file means migration has no dependencies at all. Dependencies on migrations squashed into
+    the baseline are dependencies on the baseline.
+
+    :param migration_ids: IDs of all known migrations.
+    :param migrations_directory_path: absolute path to migrations directory.
+
+    :return: dict where key is migration ID and value is a set of IDs it depends on.
+    """
+    graph = {}
+    previous = None
+    manifest = baseline.load(migrations_directory_path) if baseline.BASELINE_ID in migration_ids else None
+    squashed = manifest.ids if manifest else set()
+    for migration_id in sorted(migration_ids):
+        declared = read_dependencies(os.path.join(migrations_directory_path, migration_id))
+        if declared is None:
+            graph[migration_id] = {previous} if previous else set()
+        else:
+            graph[migration_id] = set(baseline.BASELINE_ID if dep in squashed else dep for dep in declared)
+        previous = migration_id
+    return graph
+
+
+def prune_graph(graph: dict, to_run: set) -> dict:
+    """
+    Leave only migrations from :param to_run: in graph and drop dependencies which are already satisfied,
+    i.e. dependencies which are not going to be run.
+
+    :param graph: dependency graph as returned by build_graph.
+    :param to_run: IDs of migrations which are going to be run.
+
+    :return: dependency graph restricted to :param to_run:.
+    """
+    return {migration_id: set(dep for dep in deps if dep in to_run)
+            for migration_id, deps in graph.items() if migration_id in to_run}
+
+
+def topological_order(graph: dict) -> list:
+    """
+    Order migrations so each one follows its dependencies, picking ready migrations in sorted order.
+    This is the order execute dispatches migrations in when run on a single worker.
+
+    :param graph: dependency graph.
+
+    :raise CycleError: if some migrations depend on each other.
+
+    :return: list of migration IDs.
+    """
+    remaining = {migration_id: len(deps) for migration_id, deps in graph.items()}
+    dependants = get_dependants(graph)
+    ready = [migration_id for migration_id, count in remaining.items() if count == 0]
+    heapq.heapify(ready)
+    order = []
+    while ready:
+        migration_id = heapq.heappop(ready)
+        del remaining[migration_id]
+        order.append(migration_id)
+        for dependant in dependants[migration_id]:
+            remaining[dependant] -= 1
+            if remaining[dependant] == 0:
+                heapq.heappush(ready, dependant)
+    if remaining:
+        raise CycleError('Dependency cycle between migrations: {0}'.format(', '.join(sorted(remaining))))
+    return order
+
+
+def check_acyclic(graph: dict):
+    """
+    Make sure there are no cycles in dependency graph.
+
+    :param graph: dependency graph.
+
+    :raise CycleError: if some migrations depend on each other.
+    """
+    topological_order(graph)
+
+
+def get_dependants(graph: dict) -> dict:
+    """
+    Invert dependency graph.
+
+    :param graph: dependency graph.
+
+    :return: dict where key is migration ID and value is a list of migration IDs depending on it.
+    """
+    dependants = {migration_id: [] for migration_id in graph}
+    for migration_id, deps in graph.items():
+        for dep in deps:
+            dependants[dep].append(migration_id)
+    return dependants
+
+
+def execute(graph: dict, jobs: int, run_one, stop_before, app_logger: logger.Logger,
+            grace: float = executor.KILL_GRACE, retry_interval: float = lease.CLAIM_RETRY_INTERVAL) -> bool:
+    """
+    Run migrations from dependency graph on a pool of :param jobs: workers. Ready migrations are dispatched
+    in sorted order. After the first failure (or before a migration for which :param stop_before: returns True)
+    no new migrations are dispatched, but the ones already running are waited for. If waiting is interrupted
+    (SIGINT), commands started by running migrations are cancelled, so workers finish quickly.
+    Migration which can't be run yet since it is RUNNING in another process is dispatched again after
+    :param retry_interval: seconds, other ready migrations are run meanwhile.
+
+    :param graph: dependency graph restricted to migrations which should be run.
+    :param jobs: maximum amount of migrations running at the same time.
+    :param run_one: callable taking migration ID and returning True on success, False otherwise, or None if
+    the migration should be dispatched again later.
+    :param stop_before: callable taking migration ID and returning True if execution must stop before it.
+    :param app_logger: instance of configured logger.
+    :param grace: seconds cancelled commands have to exit after SIGTERM before they get SIGKILL.
+    :param retry_interval: seconds before migration for which :param run_one: returned None is dispatched again.
+
+    :return: True if all migrations were run successfully, False otherwise.
+    """
+    check_acyclic(graph)
+    remaining = {migration_id: len(deps) for migration_id, deps in graph.items()}
+    dependants = get_dependants(graph)
+    ready = [migration_id for migration_id, count in remaining.items() if count == 0]
+    heapq.heapify(ready)
+    # migrations to dispatch again at retry_at
+    deferred = []
+    retry_at = None
+    stopped = False
+    res = True
+
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as pool:
+        running = {}
+        while running or ((ready or deferred) and not stopped):
+            while ready and not stopped and len(running) < max(jobs, 1):
+                migration_id = heapq.heappop(ready)
+                if stop_before(migration_id):
+                    stopped = True
+                    res = False
+                    break
+                app_logger.log_with_ts('Dispatching migration {0}', logger.Levels.DEBUG, migration_id)
+                running[pool.submit(run_one, migration_id)] = migration_id
+
+            if stopped and not running:
+                break
+            try:
+                if running:
+                    timeout = max(retry_at - time.monotonic(), 0) if deferred else None
+                    done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                else:
+                    done = ()
+                    time.sleep(max(retry_at - time.monotonic(), 0))
+            except KeyboardInterrupt:
+                app_logger.log_with_ts('Interrupted, cancelling running migrations', logger.Levels.WARNING)
+                executor.cancel_all(grace)
+                raise
+            for future in done:
+                migration_id = running.pop(future)
+                try:
+                    succeeded = future.result()
+                except Exception as e:
+                    app_logger.log_with_ts('Migration {0} raised: {1}', logger.Levels.ERROR, migration_id, e)
+                    succeeded = False
+                if succeeded is None:
+                    if not deferred:
+                        retry_at = time.monotonic() + retry_interval
+                    deferred.append(migration_id)
+                    continue
+                if not succeeded:
+                    if not stopped:
+                        app_logger.log_with_ts('Migration {0} failed, waiting for running migrations to finish',
+                                               logger.Levels.DEBUG, migration_id)
+                    stopped = True
+                    res = False
+                    continue
+                for dependant in dependants[migration_id]:
+                    remaining[dependant] -= 1
+                    if remaining[dependant] == 0:
+                        heapq.heappush(ready, dependant)
+            if deferred and time.monotonic() >= retry_at:
+                for migration_id in deferred:
+                    heapq.heappush(ready, migration_id)
+                deferred = []
+    return res
+
+
+def run_plan(migration_plan, config: dict, app_logger: logger.Logger) -> bool:
+    """
+    Run migrations of :param migration_plan: respecting their dependencies and stop where the plan stops.
+    Amount of migrations running concurrently is limited by config['JOBS']. Workers running python units
+    are started in advance if there are any, see workers.get_pool. Execution also stops once
+    config['RUN_TIMEOUT'] is reached. Migration claimed by another process meanwhile stops execution as well,
+    in cluster mode (config['CLUSTER']) it is waited for and dependent migrations are run once it is DONE.
+
+    :param migration_plan: planner.Plan as returned by planner.load.
+    :param config: pymigrate configuration.
+    :param app_logger: instance of configured logger.
+
+    :return: True on success, False otherwise.
+    """
+    deadline = migration.run_deadline(config)
+    cluster = config.get('CLUSTER', 'False') == 'True'
+    migrations_directory_path = os.path.join(os.pardir, config['PROJECT_DIR'] + '/' + config['MIGRATIONS_DIR'])
+    if any(workers.find_unit(os.path.join(migrations_directory_path, migration_id))
+           for migration_id in migration_plan.graph):
+        # workers start importing modules while the first migrations run
+        workers.get_pool(config).prewarm()
+    statuses = {step.migration_id: step.status for step in migration_plan.steps}
+    waiting = set()
+
+    def run_one(migration_id: str) -> bool:
+        if migration_id not in waiting:
+            print('Starting migration {0}'.format(migration_id))
+        res = migration.run_migration(migration_id, config, app_logger, deadline, statuses[migration_id])
+        if res is None:
+            if not cluster:
+                print('Migration {0}: {1} in another process, stopping'.format(migration_id,
+                                                                               migration.Status.RUNNING.name))
+                return False
+            if migration_id not in waiting:
+                print('Migration {0}: {1} in another process, waiting'.format(migration_id,
+                                                                              migration.Status.RUNNING.name))
+                waiting.add(migration_id)
+            # once the lease expires the migration may be claimed from RUNNING
+            statuses[migration_id] = migration.Status.RUNNING.name
+            return None
+        if res:
+            print('Migration {0}: {1}'.format(migration_id, migration.Status.DONE.name))
+            return True
+        print('Migration {0}: {1}'.format(migration_id, migration.Status.FAILED.name))
+        return False
+
+    def stop_before(migration_id: str) -> bool:
+        if deadline is not None and time.monotonic() >= deadline:
+            print('Run timeout reached before migration {0}, stopping'.format(migration_id))
+            return True
+        return False
+
+    res = execute(migration_plan.graph, int(config.get('JOBS', '1')), run_one, stop_before, app_logger,
+                  float(config.get('KILL_GRACE_PERIOD', executor.KILL_GRACE)),
+                  float(config.get('CLAIM_RETRY_INTERVAL', lease.CLAIM_RETRY_INTERVAL)))
+    stop = migration_plan.stop
+    if res and stop is not None:
+        print('Migration {0}: {1}, stopping'.format(stop.migration_id, stop.reason))
+        return False
+    return res
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
@@ -0,0 +1,77 @@
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import sys
+import math
+import itertools
+
+COLUMNS = ('migration_id', 'runs', 'failures', 'p50', 'p95', 'max', 'last', 'regressed')
+
+# last run is a regression if it took REGRESSION_FACTOR times longer than median of previous runs
+REGRESSION_FACTOR = 2.0
+# amount of previous successful runs required to judge about regression
+MIN_HISTORY = 3
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    """
+    Compute percentile of sorted values using nearest-rank method.
+
+    :param sorted_values: non-empty list of values sorted in ascending order.
+    :param p: percentile, 0 < p <= 100.
+
+    :return: value at percentile :param p:.
+    """
+    rank = max(int(math.ceil(p / 100.0 * len(sorted_values))), 1)
+    return sorted_values[rank - 1]
+
+
+def is_regression(durations: list, regression_factor: float = REGRESSION_FACTOR,
+                  min_history: int = MIN_HISTORY) -> bool:
+    """
+    Check whether the last duration regressed against previous ones.
+
+    :param durations: durations of successful runs in order they were run.
+    :param regression_factor: how many times last run must be slower than median of previous runs.
+    :param min_history: minimal amount of previous runs.
+
+    :return: True if the last run is a regression, False otherwise.
+    """
+    history = sorted(durations[:-1])
+    if len(history) < min_history:
+        return False
+    return durations[-1] > regression_factor * percentile(history, 50)
+
+
+def summarize(runs, regression_factor: float = REGRESSION_FACTOR, min_history: int = MIN_HISTORY):
+    """
+    Compute duration statistics per migration. Only finished successful runs are taken into account
+    for durations, failed runs are counted separately.
+
+    :param runs: iterable of store.RunRecord ordered by migration ID and start time.
+    :param regression_factor: see is_regression.
+    :param min_history: see is_regression.
+
+    :return: generator of tuples with values for COLUMNS.
+    """
+    for migration_id, migration_runs in itertools.groupby(runs, key=lambda run: run.migration_id):
+        finished = [run for run in migration_runs if run.exit_code is not None]
+        durations = [run.duration for run in finished if run.exit_code == 0]
+        failures = len(finished) - len(durations)
+        if not durations:
+            yield migration_id, len(finished), failures, None, None, None, None, 'no'
+            continue
+        ordered = sorted(durations)
+        yield (migration_id, len(finished), failures,
+               round(percentile(ordered, 50), 3),
+               round(percentile(ordered, 95), 3),
+               round(ordered[-1], 3),
+               round(durations[-1], 3),
+               'yes' if is_regression(durations, regression_factor, min_history) else 'no')
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
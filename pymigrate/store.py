@@ -0,0 +1,883 @@
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import sys
+import os
+import shutil
+import sqlite3
+import threading
+import logger
+import profiling
+from contextlib import contextmanager
+from enum import Enum
+from enum import auto
+from typing import NamedTuple
+
+DB_FILE = 'migrations.db'
+# database file keeping state of single environment, used instead of DB_FILE once it exists, see use_db_file
+ENVIRONMENT_DB_FILE = 'migrations.{0}.db'
+# version of migrations database schema, stored in PRAGMA user_version
+SCHEMA_VERSION = 9
+# backends keeping migrations state: sqlite database, journal file of appended changes, memory of the process
+BACKENDS = ('sqlite', 'journal', 'memory')
+# backend keeping migrations state of this process, may be set by STATE_BACKEND in pymigrate.conf, see use_backend
+STATE_BACKEND = 'sqlite'
+# extension of journal file, replaces extension of DB_FILE when journal backend is used
+JOURNAL_EXTENSION = '.journal'
+# what a run does with its migration, see RunRecord
+RUN_MIGRATE = 'migrate'
+RUN_ROLLBACK = 'rollback'
+
+
+class Status(Enum):
+    """
+    Enum representing possible migration states.
+    """
+    DONE = auto()
+    FAILED = auto()
+    MANUAL = auto()
+    PENDING = auto()
+    RUNNING = auto()
+    SKIP = auto()
+    UNKNOWN = auto()
+
+
+class MigrationRecord(NamedTuple):
+    """
+    Single row of migrations table.
+    """
+    migration_id: str
+    status: str
+    presence: str
+    branch: str
+    commit_sha: str = 'unknown'
+
+
+class RunRecord(NamedTuple):
+    """
+    Single execution of migration script.
+    """
+    run_id: int
+    migration_id: str
+    started_at: float
+    finished_at: float
+    duration: float
+    exit_code: int
+    environment: str
+    branch: str
+    commit_sha: str
+    output_bytes: int
+    heartbeat_at: float = None
+    pid: int = None
+    host: str = ''
+    attempt: int = 1
+    # RUN_MIGRATE or RUN_ROLLBACK
+    action: str = RUN_MIGRATE
+
+
+class ScanRecord(NamedTuple):
+    """
+    Cached result of examining single migration directory.
+    """
+    migration_id: str
+    mtime_ns: int
+    inode: int
+    readme: str
+    migrate: str
+    rollback: str
+    nested: int
+
+
+class FileHash(NamedTuple):
+    """
+    Cached sha256 of a file in migrations directory, valid while file size and mtime stay the same.
+    """
+    path: str
+    size: int
+    mtime_ns: int
+    sha256: str
+
+
+class StateError(Exception):
+    """
+    Raised by state backends other than sqlite when migrations state can't be read, e.g. journal file is corrupted.
+    """
+    pass
+
+
+# errors state backends raise on access to migrations state
+ERRORS = (sqlite3.Error, StateError)
+
+
+def upgrade_to_1(conn: sqlite3.Connection):
+    """
+    Create typed migrations table with primary key and indexes. Legacy table without types and keys is converted
+    in place, duplicate rows left by old db_init runs are collapsed to the latest one.
+    """
+    legacy = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='migrations'").fetchone()
+    if legacy:
+        conn.execute('ALTER TABLE migrations RENAME TO migrations_legacy')
+    conn.execute("CREATE TABLE migrations (migration_id TEXT PRIMARY KEY NOT NULL, "
+                 "status TEXT NOT NULL DEFAULT 'PENDING', "
+                 "presence TEXT NOT NULL DEFAULT 'PRESENT', "
+                 "branch TEXT NOT NULL DEFAULT 'unknown')")
+    conn.execute('CREATE INDEX migrations_status ON migrations (status)')
+    conn.execute('CREATE INDEX migrations_presence ON migrations (presence)')
+    if legacy:
+        conn.execute("INSERT INTO migrations (migration_id, status, presence, branch) "
+                     "SELECT migration_id, "
+                     "COALESCE(REPLACE(status, char(10), ''), 'PENDING'), "
+                     "COALESCE(REPLACE(presence, char(10), ''), 'PRESENT'), "
+                     "COALESCE(REPLACE(branch, char(10), ''), 'unknown') "
+                     "FROM migrations_legacy "
+                     "WHERE rowid IN (SELECT MAX(rowid) FROM migrations_legacy "
+                     "WHERE migration_id IS NOT NULL GROUP BY migration_id)")
+        conn.execute('DROP TABLE migrations_legacy')
+
+
+def upgrade_to_2(conn: sqlite3.Connection):
+    """
+    Record commit sha next to the branch migration status was changed on.
+    """
+    conn.execute("ALTER TABLE migrations ADD COLUMN commit_sha TEXT NOT NULL DEFAULT 'unknown'")
+
+
+def upgrade_to_3(conn: sqlite3.Connection):
+    """
+    Keep history of migration runs.
+    """
+    conn.execute('CREATE TABLE runs (run_id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                 'migration_id TEXT NOT NULL, '
+                 'started_at REAL NOT NULL, '
+                 'finished_at REAL, '
+                 'duration REAL, '
+                 'exit_code INTEGER, '
+                 'environment TEXT NOT NULL, '
+                 "branch TEXT NOT NULL DEFAULT 'unknown', "
+                 "commit_sha TEXT NOT NULL DEFAULT 'unknown', "
+                 'output_bytes INTEGER)')
+    conn.execute('CREATE INDEX runs_migration ON runs (migration_id, started_at)')
+
+
+def upgrade_to_4(conn: sqlite3.Connection):
+    """
+    Cache results of migrations directory scan.
+    """
+    conn.execute('CREATE TABLE scan_cache (migration_id TEXT PRIMARY KEY NOT NULL, '
+                 'mtime_ns INTEGER NOT NULL, '
+                 'inode INTEGER NOT NULL, '
+                 "readme TEXT NOT NULL DEFAULT '', "
+                 "migrate TEXT NOT NULL DEFAULT '', "
+                 "rollback TEXT NOT NULL DEFAULT '', "
+                 'nested INTEGER NOT NULL DEFAULT 0)')
+
+
+def upgrade_to_5(conn: sqlite3.Connection):
+    """
+    Keep hashes of migration files as of their last run and a cache of file hashes.
+    """
+    conn.execute('CREATE TABLE file_hashes (path TEXT PRIMARY KEY NOT NULL, '
+                 'size INTEGER NOT NULL, '
+                 'mtime_ns INTEGER NOT NULL, '
+                 'sha256 TEXT NOT NULL)')
+    conn.execute('CREATE TABLE migration_files (migration_id TEXT NOT NULL, '
+                 'path TEXT NOT NULL, '
+                 'sha256 TEXT NOT NULL, '
+                 'PRIMARY KEY (migration_id, path))')
+
+
+def upgrade_to_6(conn: sqlite3.Connection):
+    """
+    Track liveness of runs, so runs abandoned by crashed or killed pymigrate can be detected.
+    """
+    conn.execute('ALTER TABLE runs ADD COLUMN heartbeat_at REAL')
+    conn.execute('ALTER TABLE runs ADD COLUMN pid INTEGER')
+    conn.execute("ALTER TABLE runs ADD COLUMN host TEXT NOT NULL DEFAULT ''")
+    conn.execute('CREATE INDEX runs_unfinished ON runs (finished_at) WHERE finished_at IS NULL')
+
+
+def upgrade_to_7(conn: sqlite3.Connection):
+    """
+    Number attempts of migrations which are retried on failure.
+    """
+    conn.execute('ALTER TABLE runs ADD COLUMN attempt INTEGER NOT NULL DEFAULT 1')
+
+
+def upgrade_to_8(conn: sqlite3.Connection):
+    """
+    Lease RUNNING migrations to processes running them, so processes sharing the database never run
+    the same migration twice.
+    """
+    conn.execute('CREATE TABLE leases (migration_id TEXT PRIMARY KEY NOT NULL, '
+                 'owner TEXT NOT NULL, '
+                 'expires_at REAL NOT NULL)')
+
+
+def upgrade_to_9(conn: sqlite3.Connection):
+    """
+    Keep runs of rollback executables in runs history along with runs of migrate executables.
+    """
+    conn.execute("ALTER TABLE runs ADD COLUMN action TEXT NOT NULL DEFAULT 'migrate'")
+
+
+# UPGRADES[n] brings schema from version n to version n + 1
+UPGRADES = [upgrade_to_1, upgrade_to_2, upgrade_to_3, upgrade_to_4, upgrade_to_5, upgrade_to_6, upgrade_to_7,
+            upgrade_to_8, upgrade_to_9]
+
+
+def upgrade_schema(conn: sqlite3.Connection, app_logger: logger.Logger) -> int:
+    """
+    Bring migrations database schema up to SCHEMA_VERSION. Each upgrade step runs in its own transaction,
+    so concurrent processes never see half-upgraded schema.
+
+    :param conn: sqlite connection to migrations database.
+    :param app_logger: instance of configured logger.
+
+    :return: schema version found before upgrade.
+    """
+    found = conn.execute('PRAGMA user_version').fetchone()[0]
+    if found > SCHEMA_VERSION:
+        raise sqlite3.DatabaseError('Migrations database schema version {0} is newer than supported {1}'
+                                    .format(found, SCHEMA_VERSION))
+    version = found
+    while version < SCHEMA_VERSION:
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            # someone else may have upgraded the schema while we were waiting for the lock
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            if version >= SCHEMA_VERSION:
+                break
+            app_logger.log_with_ts('Upgrading migrations database schema to version {0}', logger.Levels.INFO,
+                                   version + 1)
+            UPGRADES[version](conn)
+            conn.execute('PRAGMA user_version = {0:d}'.format(version + 1))
+    return found
+
+
+class MigrationStore:
+    """
+    MigrationStore keeps a single sqlite connection to migrations database for the whole process.
+    All statements are parameterized, so sqlite compiles each of them once and reuses it from statement cache.
+    Store may be shared between threads, access to the connection is serialized with a lock.
+    """
+    COLUMNS = 'migration_id, status, presence, branch, commit_sha'
+    SELECT_ONE = 'SELECT ' + COLUMNS + ' FROM migrations WHERE migration_id=?'
+    INSERT_ROW = 'INSERT OR IGNORE INTO migrations (' + COLUMNS + ') VALUES (?, ?, ?, ?, ?)'
+    UPDATE_ROW = 'UPDATE migrations SET status=?, presence=?, branch=?, commit_sha=? WHERE migration_id=?'
+    UPDATE_STATUS = 'UPDATE migrations SET status=?, branch=?, commit_sha=? WHERE migration_id=?'
+    UPDATE_STATUS_ONLY = 'UPDATE migrations SET status=? WHERE migration_id=?'
+    CREATE_SELECTION = 'CREATE TEMP TABLE IF NOT EXISTS selection (migration_id PRIMARY KEY)'
+    CLEAR_SELECTION = 'DELETE FROM selection'
+    INSERT_SELECTION = 'INSERT OR IGNORE INTO selection (migration_id) VALUES (?)'
+    UPDATE_SELECTION_STATUS = 'UPDATE migrations SET status=? ' \
+                              'WHERE migration_id IN (SELECT migration_id FROM selection)'
+    UPDATE_SELECTION_PRESENCE = 'UPDATE migrations SET presence=? ' \
+                                'WHERE migration_id IN (SELECT migration_id FROM selection)'
+    DELETE_ONE = 'DELETE FROM migrations WHERE migration_id=?'
+    # migration is claimed from expected status, or from RUNNING once lease of its runner has expired
+    CLAIM = "UPDATE migrations SET status='RUNNING' WHERE migration_id=? AND " \
+            "((status=? AND status!='RUNNING') OR (status='RUNNING' AND NOT EXISTS " \
+            "(SELECT 1 FROM leases WHERE leases.migration_id=migrations.migration_id AND expires_at>=?)))"
+    REPLACE_LEASE = 'INSERT OR REPLACE INTO leases (migration_id, owner, expires_at) VALUES (?, ?, ?)'
+    RENEW_LEASE = 'UPDATE leases SET expires_at=? WHERE migration_id=? AND owner=?'
+    DELETE_LEASE = 'DELETE FROM leases WHERE migration_id=? AND owner=?'
+    DELETE_LEASES = 'DELETE FROM leases WHERE migration_id=?'
+    SELECT_LEASE = 'SELECT owner, expires_at FROM leases WHERE migration_id=?'
+    # status of RUNNING migration is changed only if nobody else holds a lease on it
+    RELEASE_STATUS = "UPDATE migrations SET status=?, branch=COALESCE(?, branch), " \
+                     "commit_sha=COALESCE(?, commit_sha) WHERE migration_id=? AND status='RUNNING' AND " \
+                     "NOT EXISTS (SELECT 1 FROM leases WHERE leases.migration_id=migrations.migration_id)"
+    RUN_COLUMNS = 'run_id, migration_id, started_at, finished_at, duration, exit_code, environment, branch, ' \
+                  'commit_sha, output_bytes, heartbeat_at, pid, host, attempt, action'
+    INSERT_RUN = 'INSERT INTO runs (migration_id, started_at, environment, branch, commit_sha, heartbeat_at, pid, ' \
+                 'host, attempt, action) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+    FINISH_RUN = 'UPDATE runs SET finished_at=?, duration=?, exit_code=?, output_bytes=? WHERE run_id=?'
+    HEARTBEAT_RUN = 'UPDATE runs SET heartbeat_at=? WHERE run_id=?'
+    SELECT_UNFINISHED_RUNS = 'SELECT ' + RUN_COLUMNS + ' FROM runs WHERE finished_at IS NULL ORDER BY run_id'
+    SELECT_LAST_RUNS_BY_STATUS = 'SELECT ' + RUN_COLUMNS + ' FROM runs WHERE run_id IN ' \
+                                 '(SELECT MAX(run_id) FROM runs JOIN migrations USING (migration_id) ' \
+                                 'WHERE migrations.status=? GROUP BY migration_id) ORDER BY run_id'
+    SCAN_COLUMNS = 'migration_id, mtime_ns, inode, readme, migrate, rollback, nested'
+    SELECT_SCANS = 'SELECT ' + SCAN_COLUMNS + ' FROM scan_cache'
+    REPLACE_SCAN = 'INSERT OR REPLACE INTO scan_cache (' + SCAN_COLUMNS + ') VALUES (?, ?, ?, ?, ?, ?, ?)'
+    DELETE_SELECTION_SCANS = 'DELETE FROM scan_cache WHERE migration_id IN (SELECT migration_id FROM selection)'
+    SELECT_FILE_HASHES = 'SELECT path, size, mtime_ns, sha256 FROM file_hashes'
+    REPLACE_FILE_HASH = 'INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)'
+    SELECT_MIGRATION_FILES = 'SELECT migration_id, path, sha256 FROM migration_files'
+    DELETE_MIGRATION_FILES = 'DELETE FROM migration_files WHERE migration_id=?'
+    INSERT_MIGRATION_FILE = 'INSERT INTO migration_files (migration_id, path, sha256) VALUES (?, ?, ?)'
+
+    # rows fetched from cursor at once while iterating over migrations table
+    FETCH_SIZE = 500
+
+    def __init__(self, path_to_db: str, app_logger: logger.Logger):
+        self.path_to_db = path_to_db
+        self.app_logger = app_logger
+        self._lock = threading.RLock()
+        self._depth = 0
+        # scan cache read once per store, records are validated by scanner anyway so a stale copy is harmless
+        self._scans = None
+        self._conn = sqlite3.connect(path_to_db, check_same_thread=False)
+        with self._lock:
+            upgrade_schema(self._conn, app_logger)
+
+    def __repr__(self):
+        return '[ {0}: {1} ]'.format('path_to_db', self.path_to_db)
+
+    def close(self):
+        """
+        Close underlying sqlite connection.
+        """
+        with self._lock:
+            self._conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Group writes into a single transaction. Transactions may be nested, in which case the outermost one
+        commits (or rolls back on exception) all the changes.
+        """
+        with self._lock:
+            self._depth += 1
+            try:
+                if self._depth == 1:
+                    with self._conn:
+                        yield
+                else:
+                    yield
+            finally:
+                self._depth -= 1
+
+    def get(self, migration_id: str) -> MigrationRecord:
+        """
+        Read single migration.
+
+        :param migration_id: ID of migration to read.
+
+        :return: MigrationRecord or None if there is no such migration.
+        """
+        with self._lock:
+            row = self._conn.execute(self.SELECT_ONE, (migration_id,)).fetchone()
+        return MigrationRecord(*row) if row else None
+
+    def set_status(self, migration_id: str, status: Status, branch: str = None, commit_sha: str = 'unknown') -> bool:
+        """
+        Set status of migration :param migration_id:. Branch and commit are updated as well unless branch is None.
+
+        :param migration_id: ID of migration to update.
+        :param status: new migration status.
+        :param branch: git branch the status was changed on.
+        :param commit_sha: git commit the status was changed on.
+
+        :return: True if migration exists, False otherwise.
+        """
+        with self.transaction():
+            if branch is None:
+                cursor = self._conn.execute(self.UPDATE_STATUS_ONLY, (status.name, migration_id))
+            else:
+                cursor = self._conn.execute(self.UPDATE_STATUS, (status.name, branch, commit_sha, migration_id))
+        return cursor.rowcount != 0
+
+    def set_statuses(self, migration_ids, status: Status):
+        """
+        Set status of all migrations from :param migration_ids: in a single transaction. Branch is left untouched.
+
+        :param migration_ids: iterable with IDs of migrations to update.
+        :param status: new migration status.
+        """
+        with self.transaction():
+            self._select(migration_ids)
+            self._conn.execute(self.UPDATE_SELECTION_STATUS, (status.name,))
+
+    def set_presence(self, migration_ids, presence: str):
+        """
+        Set presence of all migrations from :param migration_ids: in a single transaction.
+
+        :param migration_ids: iterable with IDs of migrations to update.
+        :param presence: PRESENT or ABSENT.
+        """
+        with self.transaction():
+            self._select(migration_ids)
+            self._conn.execute(self.UPDATE_SELECTION_PRESENCE, (presence,))
+
+    def _select(self, migration_ids):
+        """
+        Fill temporary selection table with :param migration_ids:, so bulk updates can be done with
+        a single statement instead of one lookup per migration.
+        """
+        self._conn.execute(self.CREATE_SELECTION)
+        self._conn.execute(self.CLEAR_SELECTION)
+        self._conn.executemany(self.INSERT_SELECTION, ((migration_id,) for migration_id in migration_ids))
+
+    def add(self, records):
+        """
+        Insert migrations which are not in the table yet, existing ones are left untouched.
+        All records are written in a single transaction.
+
+        :param records: iterable of MigrationRecord.
+        """
+        with self.transaction():
+            self._conn.executemany(self.INSERT_ROW, (tuple(record) for record in records))
+
+    def upsert(self, records):
+        """
+        Insert or overwrite migrations in a single transaction.
+
+        :param records: iterable of MigrationRecord.
+        """
+        with self.transaction():
+            for record in records:
+                cursor = self._conn.execute(self.UPDATE_ROW, (record.status, record.presence, record.branch,
+                                                              record.commit_sha, record.migration_id))
+                if cursor.rowcount == 0:
+                    self._conn.execute(self.INSERT_ROW, tuple(record))
+
+    def delete(self, migration_id: str) -> bool:
+        """
+        Delete migration from the table.
+
+        :param migration_id: ID of migration to delete.
+
+        :return: True if migration existed, False otherwise.
+        """
+        with self.transaction():
+            self._conn.execute(self.DELETE_LEASES, (migration_id,))
+            cursor = self._conn.execute(self.DELETE_ONE, (migration_id,))
+        return cursor.rowcount != 0
+
+    def iterate(self, statuses: tuple = None, since: str = None, limit: int = 0, offset: int = 0):
+        """
+        Iterate over migrations ordered by migration ID. Filtering and pagination are done by sqlite,
+        rows are fetched from cursor in batches, so the whole table is never loaded in memory at once.
+
+        :param statuses: names of statuses to select, all statuses if None.
+        :param since: select only migrations with ID greater or equal to this one.
+        :param limit: maximum amount of rows, 0 means no limit.
+        :param offset: amount of rows to skip.
+
+        :return: generator of MigrationRecord.
+        """
+        query = 'SELECT ' + self.COLUMNS + ' FROM migrations'
+        conditions = []
+        params = []
+        if statuses:
+            conditions.append('status IN (' + ', '.join('?' * len(statuses)) + ')')
+            params.extend(statuses)
+        if since:
+            conditions.append('migration_id >= ?')
+            params.append(since)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY migration_id LIMIT ? OFFSET ?'
+        params.extend((limit if limit > 0 else -1, max(offset, 0)))
+
+        with self._lock:
+            cursor = self._conn.execute(query, params)
+            rows = cursor.fetchmany(self.FETCH_SIZE)
+        while rows:
+            for row in rows:
+                yield MigrationRecord(*row)
+            with self._lock:
+                rows = cursor.fetchmany(self.FETCH_SIZE)
+
+    def start_run(self, migration_id: str, started_at: float, environment: str, branch: str = 'unknown',
+                  commit_sha: str = 'unknown', pid: int = None, host: str = '', attempt: int = 1,
+                  action: str = RUN_MIGRATE) -> int:
+        """
+        Add a run of migration :param migration_id: to runs history.
+
+        :param migration_id: ID of migration being run.
+        :param started_at: unix time the run started at, also the first heartbeat.
+        :param environment: environment the migration is run in.
+        :param branch: git branch the migration is run from.
+        :param commit_sha: git commit the migration is run from.
+        :param pid: ID of pymigrate process running the migration.
+        :param host: name of host pymigrate process runs on.
+        :param attempt: number of attempt to run the migration, starting from 1.
+        :param action: RUN_MIGRATE or RUN_ROLLBACK.
+
+        :return: ID of the run.
+        """
+        with self.transaction():
+            cursor = self._conn.execute(self.INSERT_RUN, (migration_id, started_at, environment, branch, commit_sha,
+                                                          started_at, pid, host, attempt, action))
+        return cursor.lastrowid
+
+    def heartbeat(self, run_id: int, at: float):
+        """
+        Record that pymigrate process of run :param run_id: is alive at unix time :param at:. Heartbeats continue
+        after the run is finished while the process waits to retry the migration.
+        """
+        with self.transaction():
+            self._conn.execute(self.HEARTBEAT_RUN, (at, run_id))
+
+    def claim(self, migration_id: str, expected: Status, owner: str, now: float, expires_at: float) -> bool:
+        """
+        Atomically set migration :param migration_id: RUNNING and lease it to :param owner: if the migration
+        is still in :param expected: status, or is RUNNING under a lease which has expired by :param now:.
+
+        :param migration_id: ID of migration to claim.
+        :param expected: status migration was seen in, RUNNING means the migration may be claimed once its lease
+        expires.
+        :param owner: ID of claiming process.
+        :param now: current unix time.
+        :param expires_at: unix time the lease expires at unless renewed.
+
+        :return: True if migration was claimed, False otherwise.
+        """
+        with self.transaction():
+            cursor = self._conn.execute(self.CLAIM, (migration_id, expected.name, now))
+            if cursor.rowcount == 0:
+                return False
+            self._conn.execute(self.REPLACE_LEASE, (migration_id, owner, expires_at))
+        return True
+
+    def renew_lease(self, migration_id: str, owner: str, expires_at: float) -> bool:
+        """
+        Extend lease of :param owner: on migration :param migration_id: till :param expires_at:.
+
+        :return: True if the lease is still held by :param owner:, False if it was lost.
+        """
+        with self.transaction():
+            cursor = self._conn.execute(self.RENEW_LEASE, (expires_at, migration_id, owner))
+        return cursor.rowcount != 0
+
+    def get_lease(self, migration_id: str) -> tuple:
+        """
+        Read lease on migration :param migration_id:.
+
+        :return: tuple of owner and unix time the lease expires at, or None if migration is not leased.
+        """
+        with self._lock:
+            return self._conn.execute(self.SELECT_LEASE, (migration_id,)).fetchone()
+
+    def release(self, migration_id: str, owner: str, status: Status, branch: str = None,
+                commit_sha: str = None) -> bool:
+        """
+        Drop lease of :param owner: on migration :param migration_id: and set status of the migration if it is
+        still RUNNING and not leased by anybody else.
+
+        :param migration_id: ID of migration to release.
+        :param owner: ID of releasing process.
+        :param status: new migration status.
+        :param branch: git branch the status was changed on, left untouched if None.
+        :param commit_sha: git commit the status was changed on, left untouched if None.
+
+        :return: True if status was set, False otherwise.
+        """
+        with self.transaction():
+            self._conn.execute(self.DELETE_LEASE, (migration_id, owner))
+            cursor = self._conn.execute(self.RELEASE_STATUS, (status.name, branch, commit_sha, migration_id))
+        return cursor.rowcount != 0
+
+    def iterate_unfinished_runs(self):
+        """
+        Iterate over runs which were started but not finished yet.
+
+        :return: generator of RunRecord ordered by run ID.
+        """
+        with self._lock:
+            rows = self._conn.execute(self.SELECT_UNFINISHED_RUNS).fetchall()
+        return (RunRecord(*row) for row in rows)
+
+    def get_last_runs(self, status: Status) -> list:
+        """
+        Read the latest run of every migration with status :param status:.
+
+        :return: list of RunRecord ordered by run ID.
+        """
+        with self._lock:
+            rows = self._conn.execute(self.SELECT_LAST_RUNS_BY_STATUS, (status.name,)).fetchall()
+        return [RunRecord(*row) for row in rows]
+
+    def finish_run(self, run_id: int, finished_at: float, duration: float, exit_code: int, output_bytes: int):
+        """
+        Record the outcome of run :param run_id:.
+
+        :param run_id: ID of the run as returned by start_run.
+        :param finished_at: unix time the run finished at.
+        :param duration: duration of the run in seconds.
+        :param exit_code: exit code of migration script.
+        :param output_bytes: amount of output produced by migration script.
+        """
+        with self.transaction():
+            self._conn.execute(self.FINISH_RUN, (finished_at, duration, exit_code, output_bytes, run_id))
+
+    def iterate_runs(self, migration_id: str = None, environment: str = None, action: str = None):
+        """
+        Iterate over runs history ordered by migration ID and start time.
+
+        :param migration_id: select runs of this migration only, all runs if None.
+        :param environment: select runs in this environment only, all environments if None.
+        :param action: select runs of RUN_MIGRATE or RUN_ROLLBACK only, all runs if None.
+
+        :return: generator of RunRecord.
+        """
+        query = 'SELECT ' + self.RUN_COLUMNS + ' FROM runs'
+        conditions = []
+        params = []
+        if migration_id:
+            conditions.append('migration_id=?')
+            params.append(migration_id)
+        if environment:
+            conditions.append('environment=?')
+            params.append(environment)
+        if action:
+            conditions.append('action=?')
+            params.append(action)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY migration_id, started_at'
+        with self._lock:
+            cursor = self._conn.execute(query, params)
+            rows = cursor.fetchmany(self.FETCH_SIZE)
+        while rows:
+            for row in rows:
+                yield RunRecord(*row)
+            with self._lock:
+                rows = cursor.fetchmany(self.FETCH_SIZE)
+
+    def get_scans(self) -> dict:
+        """
+        Read the whole scan cache. Database is read on the first call only, later calls return what was read
+        and saved since then.
+
+        :return: dict where key is migration ID and value is ScanRecord.
+        """
+        with self._lock:
+            if self._scans is None:
+                self._scans = {row[0]: ScanRecord(*row) for row in self._conn.execute(self.SELECT_SCANS)}
+            return dict(self._scans)
+
+    def save_scans(self, records, removed_ids=()):
+        """
+        Write changed scan cache entries and drop entries of removed migrations in a single transaction.
+
+        :param records: iterable of ScanRecord to insert or overwrite.
+        :param removed_ids: iterable with IDs of migrations which are not on disk anymore.
+        """
+        records = list(records)
+        removed_ids = list(removed_ids)
+        with self.transaction():
+            self._conn.executemany(self.REPLACE_SCAN, (tuple(record) for record in records))
+            self._select(removed_ids)
+            self._conn.execute(self.DELETE_SELECTION_SCANS)
+            if self._scans is not None:
+                self._scans.update((record.migration_id, record) for record in records)
+                for migration_id in removed_ids:
+                    self._scans.pop(migration_id, None)
+
+    def get_file_hashes(self, migration_id: str = None) -> dict:
+        """
+        Read file hash cache.
+
+        :param migration_id: read hashes of files of this migration only, all hashes if None.
+
+        :return: dict where key is path relative to migrations directory and value is FileHash.
+        """
+        query = self.SELECT_FILE_HASHES
+        params = ()
+        if migration_id:
+            # paths of migration files start with 'migration_id/', '0' is the character following '/'
+            query += ' WHERE path >= ? AND path < ?'
+            params = (migration_id + '/', migration_id + '0')
+        with self._lock:
+            return {row[0]: FileHash(*row) for row in self._conn.execute(query, params)}
+
+    def save_file_hashes(self, records):
+        """
+        Insert or overwrite file hash cache entries in a single transaction.
+
+        :param records: iterable of FileHash.
+        """
+        with self.transaction():
+            self._conn.executemany(self.REPLACE_FILE_HASH, (tuple(record) for record in records))
+
+    def set_migration_files(self, migration_id: str, hashes: dict):
+        """
+        Replace recorded hashes of files of migration :param migration_id:.
+
+        :param migration_id: ID of migration.
+        :param hashes: dict where key is file path relative to migration directory and value is sha256.
+        """
+        with self.transaction():
+            self._conn.execute(self.DELETE_MIGRATION_FILES, (migration_id,))
+            self._conn.executemany(self.INSERT_MIGRATION_FILE,
+                                   ((migration_id, path, sha256) for path, sha256 in hashes.items()))
+
+    def get_migration_files(self, migration_id: str = None) -> dict:
+        """
+        Read hashes of migration files recorded when migrations were run.
+
+        :param migration_id: read hashes of this migration only, all migrations if None.
+
+        :return: dict where key is migration ID and value is dict of file path and sha256.
+        """
+        query = self.SELECT_MIGRATION_FILES
+        params = ()
+        if migration_id:
+            query += ' WHERE migration_id=?'
+            params = (migration_id,)
+        res = {}
+        with self._lock:
+            for row_migration_id, path, sha256 in self._conn.execute(query, params):
+                res.setdefault(row_migration_id, {})[path] = sha256
+        return res
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def file_name(db_file: str, backend: str = None) -> str:
+    """
+    Return name of the file :param backend: keeps migrations state in for database file :param db_file:.
+    Journal backend replaces extension of the database file with JOURNAL_EXTENSION.
+
+    :param db_file: name of database file, e.g. DB_FILE.
+    :param backend: one of BACKENDS, STATE_BACKEND if None.
+    """
+    if (backend or STATE_BACKEND) == 'journal':
+        return os.path.splitext(db_file)[0] + JOURNAL_EXTENSION
+    return db_file
+
+
+def environment_db_file(environment: str) -> str:
+    """
+    Return name of database file keeping state of single :param environment:, see ENVIRONMENT_DB_FILE.
+    """
+    return ENVIRONMENT_DB_FILE.format(environment)
+
+
+def has_environment_state(migrations_directory_path: str, environment: str) -> bool:
+    """
+    Check whether :param environment: keeps migrations state of :param migrations_directory_path: in a file of its
+    own, see environment_db_file. It's always so once the file of STATE_BACKEND exists.
+    """
+    return os.path.isfile(os.path.join(migrations_directory_path, file_name(environment_db_file(environment))))
+
+
+def state_path(migrations_directory_path: str) -> str:
+    """
+    Return path of the file migrations state of :param migrations_directory_path: is kept in by STATE_BACKEND.
+    """
+    return os.path.join(migrations_directory_path, file_name(DB_FILE))
+
+
+def _store_key(migrations_directory_path: str) -> tuple:
+    return STATE_BACKEND, os.path.realpath(state_path(migrations_directory_path))
+
+
+def exists(migrations_directory_path: str) -> bool:
+    """
+    Check whether migrations state of :param migrations_directory_path: was initialized. State kept in memory
+    exists once its store was opened by this process.
+    """
+    if STATE_BACKEND == 'memory':
+        with _stores_lock:
+            return _store_key(migrations_directory_path) in _stores
+    return os.path.isfile(state_path(migrations_directory_path))
+
+
+def open_store(migrations_directory_path: str, app_logger: logger.Logger) -> MigrationStore:
+    """
+    Return store of migrations state located in :param migrations_directory_path: kept by STATE_BACKEND.
+    Store is opened once per process and reused by subsequent calls.
+
+    :param migrations_directory_path: path to migrations directory.
+    :param app_logger: instance of configured logger.
+
+    :return: MigrationStore instance or instance of another backend with the same interface, see backends.
+    """
+    key = _store_key(migrations_directory_path)
+    with _stores_lock:
+        if key not in _stores:
+            backend, path_to_db = key
+            app_logger.log_with_ts('Opening migrations state {0} ({1})', logger.Levels.DEBUG, path_to_db, backend)
+            with profiling.phase(backend + '.open'):
+                if backend == 'sqlite':
+                    _stores[key] = MigrationStore(path_to_db, app_logger)
+                else:
+                    import backends
+                    _stores[key] = backends.open_backend(backend, path_to_db, app_logger)
+        return _stores[key]
+
+
+def use_db_file(name: str):
+    """
+    Keep migrations state of this process in database file :param name: located in migrations directory
+    instead of DB_FILE. Stores opened before the call are not affected.
+    """
+    global DB_FILE
+    DB_FILE = name
+
+
+def seed(migrations_directory_path: str, name: str) -> bool:
+    """
+    Create state file of STATE_BACKEND for database file :param name: as a copy of the one for DB_FILE, so
+    an environment switched to a state of its own keeps everything run in the shared state. Nothing is done if
+    the file exists already or there is nothing to copy.
+
+    :param migrations_directory_path: path to migrations directory.
+    :param name: name of database file, e.g. one of environment_db_file.
+
+    :return: True if the file was created, False otherwise.
+    """
+    if STATE_BACKEND == 'memory':
+        return False
+    source = state_path(migrations_directory_path)
+    target = os.path.join(migrations_directory_path, file_name(name))
+    if os.path.exists(target) or not os.path.isfile(source):
+        return False
+    # copy is made aside and moved in place at once, so nobody opens a half-written state
+    tmp = '{0}.{1}.tmp'.format(target, os.getpid())
+    try:
+        if STATE_BACKEND == 'sqlite':
+            # writers can't commit while the database is locked, so the file is consistent meanwhile
+            conn = sqlite3.connect(source, timeout=30, isolation_level=None)
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                shutil.copyfile(source, tmp)
+                conn.execute('ROLLBACK')
+            finally:
+                conn.close()
+        else:
+            # torn last line of journal being appended meanwhile is dropped on replay
+            shutil.copyfile(source, tmp)
+        if os.path.exists(target):
+            return False
+        os.replace(tmp, target)
+        return True
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def use_backend(name: str):
+    """
+    Keep migrations state of this process in backend :param name:, see BACKENDS. Stores opened before the call
+    are not affected.
+
+    :raise ValueError: if backend is unknown.
+    """
+    global STATE_BACKEND
+    if name not in BACKENDS:
+        raise ValueError('Unknown state backend {0}, expected one of: {1}'.format(name, ', '.join(BACKENDS)))
+    STATE_BACKEND = name
+
+
+def close_all():
+    """
+    Close all stores opened by this process.
+    """
+    with _stores_lock:
+        for migration_store in _stores.values():
+            migration_store.close()
+        _stores.clear()
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
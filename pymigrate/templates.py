@@ -4,6 +4,7 @@ __license__ = 'MIT'
 __email__ = 'makcimkos@gmail.com'
 
 import sys
+import shlex
 
 
 def generate_readme_md(config: dict) -> str:
@@ -49,6 +50,52 @@ def generate_migrate_sh(config: dict) -> str:
     return template
 
 
+# python run by baseline migrate.sh to apply a unit outside of workers pool, exit status is mapped as workers do
+RUN_UNIT_PY = 'import importlib.util, os, sys, types\n' \
+              'path, migration_id, environment = sys.argv[1:4]\n' \
+              'sys.path.insert(0, os.path.dirname(path))\n' \
+              'spec = importlib.util.spec_from_file_location("pymigrate_unit", path)\n' \
+              'unit = importlib.util.module_from_spec(spec)\n' \
+              'spec.loader.exec_module(unit)\n' \
+              'context = types.SimpleNamespace(migration_id=migration_id, migration_dir=os.path.dirname(path),\n' \
+              '                                config=dict(os.environ), cache={})\n' \
+              'result = unit.migrate(environment, context)\n' \
+              'sys.exit(0 if result is None or result is True else 1 if result is False else result)\n'
+
+
+def generate_baseline_migrate_sh(to: str, migrations: list) -> str:
+    """
+    Generate migrate.sh of baseline, see baseline.squash. The script unpacks the bundle of squashed migrations
+    to a temporary directory and runs their migrate executables one by one, stopping at the first failure.
+    Python units are run by python3 (or $PYTHON) one by one as well.
+
+    :param to: ID of the latest squashed migration.
+    :param migrations: list of tuples of migration ID, path of its migrate executable and whether it's a python
+    unit, in order they are run in.
+    """
+    template = '#!/bin/sh\n\n' \
+               '# Generated by pymigrate squash: applies {0} migrations squashed up to {1}.\n' \
+               '# first argument to any migrate.* script is environment name\n' \
+               'set -e\n' \
+               'baseline_dir=$(cd "$(dirname "$0")" && pwd)\n' \
+               'work_dir=$(mktemp -d)\n' \
+               'trap \'rm -rf "$work_dir"\' EXIT\n' \
+               'tar -xzf "$baseline_dir/bundle.tar.gz" -C "$work_dir"\n\n' \
+               'apply() {{\n' \
+               '  echo "Applying migration $1"\n' \
+               '  "$work_dir/$1/$2" "$ENVIRONMENT"\n' \
+               '}}\n\n' \
+               'apply_unit() {{\n' \
+               '  echo "Applying migration $1"\n' \
+               '  "${{PYTHON:-python3}}" -c {2} "$work_dir/$1/$2" "$1" "$ENVIRONMENT"\n' \
+               '}}\n\n' \
+               'ENVIRONMENT=$1\n'
+
+    return template.format(len(migrations), to, shlex.quote(RUN_UNIT_PY)) + ''.join(
+        '{0} {1} {2}\n'.format('apply_unit' if unit else 'apply', shlex.quote(migration_id), shlex.quote(migrate))
+        for migration_id, migrate, unit in migrations)
+
+
 if __name__ == '__main__':
     print("This module is not callable")
     sys.exit(0)
@@ -5,9 +5,10 @@ __email__ = 'makcimkos@gmail.com'
 
 import sys
 import os
-import cli_commands
+import commands
 import logger
 import fnmatch
+import datetime
 
 
 def print_env_vars():
@@ -33,7 +34,7 @@ def get_available_actions() -> tuple:
     """
     Return tuple with available actions.
     """
-    return tuple(method for method in dir(cli_commands) if callable(getattr(cli_commands, method)))
+    return commands.names()
 
 
 def query_yes_no(question: str, default: str = "yes") -> bool:
@@ -84,17 +85,51 @@ def load_config(config_file: str, app_logger: logger.Logger) -> dict:
     """
     config = {}
     if os.path.isfile(config_file):
-        app_logger.log_with_ts('Loading config file: {0}'.format(config_file), logger.Levels.DEBUG)
+        app_logger.log_with_ts('Loading config file: {0}', logger.Levels.DEBUG, config_file)
         with open(config_file, 'r') as cf:
             for line in cf:
                 key, value = line.replace('\n', '').split('=')
                 config[key] = value.replace("'", '')
-            app_logger.log_with_ts('Loaded config file: {0}'.format(config_file), logger.Levels.DEBUG)
+            app_logger.log_with_ts('Loaded config file: {0}', logger.Levels.DEBUG, config_file)
     else:
         app_logger.log_with_ts('Config file not found, moving on', logger.Levels.INFO)
     return config
 
 
+def parse_timestamp(value: str) -> int:
+    """
+    Convert unix timestamp or ISO 8601 date (e.g. 2018-01-01 or 2018-01-01T12:00:00) to unix timestamp.
+    Dates without timezone are considered local.
+
+    :param value: string to parse.
+
+    :return: unix timestamp.
+    """
+    if value.isdigit():
+        return int(value)
+    for fmt in ('%Y-%m-%d', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S'):
+        try:
+            return int(datetime.datetime.strptime(value, fmt).timestamp())
+        except ValueError:
+            continue
+    raise ValueError("invalid timestamp: '%s'" % value)
+
+
+def parse_environments(value: str) -> list:
+    """
+    Split comma-separated list of environment names keeping their order and dropping duplicates.
+
+    :raise ValueError: if name is empty or can't be used as a part of file name.
+    """
+    res = []
+    for name in (name.strip() for name in value.split(',')):
+        if not name or name.startswith('.') or not all(c.isalnum() or c in '-_.' for c in name):
+            raise ValueError("invalid environment name: '%s'" % name)
+        if name not in res:
+            res.append(name)
+    return res
+
+
 def find_files(pattern: str, path: str, csensitive: bool) -> list:
     """
     Search for files by pattern. For case-insensitive search file names and pattern itself
@@ -120,6 +155,26 @@ def find_files(pattern: str, path: str, csensitive: bool) -> list:
     return result
 
 
+def has_file(pattern: str, path: str, csensitive: bool) -> bool:
+    """
+    Check whether at least one file matching pattern exists under :param path:. Unlike find_files
+    this function stops at the first match.
+
+    :param pattern: search regex.
+    :param path: search under this path.
+    :param csensitive: True for case-sensitive search, False otherwise.
+
+    :return: True if matching file exists, False otherwise.
+    """
+    if not csensitive:
+        pattern = pattern.lower()
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            if fnmatch.fnmatchcase(name if csensitive else name.lower(), pattern):
+                return True
+    return False
+
+
 if __name__ == '__main__':
     print("This module is not callable")
     sys.exit(0)
@@ -0,0 +1,339 @@
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import sys
+import os
+import ast
+import json
+import array
+import atexit
+import socket
+import struct
+import traceback
+import threading
+import subprocess
+import importlib.util
+import executor
+from typing import NamedTuple
+
+# python migration unit: migrate.py defining migrate(env, context) function, see Pool
+UNIT_FILE = 'migrate.py'
+ENTRY_POINT = 'migrate'
+# rollback.py may roll its migration back in a worker the same way, see rollback.find_script
+ROLLBACK_UNIT_FILE = 'rollback.py'
+ROLLBACK_ENTRY_POINT = 'rollback'
+# code run by python interpreter of a worker, see work
+BOOTSTRAP = 'import sys; sys.path.insert(0, {0!r}); import workers; sys.path.pop(0); workers.work({1})'
+# length prefix of messages exchanged with workers
+HEADER = struct.Struct('!I')
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class Context(NamedTuple):
+    """
+    Second argument of migrate function of a unit.
+    """
+    migration_id: str
+    migration_dir: str
+    # pymigrate configuration, the same variables migrate.sh gets in its environment
+    config: dict
+    # kept by the worker between migrations, e.g. for database connections
+    cache: dict
+
+
+def is_unit(path: str, entry_point: str = ENTRY_POINT) -> bool:
+    """
+    Check whether python file :param path: is a unit, i.e. defines :param entry_point: function at module level.
+    Scripts without it are run as any other migrate or rollback executable.
+    """
+    try:
+        with open(path, 'rb') as f:
+            tree = ast.parse(f.read(), path)
+    except (OSError, SyntaxError, ValueError):
+        return False
+    return any(isinstance(node, ast.FunctionDef) and node.name == entry_point for node in tree.body)
+
+
+def find_unit(migration_dir: str, name: str = UNIT_FILE, entry_point: str = ENTRY_POINT) -> str:
+    """
+    :return: path to :param name: unit (migrate.py by default) of migration located at :param migration_dir:
+    or None if it has none.
+    """
+    path = os.path.join(migration_dir, name)
+    return path if os.path.isfile(path) and is_unit(path, entry_point) else None
+
+
+def exit_code_of(result) -> int:
+    """
+    Map what migrate function returned or passed to sys.exit to exit code: None, True and 0 mean success,
+    False means failure, integers are exit codes as they are. Anything else is printed and means failure,
+    as sys.exit does.
+    """
+    if result is None or result is True:
+        return 0
+    if result is False:
+        return 1
+    if isinstance(result, int):
+        return result
+    print(result, file=sys.stderr)
+    return 1
+
+
+def _send(sock: socket.socket, message: dict, fd: int = None):
+    data = json.dumps(message).encode()
+    data = HEADER.pack(len(data)) + data
+    ancillary = [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', [fd]))] if fd is not None else []
+    sent = sock.sendmsg([data], ancillary)
+    if sent < len(data):
+        sock.sendall(data[sent:])
+
+
+def _receive(sock: socket.socket) -> tuple:
+    """
+    :return: tuple of message and file descriptor passed along with it or None, (None, None) on EOF.
+    """
+    data, ancillary, _, _ = sock.recvmsg(HEADER.size, socket.CMSG_LEN(array.array('i').itemsize))
+    fds = array.array('i')
+    for level, kind, payload in ancillary:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(payload[:len(payload) - len(payload) % fds.itemsize])
+    while data and len(data) < HEADER.size:
+        chunk = sock.recv(HEADER.size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    if len(data) < HEADER.size:
+        return None, None
+    size, = HEADER.unpack(data)
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None, None
+        data += chunk
+    return json.loads(data.decode()), fds[0] if fds else None
+
+
+def _forget_modules(directory: str):
+    directory = os.path.join(os.path.realpath(directory), '')
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, '__file__', None)
+        if path and os.path.realpath(path).startswith(directory):
+            del sys.modules[name]
+
+
+def run_unit(path: str, migration_id: str, env: dict, cache: dict, entry_point: str = ENTRY_POINT) -> int:
+    """
+    Load unit :param path: and call its :param entry_point: function with environment name and Context. Process
+    environment is :param env: for the duration of the call, directory of the unit is prepended to sys.path, so it
+    may import modules next to it. Modules imported from the directory are forgotten afterwards, so units with
+    same-named helper modules don't get each other's ones, while modules imported from elsewhere stay warm.
+
+    :return: exit code, see exit_code_of. Exceptions are printed and mean failure.
+    """
+    migration_dir = os.path.dirname(path)
+    saved_environ = dict(os.environ)
+    os.environ.clear()
+    os.environ.update(env)
+    sys.path.insert(0, migration_dir)
+    try:
+        spec = importlib.util.spec_from_file_location('pymigrate_unit', path)
+        unit = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(unit)
+        return exit_code_of(getattr(unit, entry_point)(env.get('ENVIRONMENT', ''),
+                                                        Context(migration_id, migration_dir, dict(env), cache)))
+    except SystemExit as e:
+        return exit_code_of(e.code)
+    except Exception:
+        traceback.print_exc()
+        return 1
+    finally:
+        sys.path.remove(migration_dir)
+        _forget_modules(migration_dir)
+        os.environ.clear()
+        os.environ.update(saved_environ)
+
+
+def work(fd: int):
+    """
+    Main loop of a worker: import modules listed in WORKER_PRELOAD, then run units requested over socket
+    :param fd: one by one until pymigrate closes it. Output of every unit goes to the pipe passed along with
+    the request.
+    """
+    sock = socket.socket(fileno=fd)
+    for name in filter(None, (name.strip() for name in os.environ.get('WORKER_PRELOAD', '').split(','))):
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            print('Worker failed to preload {0}: {1}'.format(name, e), file=sys.stderr)
+    cache = {}
+    while True:
+        request, output_fd = _receive(sock)
+        if request is None:
+            break
+        saved = os.dup(1), os.dup(2)
+        os.dup2(output_fd, 1)
+        os.dup2(output_fd, 2)
+        os.close(output_fd)
+        try:
+            exit_code = run_unit(request['path'], request['migration_id'], request['env'], cache,
+                                 request.get('entry_point', ENTRY_POINT))
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            # restoring stdout and stderr closes the last copies of the pipe, so pymigrate sees EOF
+            for target, source in zip((1, 2), saved):
+                os.dup2(source, target)
+                os.close(source)
+        _send(sock, {'exit_code': exit_code})
+    sock.close()
+
+
+class Worker:
+    """
+    Python interpreter running units for pymigrate, see work. Worker is run in its own session, so it can be
+    cancelled the same way a shell running migrate.sh is.
+    """
+    def __init__(self, preload: str):
+        self._sock, theirs = socket.socketpair()
+        env = dict(os.environ, WORKER_PRELOAD=preload)
+        try:
+            self._child = subprocess.Popen([sys.executable, '-u', '-c',
+                                            BOOTSTRAP.format(os.path.dirname(os.path.abspath(__file__)),
+                                                             theirs.fileno())],
+                                           stdin=subprocess.DEVNULL, env=env, pass_fds=(theirs.fileno(),),
+                                           start_new_session=True)
+        finally:
+            theirs.close()
+
+    @property
+    def pid(self) -> int:
+        return self._child.pid
+
+    def alive(self) -> bool:
+        return self._child.poll() is None
+
+    def _wait(self) -> int:
+        try:
+            response, _ = _receive(self._sock)
+        except (OSError, ValueError):
+            response = None
+        if response is not None:
+            return response['exit_code']
+        # worker died, report the way shell reports a command killed by signal
+        exit_code = self._child.wait()
+        return 128 - exit_code if exit_code < 0 else exit_code
+
+    def run(self, path: str, migration_id: str, env: dict, sink=executor.write_stdout, timeout: float = 0,
+            grace: float = executor.KILL_GRACE, heartbeat=None, heartbeat_interval: float = 5.0,
+            entry_point: str = ENTRY_POINT) -> tuple:
+        """
+        Run :param entry_point: of unit :param path: of migration :param migration_id: with process environment
+        :param env:, see executor.run_streaming for the rest of parameters and return value.
+        """
+        if executor.wait_cancelled(0):
+            # pymigrate is shutting down, see executor.cancel_all
+            return executor.INTERRUPTED_EXIT_CODE, 0
+        read_fd, write_fd = os.pipe()
+        try:
+            _send(self._sock, {'path': os.path.abspath(path), 'migration_id': migration_id, 'env': env,
+                               'entry_point': entry_point}, write_fd)
+        except OSError:
+            os.close(read_fd)
+            raise
+        finally:
+            os.close(write_fd)
+        return executor.supervise(self._child, os.fdopen(read_fd, 'rb', 0), self._wait, sink, timeout, grace,
+                                  heartbeat, heartbeat_interval)
+
+    def close(self):
+        # worker exits once it reads EOF from the socket
+        self._sock.close()
+        try:
+            self._child.wait(executor.KILL_GRACE)
+        except subprocess.TimeoutExpired:
+            self._child.kill()
+            self._child.wait()
+
+
+class Pool:
+    """
+    Workers kept idle between migrations. Units are run by long-living workers instead of a shell, so modules
+    they import and connections they keep in context.cache stay warm between migrations. Up to :param size:
+    workers are started in advance by prewarm and kept, more are started when more units run concurrently.
+    """
+    def __init__(self, size: int, preload: str = ''):
+        self.size = size
+        self.preload = preload
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def prewarm(self):
+        with self._lock:
+            self._idle = [worker for worker in self._idle if worker.alive()]
+            while len(self._idle) < self.size:
+                self._idle.append(Worker(self.preload))
+
+    def acquire(self) -> Worker:
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.alive():
+                    return worker
+        return Worker(self.preload)
+
+    def release(self, worker: Worker):
+        with self._lock:
+            if worker.alive() and len(self._idle) < self.size:
+                self._idle.append(worker)
+                return
+        worker.close()
+
+    def run(self, path: str, migration_id: str, env: dict, *args, **kwargs) -> tuple:
+        """
+        Run unit on an idle worker, see Worker.run.
+        """
+        worker = self.acquire()
+        try:
+            return worker.run(path, migration_id, env, *args, **kwargs)
+        finally:
+            self.release(worker)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.close()
+
+
+def get_pool(config: dict) -> Pool:
+    """
+    Get pool shared by all migrations run by this process. It's created on first use with config['WORKERS']
+    workers (config['JOBS'] by default) importing comma-separated modules of config['WORKER_PRELOAD'] on start.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = Pool(int(config.get('WORKERS', config.get('JOBS', '1'))), config.get('WORKER_PRELOAD', ''))
+            atexit.register(shutdown)
+        return _pool
+
+
+def shutdown():
+    """
+    Stop idle workers of the shared pool.
+    """
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
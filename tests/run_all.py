@@ -1,4 +1,26 @@
 import test_util
+import test_scheduler
+import test_executor
+import test_store
+import test_migration
+import test_git
+import test_output
+import test_stats
+import test_profiling
+import test_logger
+import test_commands
+import test_scanner
+import test_checksum
+import test_fanout
+import test_daemon
+import test_retry
+import test_runlog
+import test_planner
+import test_rollback
+import test_lease
+import test_backends
+import test_baseline
+import test_workers
 
 __author__ = 'Maxim Styushin'
 __copyright__ = 'Copyright (c)2017, Maxim Styushin'
@@ -13,6 +35,28 @@ def main() -> unittest.TestSuite:
     # TODO: Add moar tests! and try to use TDD approach
     suite.addTest(test_util.TestUtilModule('test_get_formatted_env_vars'))
     suite.addTest(test_util.TestUtilModule('test_load_config_return_dict'))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(test_scheduler.TestSchedulerModule))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(test_executor.TestExecutorModule))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(test_store.TestStoreModule))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(test_migration.TestMigrationModule))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(test_git.TestGitModule))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(test_output.TestOutputModule))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(test_stats.TestStatsModule))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(test_profiling.TestProfilingModule))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(test_logger.TestLoggerModule))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(test_commands.TestCommandsModule))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(test_scanner.TestScannerModule))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(test_checksum.TestChecksumModule))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(test_fanout.TestFanoutModule))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(test_daemon.TestDaemonModule))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(test_retry.TestRetryModule))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(test_runlog.TestRunlogModule))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(test_planner.TestPlannerModule))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(test_rollback.TestRollbackModule))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(test_lease.TestLeaseModule))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(test_backends.TestBackendsModule))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(test_baseline.TestBaselineModule))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(test_workers.TestWorkersModule))
 
     return suite
 
@@ -0,0 +1,150 @@
+import unittest
+
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import os
+import shutil
+import tempfile
+import subprocess
+import backends
+import migration
+import store
+import logger
+import sys
+
+RUNNER = os.path.join(os.path.dirname(os.path.abspath(migration.__file__)), 'runner.py')
+
+
+def exercise(migration_store) -> list:
+    """
+    Change state of :param migration_store: the way pymigrate does and return everything read back.
+    """
+    pending = store.Status.PENDING
+    migration_store.add(store.MigrationRecord('{0}-m'.format(i), 'PENDING', 'PRESENT', 'master') for i in range(5))
+    migration_store.add([store.MigrationRecord('1-m', 'DONE', 'PRESENT', 'dev')])
+    migration_store.upsert([store.MigrationRecord('4-m', 'SKIP', 'PRESENT', 'dev', 'abc')])
+    with migration_store.transaction():
+        migration_store.set_statuses(['2-m', '3-m', 'missing'], store.Status.MANUAL)
+        migration_store.set_presence(['3-m'], 'ABSENT')
+    res = [migration_store.set_status('0-m', store.Status.FAILED, 'master', 'def'),
+           migration_store.set_status('missing', store.Status.DONE),
+           migration_store.claim('1-m', pending, 'a:1', 100.0, 160.0),
+           migration_store.claim('1-m', pending, 'b:2', 100.0, 160.0),
+           migration_store.renew_lease('1-m', 'b:2', 200.0),
+           migration_store.release('1-m', 'b:2', store.Status.FAILED),
+           migration_store.get_lease('1-m')]
+    run_id = migration_store.start_run('1-m', 100.0, 'dev', 'master', 'def', 42, 'host')
+    migration_store.heartbeat(run_id, 105.0)
+    res.append(list(migration_store.iterate_unfinished_runs()))
+    migration_store.finish_run(run_id, 110.0, 10.0, 0, 7)
+    res += [migration_store.release('1-m', 'a:1', store.Status.DONE, 'master', 'fed'),
+            migration_store.start_run('0-m', 120.0, 'test', attempt=2),
+            migration_store.start_run('0-m', 130.0, 'test', action=store.RUN_ROLLBACK),
+            migration_store.delete('2-m'),
+            migration_store.delete('2-m')]
+    migration_store.save_scans([store.ScanRecord('0-m', 1, 2, '', 'migrate.sh', '', 0),
+                                store.ScanRecord('1-m', 1, 3, 'README.md', '', '', 1)])
+    migration_store.save_scans([], ['1-m', 'missing'])
+    migration_store.save_file_hashes([store.FileHash('0-m/migrate.sh', 10, 1, 'aa'),
+                                      store.FileHash('0-mx/migrate.sh', 10, 1, 'bb')])
+    migration_store.set_migration_files('0-m', {'migrate.sh': 'aa'})
+    migration_store.set_migration_files('1-m', {})
+    res += [list(migration_store.iterate()),
+            list(migration_store.iterate(statuses=('PENDING', 'MANUAL', 'SKIP'), since='1-m', limit=2, offset=1)),
+            list(migration_store.iterate_runs()),
+            list(migration_store.iterate_runs('0-m', 'test')),
+            migration_store.get_last_runs(store.Status.DONE),
+            migration_store.get_scans(),
+            migration_store.get_file_hashes('0-m'),
+            migration_store.get_migration_files()]
+    res.insert(0, list(migration_store.iterate_runs('0-m', action=store.RUN_ROLLBACK)))
+    return res
+
+
+class TestBackendsModule(unittest.TestCase):
+    def setUp(self):
+        self.project_dir = tempfile.mkdtemp()
+        self.migrations_dir = os.path.join(self.project_dir, 'migrations')
+        os.makedirs(self.migrations_dir)
+        self.app_logger = logger.Logger(level=logger.Levels.ERROR)
+
+    def tearDown(self):
+        store.close_all()
+        store.use_backend('sqlite')
+        shutil.rmtree(self.project_dir)
+
+    def test_backends_behave_like_sqlite(self):
+        expected = exercise(store.open_store(self.migrations_dir, self.app_logger))
+        for backend in ('memory', 'journal'):
+            with self.subTest(backend=backend):
+                store.use_backend(backend)
+                self.assertFalse(store.exists(self.migrations_dir))
+                self.assertEqual(exercise(store.open_store(self.migrations_dir, self.app_logger)), expected)
+                self.assertTrue(store.exists(self.migrations_dir))
+        self.assertRaises(ValueError, store.use_backend, 'redis')
+
+    def test_journal_is_replayed_and_compacted(self):
+        path_to_journal = os.path.join(self.migrations_dir, 'migrations.journal')
+        journal = backends.JournalStore(path_to_journal, self.app_logger, compact_entries=1000)
+        expected = exercise(journal)
+        for _ in range(600):
+            journal.heartbeat(1, 105.0)
+        journal.close()
+        with open(path_to_journal, 'ab') as f:
+            f.write(b'["migration","5-m","PEND')
+
+        journal = backends.JournalStore(path_to_journal, self.app_logger, compact_entries=1000)
+        self.assertEqual(list(journal.iterate()), expected[-8])
+        self.assertEqual(list(journal.iterate_runs()), expected[-6])
+        for _ in range(600):
+            journal.heartbeat(1, 105.0)
+        with open(path_to_journal, 'rb') as f:
+            self.assertLess(len(f.read().splitlines()), 600)
+        journal.close()
+
+        journal = backends.JournalStore(path_to_journal, self.app_logger)
+        self.assertEqual(journal.get_migration_files(), expected[-1])
+        journal.close()
+        with open(path_to_journal, 'ab') as f:
+            f.write(b'["bogus"]\n')
+        self.assertRaises(store.StateError, backends.JournalStore, path_to_journal, self.app_logger)
+
+    def test_journal_shared_by_processes(self):
+        path_to_journal = os.path.join(self.migrations_dir, 'migrations.journal')
+        first = backends.JournalStore(path_to_journal, self.app_logger, compact_entries=0)
+        second = backends.JournalStore(path_to_journal, self.app_logger, compact_entries=0)
+        first.add([store.MigrationRecord('1-a', 'PENDING', 'PRESENT', 'master')])
+        self.assertTrue(second.claim('1-a', store.Status.PENDING, 'b:2', 100.0, 160.0))
+        # first compacts its journal on every write, second reads the replaced journal from the start
+        self.assertFalse(first.claim('1-a', store.Status.PENDING, 'a:1', 100.0, 160.0))
+        self.assertTrue(first.claim('1-a', store.Status.RUNNING, 'a:1', 200.0, 260.0))
+        self.assertFalse(second.renew_lease('1-a', 'b:2', 300.0))
+        self.assertEqual(second.get_lease('1-a'), ('a:1', 260.0))
+        first.close()
+        second.close()
+
+    def test_migrate_with_journal_backend(self):
+        for migration_id in ('1-a', '2-b'):
+            os.makedirs(os.path.join(self.migrations_dir, migration_id))
+            with open(os.path.join(self.migrations_dir, migration_id, 'migrate.sh'), 'w') as f:
+                f.write('#!/bin/sh\necho {0}\n'.format(migration_id))
+            os.chmod(os.path.join(self.migrations_dir, migration_id, 'migrate.sh'), 0o775)
+        with open(os.path.join(self.project_dir, 'pymigrate.conf'), 'w') as f:
+            f.write('MIGRATIONS_DIR=migrations\nSTATE_BACKEND=journal\n')
+
+        cmd = [sys.executable, RUNNER, '--log-level', 'ERROR', '--do', 'migrate', '--no-daemon',
+               '-d', self.project_dir + '/']
+        self.assertEqual(subprocess.call(cmd, cwd=self.project_dir, stdout=subprocess.DEVNULL), 0)
+        self.assertEqual(sorted(os.listdir(self.migrations_dir)),
+                         ['.logs', '1-a', '2-b', 'migrations.journal', 'migrations.journal.lock'])
+        store.use_backend('journal')
+        statuses = migration.get_statuses(store.state_path(self.migrations_dir), self.app_logger)
+        self.assertEqual(set(state[0] for state in statuses.values()), {'DONE'})
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
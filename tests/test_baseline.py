@@ -0,0 +1,161 @@
+import unittest
+
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import io
+import os
+import json
+import shutil
+import tarfile
+import tempfile
+import contextlib
+import subprocess
+import baseline
+import cli_commands
+import migration
+import scheduler
+import store
+import logger
+import sys
+
+RUNNER = os.path.join(os.path.dirname(os.path.abspath(migration.__file__)), 'runner.py')
+
+
+class TestBaselineModule(unittest.TestCase):
+    def setUp(self):
+        self.project_dir = tempfile.mkdtemp()
+        self.migrations_dir = os.path.join(self.project_dir, 'migrations')
+        self.applied = os.path.join(self.project_dir, 'applied')
+        for migration_id in ('1-a', '2-b', '3-c'):
+            os.makedirs(os.path.join(self.migrations_dir, migration_id))
+            path = os.path.join(self.migrations_dir, migration_id, 'migrate.sh')
+            with open(path, 'w') as f:
+                f.write('#!/bin/sh\necho {0} >> {1}\n'.format(migration_id, self.applied))
+            os.chmod(path, 0o775)
+        self.config = {'PROJECT_DIR': self.project_dir, 'MIGRATIONS_DIR': 'migrations', 'ENVIRONMENT': 'test',
+                       'MIGRATION_ID': '2-b'}
+        self.app_logger = logger.Logger(level=logger.Levels.ERROR)
+        migration.db_init(self.migrations_dir, self.app_logger)
+
+    def tearDown(self):
+        store.close_all()
+        shutil.rmtree(self.project_dir)
+
+    def statuses(self) -> dict:
+        migrations_dict = migration.get_statuses(os.path.join(self.migrations_dir, store.DB_FILE), self.app_logger)
+        return {migration_id: state[0] for migration_id, state in migrations_dict.items()}
+
+    def squash(self) -> bool:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return cli_commands.squash(self.config, self.app_logger)
+
+    def test_squash_folds_migrations_into_baseline(self):
+        migration_store = store.open_store(self.migrations_dir, self.app_logger)
+        migration_store.set_status('1-a', store.Status.DONE)
+        migration_store.set_status('2-b', store.Status.SKIP)
+        self.assertTrue(self.squash())
+
+        self.assertEqual(self.statuses(), {'.baseline': 'DONE', '3-c': 'PENDING'})
+        self.assertEqual(sorted(os.listdir(self.migrations_dir)), ['.baseline', '3-c', 'migrations.db'])
+        manifest = baseline.load(self.migrations_dir)
+        self.assertEqual(manifest.to, '2-b')
+        self.assertEqual(manifest.migrations, [baseline.Entry('1-a', 'DONE', 'migrate.sh'),
+                                               baseline.Entry('2-b', 'SKIP', 'migrate.sh')])
+        with tarfile.open(os.path.join(self.migrations_dir, '.baseline', baseline.BUNDLE_FILE)) as bundle:
+            self.assertIn('1-a/migrate.sh', bundle.getnames())
+            checksums = json.load(bundle.extractfile(baseline.CHECKSUMS_FILE))
+        self.assertEqual(sorted(checksums), ['1-a', '2-b'])
+        self.assertEqual(sorted(checksums['1-a']), ['migrate.sh'])
+        with open(os.path.join(self.migrations_dir, '.baseline', baseline.MIGRATE_FILE)) as f:
+            script = f.read()
+        self.assertIn('apply 1-a migrate.sh', script)
+        self.assertNotIn('apply 2-b', script)
+
+        # squashing again extends the baseline
+        migration_store.set_status('3-c', store.Status.DONE)
+        self.config['MIGRATION_ID'] = '3-c'
+        self.assertTrue(self.squash())
+        self.assertEqual(self.statuses(), {'.baseline': 'DONE'})
+        self.assertEqual(baseline.load(self.migrations_dir).ids, {'1-a', '2-b', '3-c'})
+        with tarfile.open(os.path.join(self.migrations_dir, '.baseline', baseline.BUNDLE_FILE)) as bundle:
+            self.assertEqual(sorted(json.load(bundle.extractfile(baseline.CHECKSUMS_FILE))), ['1-a', '2-b', '3-c'])
+            self.assertIn('1-a/migrate.sh', bundle.getnames())
+
+    def test_squash_follows_dependencies(self):
+        # 2-b runs after 3-c, while 3-c needs 1-a only
+        for migration_id, deps in (('2-b', '3-c'), ('3-c', '1-a')):
+            with open(os.path.join(self.migrations_dir, migration_id, scheduler.DEPENDS_ON_FILE), 'w') as f:
+                f.write(deps + '\n')
+        migration_store = store.open_store(self.migrations_dir, self.app_logger)
+        for migration_id in ('1-a', '2-b', '3-c'):
+            migration_store.set_status(migration_id, store.Status.DONE)
+        migrations_dict = migration.get_statuses(os.path.join(self.migrations_dir, store.DB_FILE), self.app_logger)
+        graph = scheduler.build_graph(sorted(migrations_dict), self.migrations_dir)
+        self.assertEqual(baseline.select(migrations_dict, self.migrations_dir, graph, '2-b'), ['1-a', '3-c', '2-b'])
+
+        self.config['MIGRATION_ID'] = '3-c'
+        self.assertTrue(self.squash())
+        self.assertEqual(self.statuses(), {'.baseline': 'DONE', '2-b': 'DONE'})
+        manifest = baseline.load(self.migrations_dir)
+        self.assertEqual((manifest.to, [entry.migration_id for entry in manifest.migrations]), ('3-c', ['1-a', '3-c']))
+
+    def test_squash_refuses_migrations_not_run(self):
+        store.open_store(self.migrations_dir, self.app_logger).set_status('1-a', store.Status.DONE)
+        self.assertFalse(self.squash())
+        self.config['MIGRATION_ID'] = '9-z'
+        self.assertFalse(self.squash())
+        self.assertIsNone(baseline.load(self.migrations_dir))
+        self.assertEqual(sorted(os.listdir(self.migrations_dir)), ['1-a', '2-b', '3-c', 'migrations.db'])
+
+    def test_fresh_environment_applies_baseline(self):
+        migration_store = store.open_store(self.migrations_dir, self.app_logger)
+        migration_store.set_status('1-a', store.Status.DONE)
+        migration_store.set_status('2-b', store.Status.DONE)
+        self.assertTrue(self.squash())
+        store.close_all()
+        os.remove(os.path.join(self.migrations_dir, store.DB_FILE))
+        with open(os.path.join(self.project_dir, 'pymigrate.conf'), 'w') as f:
+            f.write('MIGRATIONS_DIR=migrations\n')
+
+        cmd = [sys.executable, RUNNER, '--log-level', 'ERROR', '--do', 'migrate', '--no-daemon',
+               '-d', self.project_dir + '/']
+        self.assertEqual(subprocess.call(cmd, cwd=self.project_dir, stdout=subprocess.DEVNULL), 0)
+        with open(self.applied) as f:
+            self.assertEqual(f.read().split(), ['1-a', '2-b', '3-c'])
+        self.assertEqual(self.statuses(), {'.baseline': 'DONE', '3-c': 'DONE'})
+
+    def test_reconcile(self):
+        manifest = baseline.Manifest('2-b', [baseline.Entry('1-a', 'DONE', 'migrate.sh'),
+                                             baseline.Entry('2-b', 'SKIP', 'migrate.sh')], 0.0, 'master', 'abc')
+
+        def state(statuses: dict) -> dict:
+            return {migration_id: store.MigrationRecord(migration_id, status, 'PRESENT', 'master')
+                    for migration_id, status in statuses.items()}
+
+        self.assertEqual(baseline.reconcile(manifest, {}), ('PENDING', set()))
+        self.assertEqual(baseline.reconcile(manifest, state({'1-a': 'PENDING'})), ('PENDING', {'1-a'}))
+        self.assertEqual(baseline.reconcile(manifest, state({'1-a': 'DONE', '2-b': 'SKIP'})), ('DONE', {'1-a', '2-b'}))
+        self.assertEqual(baseline.reconcile(manifest, state({'1-a': 'DONE'})), ('MANUAL', set()))
+        self.assertEqual(baseline.reconcile(manifest, state({'1-a': 'DONE', '2-b': 'FAILED'})), ('MANUAL', set()))
+        self.assertEqual(baseline.reconcile(manifest, state({'.baseline': 'PENDING'})), (None, set()))
+        self.assertEqual(baseline.reconcile(manifest, state({'.baseline': 'DONE', '1-a': 'DONE'})), (None, {'1-a'}))
+        self.assertEqual(baseline.reconcile(manifest, state({'.baseline': 'DONE', '1-a': 'FAILED'})),
+                         ('MANUAL', set()))
+
+    def test_dependencies_on_squashed_migrations(self):
+        migration_store = store.open_store(self.migrations_dir, self.app_logger)
+        migration_store.set_status('1-a', store.Status.DONE)
+        with open(os.path.join(self.migrations_dir, '3-c', scheduler.DEPENDS_ON_FILE), 'w') as f:
+            f.write('1-a\n')
+        self.config['MIGRATION_ID'] = '1-a'
+        self.assertTrue(self.squash())
+        graph = scheduler.build_graph(['.baseline', '2-b', '3-c'], self.migrations_dir)
+        self.assertEqual(graph, {'.baseline': set(), '2-b': {'.baseline'}, '3-c': {'.baseline'}})
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
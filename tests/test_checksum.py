@@ -0,0 +1,82 @@
+import unittest
+
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import os
+import shutil
+import hashlib
+import tempfile
+import checksum
+import store
+import logger
+import sys
+
+# mtime far enough in the past to be trusted by hash cache
+OLD = 1500000000
+
+
+class TestChecksumModule(unittest.TestCase):
+    def setUp(self):
+        self.migrations_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.migrations_dir, '1-a'))
+        self.write('1-a/migrate.sh', b'#!/bin/sh\nexit 0\n')
+        self.write('1-a/README.md', b'docs')
+        self.migration_store = store.open_store(self.migrations_dir, logger.Logger(level=logger.Levels.ERROR))
+        self.migration_store.add([store.MigrationRecord('1-a', store.Status.DONE.name, 'PRESENT', 'master')])
+        self.hashed = []
+        self.hash_file = checksum.hash_file
+
+        def hash_file(path):
+            self.hashed.append(os.path.basename(path))
+            return self.hash_file(path)
+
+        checksum.hash_file = hash_file
+
+    def tearDown(self):
+        checksum.hash_file = self.hash_file
+        store.close_all()
+        shutil.rmtree(self.migrations_dir)
+
+    def write(self, path: str, content: bytes, mtime: int = OLD):
+        with open(os.path.join(self.migrations_dir, path), 'wb') as f:
+            f.write(content)
+        os.utime(os.path.join(self.migrations_dir, path), (mtime, mtime))
+
+    def test_hash_file(self):
+        content = os.urandom(3 * 1024)
+        self.write('1-a/data.bin', content)
+        path = os.path.join(self.migrations_dir, '1-a/data.bin')
+        self.assertEqual(self.hash_file(path), hashlib.sha256(content).hexdigest())
+        mmap_threshold = checksum.MMAP_THRESHOLD
+        checksum.MMAP_THRESHOLD = 1024
+        try:
+            self.assertEqual(self.hash_file(path), hashlib.sha256(content).hexdigest())
+        finally:
+            checksum.MMAP_THRESHOLD = mmap_threshold
+
+    def test_unchanged_files_are_not_hashed_again(self):
+        hashes = checksum.record(self.migrations_dir, '1-a', self.migration_store)
+        self.assertEqual(sorted(hashes), ['migrate.sh'])
+        self.assertEqual(self.hashed, ['migrate.sh'])
+        self.hashed.clear()
+        self.assertEqual(list(checksum.find_drift(self.migrations_dir, self.migration_store)), [])
+        self.assertEqual(self.hashed, [])
+
+    def test_find_drift(self):
+        checksum.record(self.migrations_dir, '1-a', self.migration_store)
+        self.write('1-a/migrate.sh', b'#!/bin/sh\nexit 1\n', OLD + 1)
+        self.write('1-a/extra.sql', b'')
+        self.write('1-a/README.md', b'more docs', OLD + 1)
+        self.assertEqual(list(checksum.find_drift(self.migrations_dir, self.migration_store, '1-a')),
+                         [('1-a', 'DONE', 'extra.sql', 'added'), ('1-a', 'DONE', 'migrate.sh', 'modified')])
+        os.remove(os.path.join(self.migrations_dir, '1-a/migrate.sh'))
+        self.assertIn(('1-a', 'DONE', 'migrate.sh', 'removed'),
+                      list(checksum.find_drift(self.migrations_dir, self.migration_store)))
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
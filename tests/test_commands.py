@@ -0,0 +1,55 @@
+import unittest
+
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import io
+import os
+import shutil
+import tempfile
+import contextlib
+import subprocess
+import commands
+import cli_commands
+import store
+import logger
+import sys
+
+
+class TestCommandsModule(unittest.TestCase):
+    def test_registry_points_to_actions(self):
+        for command in commands.COMMANDS:
+            self.assertIs(commands.get(command.name), getattr(cli_commands, command.function))
+        self.assertNotIn('os', commands.names())
+        self.assertRaises(KeyError, commands.get, 'sys')
+
+    def test_runner_imports_are_lazy(self):
+        pymigrate_dir = os.path.dirname(os.path.abspath(commands.__file__))
+        code = 'import sys, runner; print(" ".join(sorted(sys.modules)))'
+        modules = subprocess.check_output([sys.executable, '-c', code], cwd=pymigrate_dir).decode().split()
+        for heavy in ('cli_commands', 'migration', 'sqlite3', 'subprocess'):
+            self.assertNotIn(heavy, modules)
+
+    def test_status_rejects_unknown_status(self):
+        project_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(project_dir, 'migrations', '1-a'))
+        config = {'PROJECT_DIR': project_dir, 'MIGRATIONS_DIR': 'migrations', 'ENVIRONMENT': 'dev',
+                  'OUTPUT_FORMAT': 'csv'}
+        app_logger = logger.Logger(level=logger.Levels.ERROR)
+        try:
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                self.assertTrue(cli_commands.status(dict(config, STATUS_FILTER='pending, done'), app_logger))
+                self.assertFalse(cli_commands.status(dict(config, STATUS_FILTER='PENDING,DONEE'), app_logger))
+            self.assertEqual(out.getvalue().split(), ['migration_id,status,presence,branch,commit',
+                                                      '1-a,PENDING,PRESENT,unknown,unknown'])
+        finally:
+            store.close_all()
+            shutil.rmtree(project_dir)
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
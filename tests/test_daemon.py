@@ -0,0 +1,114 @@
+import unittest
+
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import io
+import os
+import json
+import time
+import socket
+import shutil
+import tempfile
+import subprocess
+import daemon
+import fanout
+import logger
+import sys
+
+
+class TestDaemonModule(unittest.TestCase):
+    def setUp(self):
+        self.project_dir = os.path.realpath(tempfile.mkdtemp())
+        os.makedirs(os.path.join(self.project_dir, 'migrations', '1-a'))
+        self.app_logger = logger.Logger(level=logger.Levels.ERROR)
+        self.config = {'PROJECT_DIR': self.project_dir, 'MIGRATIONS_DIR': './migrations', 'ENVIRONMENT': 'dev',
+                       'MIGRATION_ID': 'None', 'JOBS': '1', 'OUTPUT_FORMAT': 'text', 'STATUS_FILTER': 'None',
+                       'SINCE': 'None', 'LIMIT': '0', 'OFFSET': '0', 'STATE_BACKEND': 'sqlite',
+                       'STATE_DB_FILE': 'migrations.db'}
+        self.path = daemon.socket_path(self.project_dir, 'dev')
+
+    def tearDown(self):
+        shutil.rmtree(self.project_dir)
+
+    def start_daemon(self) -> subprocess.Popen:
+        child = subprocess.Popen([sys.executable, fanout.RUNNER, '--log-level', 'ERROR', '--do', 'serve'],
+                                 cwd=self.project_dir, stdout=subprocess.DEVNULL)
+        deadline = time.monotonic() + 10
+        while not daemon.request_is_answered(self.path):
+            self.assertLess(time.monotonic(), deadline, 'daemon did not start')
+            self.assertIsNone(child.poll())
+            time.sleep(0.05)
+        return child
+
+    def request(self, action: str, **overrides) -> tuple:
+        config = dict(self.config, **overrides)
+        out = io.StringIO()
+        return daemon.request(self.path, action, config, out, self.app_logger), out.getvalue()
+
+    def test_socket_path(self):
+        self.assertEqual(self.path, os.path.join(self.project_dir, '.pymigrate.dev.sock'))
+        long_path = daemon.socket_path(os.path.join(self.project_dir, 'x' * daemon.MAX_SOCKET_PATH), 'dev')
+        self.assertEqual(os.path.dirname(long_path), tempfile.gettempdir())
+
+    def test_request_without_daemon(self):
+        self.assertIsNone(self.request('status')[0])
+
+    def test_serve(self):
+        child = self.start_daemon()
+        try:
+            self.assertEqual(self.request('done', MIGRATION_ID='1-a')[0], True)
+            res, out = self.request('status', OUTPUT_FORMAT='csv')
+            self.assertTrue(res)
+            self.assertIn('1-a,DONE,PRESENT', out)
+            # daemon serves only environment and project it was started for
+            self.assertFalse(self.request('status', ENVIRONMENT='prod')[0])
+            self.assertFalse(self.request('done', MIGRATION_ID='1-a', STATE_DB_FILE='migrations.dev.db')[0])
+            self.assertFalse(self.request('status', STATE_BACKEND='journal')[0])
+            # client choosing a state of its own doesn't get it from daemon
+            cmd = [sys.executable, fanout.RUNNER, '--log-level', 'ERROR', '--do', 'pending', '-m', '1-a',
+                   '--state-per-environment']
+            self.assertEqual(subprocess.call(cmd, cwd=self.project_dir, stderr=subprocess.DEVNULL), 1)
+            self.assertIn('1-a,DONE,PRESENT', self.request('status', OUTPUT_FORMAT='csv')[1])
+            self.assertFalse(self.request('verify')[0])
+        finally:
+            child.terminate()
+            self.assertEqual(child.wait(10), 0)
+        self.assertFalse(os.path.exists(self.path))
+        self.assertIsNone(self.request('status')[0])
+
+    def test_client_going_away_fails_migration(self):
+        path = os.path.join(self.project_dir, 'migrations', '1-a', 'migrate.sh')
+        with open(path, 'w') as f:
+            f.write('#!/bin/sh\necho started\nsleep 1\necho more\nsleep 30\n')
+        os.chmod(path, 0o775)
+        child = self.start_daemon()
+        try:
+            started = time.monotonic()
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock, sock.makefile('rwb') as f:
+                sock.connect(self.path)
+                f.write(json.dumps({'action': 'migrate', 'config': self.config}).encode() + b'\n')
+                f.flush()
+                for line in f:
+                    if json.loads(line.decode()).get('out') == 'started\n':
+                        break
+            # daemon notices the client is gone on the next line of output and cancels the migration
+            deadline = time.monotonic() + 10
+            while True:
+                res, out = self.request('status', OUTPUT_FORMAT='csv')
+                if '1-a,RUNNING' not in out:
+                    break
+                self.assertLess(time.monotonic(), deadline, 'migration is still RUNNING')
+                time.sleep(0.1)
+            self.assertIn('1-a,FAILED,PRESENT', out)
+            self.assertLess(time.monotonic() - started, 20)
+        finally:
+            child.terminate()
+            self.assertEqual(child.wait(10), 0)
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
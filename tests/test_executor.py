@@ -0,0 +1,69 @@
+import unittest
+
+import os
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import time
+import executor
+import sys
+
+
+class TestExecutorModule(unittest.TestCase):
+    def test_run_streaming_forwards_lines(self):
+        lines = []
+        exit_code, output_bytes = executor.run_streaming('echo one; echo two >&2; printf three; exit 3',
+                                                         dict(os.environ), lines.append)
+        self.assertEqual(exit_code, 3)
+        self.assertEqual(lines, [b'one\n', b'two\n', b'three\n'])
+        self.assertEqual(output_bytes, len(b'one\ntwo\nthree'))
+
+    def test_run_streaming_splits_long_lines(self):
+        lines = []
+        executor.run_streaming('head -c {0} /dev/zero'.format(executor.CHUNK_SIZE * 3), dict(os.environ),
+                               lines.append)
+        self.assertTrue(all(len(line) <= executor.CHUNK_SIZE * 2 for line in lines))
+        self.assertEqual(b''.join(lines).rstrip(b'\n'), b'\0' * (executor.CHUNK_SIZE * 3))
+
+    def test_run_streaming_timeout_kills_process_group(self):
+        lines = []
+        beats = []
+        started = time.monotonic()
+        # background child inherits output pipe, so streaming only ends once it is killed too
+        exit_code, _ = executor.run_streaming('trap "" TERM; sleep 30 & echo started; wait', dict(os.environ),
+                                              lines.append, timeout=0.3, grace=0.2,
+                                              heartbeat=lambda: beats.append(1), heartbeat_interval=0.1)
+        self.assertEqual(exit_code, executor.TIMEOUT_EXIT_CODE)
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(lines, [b'started\n'])
+        self.assertGreaterEqual(len(beats), 1)
+        self.assertEqual(executor._running, {})
+
+    def test_run_streaming_returns_once_command_exits(self):
+        lines = []
+        started = time.monotonic()
+        # background child keeps the output pipe open long after the command itself exits
+        exit_code, _ = executor.run_streaming('echo hi; sleep 5 & echo bye', dict(os.environ), lines.append)
+        self.assertEqual(exit_code, 0)
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(lines, [b'hi\n', b'bye\n'])
+
+    def test_nothing_is_started_after_cancel_all(self):
+        executor.cancel_all(0)
+        try:
+            self.assertEqual(executor.run_streaming('echo started', dict(os.environ), [].append),
+                             (executor.INTERRUPTED_EXIT_CODE, 0))
+        finally:
+            executor._cancelling.clear()
+
+    def test_prefixed(self):
+        lines = []
+        executor.prefixed('[m] ', lines.append)(b'text\n')
+        self.assertEqual(lines, [b'[m] text\n'])
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
@@ -0,0 +1,128 @@
+import unittest
+
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import io
+import os
+import json
+import shutil
+import tempfile
+import contextlib
+import fanout
+import migration
+import store
+import logger
+import output
+import util
+import sys
+
+
+class TestFanoutModule(unittest.TestCase):
+    def setUp(self):
+        self.project_dir = tempfile.mkdtemp()
+        self.migrations_dir = os.path.join(self.project_dir, 'migrations')
+        os.makedirs(os.path.join(self.migrations_dir, '1-a'))
+        self.app_logger = logger.Logger(level=logger.Levels.ERROR)
+
+    def tearDown(self):
+        shutil.rmtree(self.project_dir)
+
+    def statuses(self, db_file: str) -> dict:
+        shared = store.DB_FILE
+        store.use_db_file(db_file)
+        try:
+            migrations_dict = migration.get_statuses(os.path.join(self.migrations_dir, db_file), self.app_logger)
+        finally:
+            store.close_all()
+            store.use_db_file(shared)
+        return {migration_id: state[0] for migration_id, state in migrations_dict.items()}
+
+    def test_parse_environments(self):
+        self.assertEqual(util.parse_environments('test, staging,test'), ['test', 'staging'])
+        self.assertRaises(ValueError, util.parse_environments, 'test,')
+        self.assertRaises(ValueError, util.parse_environments, '../prod')
+
+    def test_fan_out_keeps_state_per_environment(self):
+        lines = []
+        argv = ['--log-level', 'ERROR', '--do', 'status', '-e', 'test,staging']
+        summary = io.StringIO()
+        cwd = os.getcwd()
+        os.chdir(self.project_dir)
+        try:
+            with contextlib.redirect_stdout(summary):
+                self.assertTrue(fanout.fan_out(['test', 'staging'], argv, 2, self.app_logger, lines.append))
+        finally:
+            os.chdir(cwd)
+
+        self.assertTrue(store.has_environment_state(self.migrations_dir, 'test'))
+        self.assertTrue(store.has_environment_state(self.migrations_dir, 'staging'))
+        self.assertFalse(os.path.isfile(os.path.join(self.migrations_dir, 'migrations.db')))
+        self.assertIn(b'[staging] Migration summary on environment staging:\n', lines)
+        self.assertTrue(any(line.startswith(b'[test] 1-a ') for line in lines))
+        self.assertIn('Environments summary', summary.getvalue())
+
+    def test_fan_out_merges_documents(self):
+        argv = ['--do', 'status', '-e', 'test,staging', '--format', 'json']
+        out, err = io.StringIO(), io.TextIOWrapper(io.BytesIO())
+        cwd = os.getcwd()
+        os.chdir(self.project_dir)
+        try:
+            with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+                self.assertTrue(fanout.fan_out(['test', 'staging'], argv, 2, self.app_logger, fmt='json'))
+        finally:
+            os.chdir(cwd)
+
+        records = json.loads(out.getvalue())
+        self.assertEqual([(record['environment'], record['migration_id']) for record in records],
+                         [('test', '1-a'), ('staging', '1-a')])
+        self.assertEqual(list(records[0])[:2], ['environment', 'migration_id'])
+        err.flush()
+        self.assertIn(b'Environments summary', err.buffer.getvalue())
+        self.assertIn(b'[staging] ', err.buffer.getvalue())
+
+    def test_parse_document(self):
+        columns, rows = ('migration_id', 'status'), [('1-a', 'DONE'), ('2-b', None)]
+        for fmt in ('json', 'ndjson'):
+            text = io.StringIO()
+            output.write_rows(columns, rows, fmt, text)
+            self.assertEqual(fanout.parse_document(text.getvalue(), fmt), (columns, rows))
+        self.assertEqual(fanout.parse_document('migration_id,status\n1-a,DONE\n', 'csv'), (columns, [('1-a', 'DONE')]))
+        self.assertEqual(fanout.parse_document('[]\n', 'json'), ((), []))
+        self.assertRaises(ValueError, fanout.parse_document, 'Migration summary:\n', 'json')
+        self.assertRaises(ValueError, fanout.parse_document, '{"a": 1}\n', 'json')
+        self.assertRaises(ValueError, fanout.parse_document, '', 'csv')
+
+    def test_fan_out_keeps_shared_state(self):
+        applied = os.path.join(self.project_dir, 'applied')
+        path = os.path.join(self.migrations_dir, '1-a', 'migrate.sh')
+        with open(path, 'w') as f:
+            f.write('#!/bin/sh\necho $ENVIRONMENT >> {0}\n'.format(applied))
+        os.chmod(path, 0o775)
+        os.makedirs(os.path.join(self.migrations_dir, '2-b'))
+        shutil.copy(path, os.path.join(self.migrations_dir, '2-b'))
+        migration.db_init(self.migrations_dir, self.app_logger)
+        store.open_store(self.migrations_dir, self.app_logger).set_status('1-a', store.Status.DONE)
+        store.close_all()
+
+        argv = ['--log-level', 'ERROR', '--do', 'migrate', '--no-daemon', '-e', 'test,staging']
+        cwd = os.getcwd()
+        os.chdir(self.project_dir)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.assertTrue(fanout.fan_out(['test', 'staging'], argv, 2, self.app_logger, lambda line: None))
+        finally:
+            os.chdir(cwd)
+
+        with open(applied) as f:
+            self.assertEqual(sorted(f.read().split()), ['staging', 'test'])
+        self.assertEqual(self.statuses(store.environment_db_file('test')), {'1-a': 'DONE', '2-b': 'DONE'})
+        self.assertEqual(self.statuses(store.environment_db_file('staging')), {'1-a': 'DONE', '2-b': 'DONE'})
+        self.assertEqual(self.statuses(store.DB_FILE), {'1-a': 'DONE', '2-b': 'PENDING'})
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
@@ -0,0 +1,68 @@
+import unittest
+
+import os
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import shutil
+import tempfile
+import git
+import sys
+
+SHA_MASTER = 'a' * 40
+SHA_FEATURE = 'b' * 40
+
+
+class TestGitModule(unittest.TestCase):
+    def setUp(self):
+        self.project_dir = tempfile.mkdtemp()
+        self.git_dir = os.path.join(self.project_dir, '.git')
+        os.makedirs(os.path.join(self.git_dir, 'refs', 'heads'))
+        os.makedirs(os.path.join(self.project_dir, 'migrations'))
+        with open(os.path.join(self.git_dir, 'refs', 'heads', 'master'), 'w') as f:
+            f.write(SHA_MASTER + '\n')
+        with open(os.path.join(self.git_dir, 'packed-refs'), 'w') as f:
+            f.write('# pack-refs with: peeled fully-peeled sorted\n')
+            f.write('{0} refs/heads/feature/x\n'.format(SHA_FEATURE))
+        self.checkout('ref: refs/heads/master')
+
+    def tearDown(self):
+        shutil.rmtree(self.project_dir)
+
+    def checkout(self, head: str):
+        with open(os.path.join(self.git_dir, 'HEAD'), 'w') as f:
+            f.write(head + '\n')
+        # make sure HEAD mtime changes even on filesystems with coarse timestamps
+        stat = os.stat(os.path.join(self.git_dir, 'HEAD'))
+        os.utime(os.path.join(self.git_dir, 'HEAD'), ns=(stat.st_atime_ns, stat.st_mtime_ns + len(head)))
+
+    def test_get_head_reads_loose_ref(self):
+        migrations_dir = os.path.join(self.project_dir, 'migrations')
+        self.assertEqual(git.get_head(migrations_dir), ('master', SHA_MASTER))
+        self.assertEqual(git.get_branch(migrations_dir), 'master')
+        self.assertEqual(git.get_commit(migrations_dir), SHA_MASTER)
+
+    def test_get_head_reads_packed_refs_after_checkout(self):
+        self.assertEqual(git.get_head(self.project_dir), ('master', SHA_MASTER))
+        self.checkout('ref: refs/heads/feature/x')
+        self.assertEqual(git.get_head(self.project_dir), ('feature/x', SHA_FEATURE))
+
+    def test_new_commit_on_current_branch(self):
+        self.assertEqual(git.get_head(self.project_dir), ('master', SHA_MASTER))
+        # commit rewrites the branch ref only, HEAD stays intact
+        with open(os.path.join(self.git_dir, 'refs', 'heads', 'master.lock'), 'w') as f:
+            f.write(SHA_FEATURE + '\n')
+        os.replace(os.path.join(self.git_dir, 'refs', 'heads', 'master.lock'),
+                   os.path.join(self.git_dir, 'refs', 'heads', 'master'))
+        self.assertEqual(git.get_commit(self.project_dir), SHA_FEATURE)
+
+    def test_detached_head(self):
+        self.checkout(SHA_FEATURE)
+        self.assertEqual(git.get_head(self.project_dir), ('unknown', SHA_FEATURE))
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
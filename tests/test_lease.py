@@ -0,0 +1,82 @@
+import unittest
+
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import os
+import time
+import shutil
+import tempfile
+import subprocess
+import lease
+import migration
+import store
+import logger
+import sys
+
+RUNNER = os.path.join(os.path.dirname(os.path.abspath(migration.__file__)), 'runner.py')
+
+
+class TestLeaseModule(unittest.TestCase):
+    def setUp(self):
+        self.project_dir = tempfile.mkdtemp()
+        self.migrations_dir = os.path.join(self.project_dir, 'migrations')
+        os.makedirs(os.path.join(self.migrations_dir, '1-a'))
+        self.app_logger = logger.Logger(level=logger.Levels.ERROR)
+
+    def tearDown(self):
+        store.close_all()
+        shutil.rmtree(self.project_dir)
+
+    def test_claim_is_compare_and_set_with_expiring_lease(self):
+        migration.db_init(self.migrations_dir, self.app_logger)
+        migration_store = store.open_store(self.migrations_dir, self.app_logger)
+        pending = store.Status.PENDING
+        self.assertEqual(lease.claim(migration_store, '1-a', pending, 'a:1', 60), (lease.Claim.CLAIMED, 'RUNNING'))
+        self.assertEqual(lease.claim(migration_store, '1-a', pending, 'b:2', 60), (lease.Claim.BUSY, 'RUNNING'))
+        self.assertFalse(migration_store.claim('1-a', store.Status.RUNNING, 'b:2', time.time(), time.time() + 60))
+        self.assertTrue(migration_store.renew_lease('1-a', 'a:1', time.time() - 1))
+
+        # lease of a:1 has expired, so b:2 takes the migration over and a:1 can't touch it anymore
+        self.assertTrue(migration_store.claim('1-a', store.Status.RUNNING, 'b:2', time.time(), time.time() + 60))
+        self.assertFalse(migration_store.renew_lease('1-a', 'a:1', time.time() + 60))
+        self.assertFalse(migration_store.release('1-a', 'a:1', store.Status.FAILED))
+        self.assertEqual(migration_store.get_lease('1-a')[0], 'b:2')
+        self.assertTrue(migration_store.release('1-a', 'b:2', store.Status.DONE))
+        self.assertIsNone(migration_store.get_lease('1-a'))
+        self.assertEqual(lease.claim(migration_store, '1-a', pending, 'c:3', 60), (lease.Claim.DONE, 'DONE'))
+        migration_store.set_status('1-a', store.Status.FAILED)
+        self.assertEqual(lease.claim(migration_store, '1-a', pending, 'c:3', 60), (lease.Claim.CHANGED, 'FAILED'))
+
+    def test_processes_sharing_database_run_every_migration_once(self):
+        ran = os.path.join(self.project_dir, 'ran')
+        for migration_id in ('1-a', '2-b', '3-c', '4-d'):
+            migration_dir = os.path.join(self.migrations_dir, migration_id)
+            os.makedirs(migration_dir, exist_ok=True)
+            open(os.path.join(migration_dir, 'depends_on'), 'w').close()
+            with open(os.path.join(migration_dir, 'migrate.sh'), 'w') as f:
+                f.write('#!/bin/sh\nsleep 0.5\necho {0} >> {1}\n'.format(migration_id, ran))
+            os.chmod(os.path.join(migration_dir, 'migrate.sh'), 0o775)
+        with open(os.path.join(self.migrations_dir, '4-d', 'depends_on'), 'w') as f:
+            f.write('1-a\n')
+        migration.db_init(self.migrations_dir, self.app_logger)
+
+        cmd = [sys.executable, RUNNER, '--log-level', 'ERROR', '--do', 'migrate', '--cluster', '--no-daemon']
+        workers = [subprocess.Popen(cmd, cwd=self.project_dir, stdout=subprocess.DEVNULL,
+                                    env=dict(os.environ, CLAIM_RETRY_INTERVAL='0.1')) for _ in range(3)]
+        self.assertEqual([worker.wait(60) for worker in workers], [0, 0, 0])
+
+        with open(ran) as f:
+            self.assertEqual(sorted(f.read().split()), ['1-a', '2-b', '3-c', '4-d'])
+        statuses = migration.get_statuses(os.path.join(self.migrations_dir, store.DB_FILE), self.app_logger)
+        self.assertEqual(set(state[0] for state in statuses.values()), {'DONE'})
+        runs = list(store.open_store(self.migrations_dir, self.app_logger).iterate_runs())
+        self.assertEqual(len(runs), 4)
+        self.assertGreater(len(set(run.pid for run in runs)), 1)
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
@@ -0,0 +1,64 @@
+import unittest
+
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import os
+import json
+import shutil
+import tempfile
+import logger
+import sys
+
+
+class Exploding:
+    def __format__(self, format_spec):
+        raise AssertionError('filtered message must not be formatted')
+
+
+class TestLoggerModule(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path_to_log = os.path.join(self.tmp_dir, 'pymigrate.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_filtered_message_is_not_formatted(self):
+        app_logger = logger.Logger(level=logger.Levels.ERROR)
+        self.assertEqual(app_logger.log_with_ts('value: {0}', logger.Levels.DEBUG, Exploding()), 0)
+        self.assertEqual(app_logger.log_plain('value: {0}', logger.Levels.DEBUG, Exploding()), 0)
+        self.assertFalse(app_logger.is_enabled(logger.Levels.DEBUG))
+
+    def test_text_file(self):
+        app_logger = logger.Logger(self.path_to_log, level=logger.Levels.INFO)
+        app_logger.log_with_ts('Deleted {0}', logger.Levels.WARNING, '1-a')
+        app_logger.log_plain('plain', logger.Levels.INFO)
+        app_logger.close()
+        with open(self.path_to_log) as f:
+            lines = f.read().splitlines()
+        self.assertTrue(lines[0].endswith('] WARNING: Deleted 1-a'))
+        self.assertEqual(lines[1], '[INFO] plain')
+
+    def test_json_lines_flushed_in_background(self):
+        app_logger = logger.Logger(self.path_to_log, level=logger.Levels.DEBUG, fmt='json', flush_interval=0.01)
+        app_logger.log_with_ts('Opening {0}', logger.Levels.DEBUG, 'migrations.db')
+        for _ in range(100):
+            with open(self.path_to_log) as f:
+                content = f.read()
+            if content:
+                break
+            app_logger._stop.wait(0.01)
+        app_logger.close()
+        record = json.loads(content)
+        self.assertEqual((record['level'], record['msg']), ('DEBUG', 'Opening migrations.db'))
+
+    def test_invalid_format(self):
+        self.assertRaises(ValueError, logger.Logger, None, logger.Levels.INFO, 'xml')
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
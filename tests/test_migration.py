@@ -0,0 +1,172 @@
+import unittest
+
+import os
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import io
+import gzip
+import time
+import shutil
+import contextlib
+import tempfile
+import subprocess
+import executor
+import migration
+import retry
+import runlog
+import store
+import logger
+import sys
+
+
+class TestMigrationModule(unittest.TestCase):
+    def setUp(self):
+        self.project_dir = tempfile.mkdtemp()
+        self.migrations_dir = os.path.join(self.project_dir, 'migrations')
+        os.makedirs(os.path.join(self.migrations_dir, '1-a'))
+        os.makedirs(os.path.join(self.migrations_dir, '2-b'))
+        os.makedirs(os.path.join(self.migrations_dir, '.hidden'))
+        self.config = {'PROJECT_DIR': self.project_dir, 'MIGRATIONS_DIR': 'migrations'}
+        self.app_logger = logger.Logger(level=logger.Levels.ERROR)
+
+    def tearDown(self):
+        store.close_all()
+        shutil.rmtree(self.project_dir)
+
+    def statuses(self) -> dict:
+        return migration.get_statuses(os.path.join(self.migrations_dir, store.DB_FILE), self.app_logger)
+
+    def test_db_init_is_idempotent(self):
+        migration.db_init(self.migrations_dir, self.app_logger)
+        migration.db_init(self.migrations_dir, self.app_logger)
+        self.assertEqual(sorted(self.statuses()), ['1-a', '2-b'])
+
+    def test_db_update_syncs_presence_and_readme(self):
+        migration.db_init(self.migrations_dir, self.app_logger)
+        shutil.rmtree(os.path.join(self.migrations_dir, '1-a'))
+        os.mkdir(os.path.join(self.migrations_dir, '3-c'))
+        open(os.path.join(self.migrations_dir, '3-c', 'ReadMe.txt'), 'w').close()
+        migration.db_update(self.config, self.app_logger)
+        statuses = self.statuses()
+        self.assertEqual(statuses['1-a'][:2], ('PENDING', 'ABSENT'))
+        self.assertEqual(statuses['3-c'][:2], ('MANUAL', 'PRESENT'))
+
+        os.mkdir(os.path.join(self.migrations_dir, '1-a'))
+        migration.db_update(self.config, self.app_logger)
+        self.assertEqual(self.statuses()['1-a'][:2], ('PENDING', 'PRESENT'))
+
+    def test_db_update_keeps_final_statuses(self):
+        migration.db_init(self.migrations_dir, self.app_logger)
+        migration.set_status_done('2-b', self.app_logger, self.migrations_dir)
+        open(os.path.join(self.migrations_dir, '2-b', 'README.md'), 'w').close()
+        migration.db_update(self.config, self.app_logger)
+        self.assertEqual(self.statuses()['2-b'][0], 'DONE')
+
+    def test_run_migration_timeout(self):
+        migration.db_init(self.migrations_dir, self.app_logger)
+        with open(os.path.join(self.migrations_dir, '1-a', 'migrate.sh'), 'w') as f:
+            f.write('#!/bin/sh\nsleep 30\n')
+        os.chmod(os.path.join(self.migrations_dir, '1-a', 'migrate.sh'), 0o775)
+        with open(os.path.join(self.migrations_dir, '1-a', migration.TIMEOUT_FILE), 'w') as f:
+            f.write('0.3\n')
+        config = dict(self.config, ENVIRONMENT='test', JOBS='2', KILL_GRACE_PERIOD='0.2')
+        self.assertFalse(migration.run_migration('1-a', config, self.app_logger))
+        self.assertEqual(self.statuses()['1-a'][0], 'FAILED')
+        run = list(store.open_store(self.migrations_dir, self.app_logger).iterate_runs('1-a'))[0]
+        self.assertEqual(run.exit_code, executor.TIMEOUT_EXIT_CODE)
+        self.assertEqual((run.pid, run.host), (os.getpid(), migration.HOST))
+
+    def test_run_migration_retries(self):
+        migration.db_init(self.migrations_dir, self.app_logger)
+        migration_dir = os.path.join(self.migrations_dir, '1-a')
+        # fails with EX_TEMPFAIL on the first attempt only
+        with open(os.path.join(migration_dir, 'migrate.sh'), 'w') as f:
+            f.write('#!/bin/sh\nif [ ! -f "$0.tried" ]; then touch "$0.tried"; echo locked; exit 75; fi\necho ok\n')
+        os.chmod(os.path.join(migration_dir, 'migrate.sh'), 0o775)
+        with open(os.path.join(migration_dir, retry.RETRY_FILE), 'w') as f:
+            f.write('max_attempts=3\nbackoff=0.01\nretry_on=75\n')
+        config = dict(self.config, ENVIRONMENT='test', JOBS='2')
+        with contextlib.redirect_stdout(io.TextIOWrapper(io.BytesIO())):
+            self.assertTrue(migration.run_migration('1-a', config, self.app_logger))
+        runs = list(store.open_store(self.migrations_dir, self.app_logger).iterate_runs('1-a'))
+        self.assertEqual([(run.attempt, run.exit_code) for run in runs], [(1, 75), (2, 0)])
+        # output of every attempt is kept in its own log
+        for run, output in zip(runs, (b'locked\n', b'ok\n')):
+            with gzip.open(runlog.log_path(self.migrations_dir, '1-a', run.run_id), 'rb') as f:
+                self.assertEqual(f.read(), output)
+        self.assertEqual(self.statuses()['1-a'][0], 'DONE')
+
+    def test_run_migration_is_released_on_error(self):
+        class BrokenPipe(io.RawIOBase):
+            def writable(self):
+                return True
+
+            def write(self, data):
+                raise BrokenPipeError()
+
+        migration.db_init(self.migrations_dir, self.app_logger)
+        with open(os.path.join(self.migrations_dir, '1-a', 'migrate.sh'), 'w') as f:
+            f.write('#!/bin/sh\necho started\nsleep 30\n')
+        os.chmod(os.path.join(self.migrations_dir, '1-a', 'migrate.sh'), 0o775)
+        config = dict(self.config, ENVIRONMENT='test', JOBS='2', KILL_GRACE_PERIOD='0.2')
+        started = time.monotonic()
+        with contextlib.redirect_stdout(io.TextIOWrapper(io.BufferedWriter(BrokenPipe()))):
+            self.assertRaises(BrokenPipeError, migration.run_migration, '1-a', config, self.app_logger)
+        self.assertLess(time.monotonic() - started, 10)
+        self.assertEqual(self.statuses()['1-a'][0], 'FAILED')
+        migration_store = store.open_store(self.migrations_dir, self.app_logger)
+        self.assertIsNone(migration_store.get_lease('1-a'))
+        run = list(migration_store.iterate_runs('1-a'))[0]
+        self.assertEqual(run.exit_code, executor.INTERRUPTED_EXIT_CODE)
+        self.assertIsNotNone(run.finished_at)
+
+    def test_reclaim_stale_runs(self):
+        migration.db_init(self.migrations_dir, self.app_logger)
+        migration_store = store.open_store(self.migrations_dir, self.app_logger)
+        now = time.time()
+        dead = subprocess.Popen(['true'])
+        dead.wait()
+        stale = migration_store.start_run('1-a', now - 100, 'test', host='elsewhere')
+        orphaned = migration_store.start_run('2-b', now, 'test', pid=dead.pid, host=migration.HOST)
+        alive = migration_store.start_run('2-b', now, 'test', pid=os.getpid(), host=migration.HOST)
+        migration_store.set_statuses(['1-a', '2-b'], store.Status.RUNNING)
+
+        reclaimed = migration.reclaim_stale_runs(self.migrations_dir, self.config, self.app_logger)
+        self.assertEqual([run.run_id for run in reclaimed], [stale, orphaned])
+        self.assertEqual([run.run_id for run in migration_store.iterate_unfinished_runs()], [alive])
+        self.assertEqual(self.statuses()['1-a'][0], 'FAILED')
+
+        # migration left RUNNING between attempts by a process which died
+        migration_store.finish_run(alive, now, 0, 75, 0)
+        migration_store.heartbeat(alive, now - 100)
+        migration_store.set_status('2-b', store.Status.RUNNING)
+        reclaimed = migration.reclaim_stale_runs(self.migrations_dir, self.config, self.app_logger)
+        self.assertEqual([run.run_id for run in reclaimed], [alive])
+        self.assertEqual(self.statuses()['2-b'][0], 'FAILED')
+
+    def test_interrupted_runner_exits_non_zero(self):
+        started = os.path.join(self.project_dir, 'started')
+        path = os.path.join(self.migrations_dir, '1-a', 'migrate.sh')
+        with open(path, 'w') as f:
+            f.write('#!/bin/sh\ntouch {0}\nsleep 30\n'.format(started))
+        os.chmod(path, 0o775)
+        with open(os.path.join(self.project_dir, 'pymigrate.conf'), 'w') as f:
+            f.write('MIGRATIONS_DIR=migrations\nKILL_GRACE_PERIOD=1\n')
+        runner = os.path.join(os.path.dirname(os.path.abspath(migration.__file__)), 'runner.py')
+        child = subprocess.Popen([sys.executable, runner, '--log-level', 'ERROR', '--do', 'migrate', '--no-daemon',
+                                  '-m', '1-a', '-d', self.project_dir + '/'], cwd=self.project_dir,
+                                 stdout=subprocess.DEVNULL)
+        deadline = time.monotonic() + 10
+        while not os.path.exists(started) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        child.terminate()
+        self.assertEqual(child.wait(10), 143)
+        self.assertEqual(self.statuses()['1-a'][0], 'FAILED')
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
@@ -0,0 +1,44 @@
+import unittest
+
+import io
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import json
+import output
+import sys
+
+
+class TestOutputModule(unittest.TestCase):
+    columns = ('migration_id', 'status')
+    rows = [('1-a', 'DONE'), ('2-bbbbbbbb', 'PENDING')]
+
+    def write(self, fmt: str) -> str:
+        stream = io.StringIO()
+        self.assertEqual(output.write_rows(self.columns, iter(self.rows), fmt, stream), len(self.rows))
+        return stream.getvalue()
+
+    def test_text(self):
+        self.assertEqual(self.write('text').splitlines(), ['MIGRATION_ID | STATUS ',
+                                                           '1-a          | DONE   ',
+                                                           '2-bbbbbbbb   | PENDING'])
+
+    def test_json_and_ndjson(self):
+        expected = [{'migration_id': '1-a', 'status': 'DONE'}, {'migration_id': '2-bbbbbbbb', 'status': 'PENDING'}]
+        self.assertEqual(json.loads(self.write('json')), expected)
+        self.assertEqual([json.loads(line) for line in self.write('ndjson').splitlines()], expected)
+
+    def test_csv(self):
+        self.assertEqual(self.write('csv').splitlines(), ['migration_id,status', '1-a,DONE', '2-bbbbbbbb,PENDING'])
+
+    def test_empty_json(self):
+        stream = io.StringIO()
+        output.write_rows(self.columns, [], 'json', stream)
+        self.assertEqual(json.loads(stream.getvalue()), [])
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
@@ -0,0 +1,74 @@
+import unittest
+
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import os
+import shutil
+import tempfile
+import planner
+import store
+import sys
+
+
+def run(migration_id: str, duration: float, exit_code: int = 0) -> store.RunRecord:
+    return store.RunRecord(0, migration_id, 0.0, duration, duration, exit_code, 'dev', 'master', 'sha', 0)
+
+
+class TestPlannerModule(unittest.TestCase):
+    def setUp(self):
+        self.migrations_dir = tempfile.mkdtemp()
+        for migration_id in ('1-a', '2-b', '3-c', '4-d'):
+            os.mkdir(os.path.join(self.migrations_dir, migration_id))
+
+    def tearDown(self):
+        shutil.rmtree(self.migrations_dir)
+
+    def test_estimate_durations_uses_latest_successful_runs(self):
+        runs = [run('1-a', 100.0), run('1-a', 1.0), run('1-a', 3.0), run('1-a', 50.0, 1), run('2-b', 7.0, 1)]
+        self.assertEqual(planner.estimate_durations(runs, history=2), {'1-a': 1.0})
+
+    def test_build_orders_steps_and_stops_before_manual(self):
+        statuses = {'1-a': ('DONE', 'PRESENT'), '2-b': ('FAILED', 'PRESENT'), '3-c': ('MANUAL', 'PRESENT'),
+                    '4-d': ('PENDING', 'PRESENT'), '0-gone': ('PENDING', 'ABSENT')}
+        plan = planner.build(statuses, self.migrations_dir, {'2-b': 2.0})
+        self.assertEqual([tuple(step)[:4] for step in plan.steps],
+                         [('2-b', planner.RUN, 'FAILED', 2.0),
+                          ('3-c', planner.STOP, 'MANUAL', None),
+                          ('4-d', planner.BLOCKED, 'after 3-c', None),
+                          ('0-gone', planner.SKIP, 'ABSENT', None),
+                          ('1-a', planner.SKIP, 'DONE', None)])
+        self.assertEqual(plan.graph, {'2-b': set()})
+        self.assertEqual(plan.stop.migration_id, '3-c')
+
+    def test_build_treats_abandoned_running_migration_as_failed(self):
+        statuses = {'1-a': ('RUNNING', 'PRESENT'), '2-b': ('PENDING', 'PRESENT')}
+        self.assertEqual(planner.build(statuses, self.migrations_dir).stop.reason, 'RUNNING in another process')
+        plan = planner.build(statuses, self.migrations_dir, stale={'1-a'})
+        self.assertIsNone(plan.stop)
+        self.assertEqual(plan.graph, {'1-a': set(), '2-b': {'1-a'}})
+        self.assertEqual(planner.build(statuses, self.migrations_dir, migration_id='1-a').stop.action, planner.STOP)
+        self.assertEqual(planner.build(statuses, self.migrations_dir, stale={'1-a'}, migration_id='1-a').graph,
+                         {'1-a': set()})
+
+    def test_build_rejects_unknown_dependencies(self):
+        with open(os.path.join(self.migrations_dir, '2-b', 'depends_on'), 'w') as f:
+            f.write('0-missing\n')
+        statuses = {'1-a': ('PENDING', 'PRESENT'), '2-b': ('PENDING', 'PRESENT')}
+        self.assertRaises(planner.PlanError, planner.build, statuses, self.migrations_dir)
+
+    def test_estimate_total_simulates_jobs(self):
+        for migration_id in ('2-b', '3-c'):
+            with open(os.path.join(self.migrations_dir, migration_id, 'depends_on'), 'w') as f:
+                f.write('1-a\n')
+        statuses = {migration_id: ('PENDING', 'PRESENT') for migration_id in ('1-a', '2-b', '3-c')}
+        plan = planner.build(statuses, self.migrations_dir, {'1-a': 1.0, '2-b': 2.0, '3-c': 4.0})
+        self.assertEqual(planner.estimate_total(plan), 7.0)
+        self.assertEqual(planner.estimate_total(plan, 2), 5.0)
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
@@ -0,0 +1,61 @@
+import unittest
+
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import io
+import os
+import json
+import pstats
+import shutil
+import tempfile
+import profiling
+import sys
+
+
+class TestProfilingModule(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        profiling.disable()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_phase_without_profiler(self):
+        with profiling.phase('noop'):
+            pass
+        profiling.record_migration('1-a', 1.0, 0)
+        self.assertIsNone(profiling.disable())
+
+    def test_phases_and_migrations(self):
+        profiling.enable()
+        for _ in range(2):
+            with profiling.phase('scan'):
+                pass
+        profiling.record_migration('1-a', 1.5, 0)
+        profiler = profiling.disable()
+        self.assertEqual(profiler.phases['scan'][0], 2)
+        self.assertEqual(profiler.migrations, [('1-a', 1.5, 0)])
+
+        stream = io.StringIO()
+        profiler.report(stream)
+        self.assertIn('scan', stream.getvalue())
+        self.assertIn('1-a', stream.getvalue())
+
+    def test_dump(self):
+        profiling.enable(capture=True)
+        with profiling.phase('scan'):
+            sorted(range(1000))
+        profiler = profiling.disable()
+        prefix = os.path.join(self.tmp_dir, 'profile')
+        self.assertEqual(profiler.dump(prefix), [prefix + '.json', prefix + '.pstats'])
+        with open(prefix + '.json') as f:
+            self.assertEqual(json.load(f)['phases'][0]['phase'], 'scan')
+        self.assertTrue(pstats.Stats(prefix + '.pstats').total_calls > 0)
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
@@ -0,0 +1,57 @@
+import unittest
+
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import os
+import shutil
+import tempfile
+import executor
+import retry
+import sys
+
+
+class TestRetryModule(unittest.TestCase):
+    def setUp(self):
+        self.migration_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.migration_dir)
+
+    def test_default_policy_makes_single_attempt(self):
+        policy = retry.load(self.migration_dir, {})
+        self.assertEqual(policy, retry.RetryPolicy())
+        self.assertFalse(policy.should_retry(1, 1))
+
+    def test_retry_file_overrides_config(self):
+        with open(os.path.join(self.migration_dir, retry.RETRY_FILE), 'w') as f:
+            f.write('# lock timeouts only\nretry_on = 75, 124\nmax_attempts=5\n')
+        policy = retry.load(self.migration_dir, {'RETRY_MAX_ATTEMPTS': '2', 'RETRY_BACKOFF': '3'})
+        self.assertEqual(policy, retry.RetryPolicy(max_attempts=5, backoff=3.0, retry_on=frozenset((75, 124))))
+        self.assertTrue(policy.should_retry(4, 75))
+        self.assertFalse(policy.should_retry(5, 75))
+        self.assertFalse(policy.should_retry(1, 1))
+        self.assertFalse(policy.should_retry(1, 0))
+
+    def test_interrupted_migration_is_not_retried(self):
+        policy = retry.RetryPolicy(max_attempts=3)
+        self.assertTrue(policy.should_retry(1, 1))
+        self.assertFalse(policy.should_retry(1, executor.INTERRUPTED_EXIT_CODE))
+
+    def test_invalid_settings(self):
+        self.assertRaises(ValueError, retry.parse, {'attempts': '3'})
+        self.assertRaises(ValueError, retry.parse, {'max_attempts': '0'})
+        self.assertRaises(ValueError, retry.parse, {'jitter': '1.5'})
+        self.assertRaises(ValueError, retry.parse, {'retry_on': 'lock'})
+
+    def test_delay(self):
+        policy = retry.RetryPolicy(backoff=1, max_backoff=5, jitter=0.5)
+        self.assertEqual([policy.delay(attempt, lambda: 0) for attempt in range(1, 5)], [1, 2, 4, 5])
+        self.assertEqual(policy.delay(2, lambda: 1), 1)
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
@@ -0,0 +1,132 @@
+import unittest
+
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import io
+import os
+import shutil
+import tempfile
+import contextlib
+import lease
+import migration
+import rollback
+import store
+import workers
+import logger
+import sys
+
+
+class TestRollbackModule(unittest.TestCase):
+    def setUp(self):
+        self.project_dir = tempfile.mkdtemp()
+        self.migrations_dir = os.path.join(self.project_dir, 'migrations')
+        for migration_id in ('1-a', '2-b', '3-c', '4-d'):
+            os.makedirs(os.path.join(self.migrations_dir, migration_id))
+        self.config = {'PROJECT_DIR': self.project_dir, 'MIGRATIONS_DIR': 'migrations', 'ENVIRONMENT': 'test'}
+        self.app_logger = logger.Logger(level=logger.Levels.ERROR)
+        migration.db_init(self.migrations_dir, self.app_logger)
+
+    def tearDown(self):
+        store.close_all()
+        shutil.rmtree(self.project_dir)
+
+    def add_script(self, migration_id: str, body: str):
+        path = os.path.join(self.migrations_dir, migration_id, 'rollback.sh')
+        with open(path, 'w') as f:
+            f.write('#!/bin/sh\n' + body + '\n')
+        os.chmod(path, 0o775)
+
+    def statuses(self) -> dict:
+        return migration.get_statuses(os.path.join(self.migrations_dir, store.DB_FILE), self.app_logger)
+
+    def test_select_ranges_in_reverse_order(self):
+        statuses = {'1-a': ('DONE', 'PRESENT'), '2-b': ('DONE', 'PRESENT'), '3-c': ('PENDING', 'PRESENT'),
+                    '4-d': ('DONE', 'PRESENT')}
+        self.add_script('4-d', 'true')
+
+        def ids(steps):
+            return [step.migration_id for step in steps]
+
+        self.assertEqual(ids(rollback.select(statuses, self.migrations_dir, last=2)), ['4-d', '2-b'])
+        self.assertEqual(ids(rollback.select(statuses, self.migrations_dir, to='1-a')), ['4-d', '2-b'])
+        self.assertEqual(ids(rollback.select(statuses, self.migrations_dir, migration_id='3-c')), ['3-c'])
+        steps = rollback.select(statuses, self.migrations_dir, last=10)
+        self.assertEqual([row[3] for row in rollback.describe(steps)],
+                         [rollback.ROLLBACK, rollback.STOP, rollback.BLOCKED])
+        self.assertRaises(ValueError, rollback.select, statuses, self.migrations_dir)
+        self.assertRaises(ValueError, rollback.select, statuses, self.migrations_dir, to='0-missing')
+
+    def test_run_stops_at_migration_without_script(self):
+        for migration_id in ('1-a', '2-b', '3-c'):
+            migration.set_status_done(migration_id, self.app_logger, self.migrations_dir)
+        self.add_script('3-c', 'echo "$1" > "$(dirname "$0")/undone"')
+        steps = rollback.select(self.statuses(), self.migrations_dir, last=3)
+        with contextlib.redirect_stdout(io.TextIOWrapper(io.BytesIO())):
+            self.assertFalse(rollback.run(steps, self.config, self.app_logger))
+        with open(os.path.join(self.migrations_dir, '3-c', 'undone')) as f:
+            self.assertEqual(f.read(), 'test\n')
+        self.assertEqual([self.statuses()[migration_id][0] for migration_id in ('1-a', '2-b', '3-c')],
+                         ['DONE', 'DONE', 'PENDING'])
+
+    def test_failed_rollback_marks_migration_failed(self):
+        for migration_id in ('1-a', '2-b'):
+            migration.set_status_done(migration_id, self.app_logger, self.migrations_dir)
+            self.add_script(migration_id, 'exit 3')
+        steps = rollback.select(self.statuses(), self.migrations_dir, to='1-a')
+        with contextlib.redirect_stdout(io.TextIOWrapper(io.BytesIO())):
+            self.assertFalse(rollback.run(steps, self.config, self.app_logger))
+        self.assertEqual([self.statuses()[migration_id][0] for migration_id in ('1-a', '2-b')], ['DONE', 'FAILED'])
+
+    def test_rollback_is_recorded_as_run(self):
+        migration.set_status_done('1-a', self.app_logger, self.migrations_dir)
+        self.add_script('1-a', 'echo undone')
+        steps = rollback.select(self.statuses(), self.migrations_dir, migration_id='1-a')
+        with contextlib.redirect_stdout(io.TextIOWrapper(io.BytesIO())):
+            self.assertTrue(rollback.run(steps, self.config, self.app_logger))
+        self.assertEqual(self.statuses()['1-a'][0], 'PENDING')
+        migration_store = store.open_store(self.migrations_dir, self.app_logger)
+        self.assertIsNone(migration_store.get_lease('1-a'))
+        runs = list(migration_store.iterate_runs('1-a'))
+        self.assertEqual([(run.action, run.exit_code, run.environment) for run in runs],
+                         [(store.RUN_ROLLBACK, 0, 'test')])
+        self.assertEqual(list(migration_store.iterate_runs('1-a', action=store.RUN_MIGRATE)), [])
+
+    def test_rollback_skips_migration_running_elsewhere(self):
+        migration.set_status_done('1-a', self.app_logger, self.migrations_dir)
+        self.add_script('1-a', 'echo undone > "$(dirname "$0")/undone"')
+        steps = rollback.select(self.statuses(), self.migrations_dir, migration_id='1-a')
+        # another process claims the migration meanwhile
+        migration_store = store.open_store(self.migrations_dir, self.app_logger)
+        claim, _ = lease.claim(migration_store, '1-a', store.Status.DONE, lease.owner('elsewhere', 1), 60)
+        self.assertEqual(claim, lease.Claim.CLAIMED)
+        with contextlib.redirect_stdout(io.TextIOWrapper(io.BytesIO())):
+            self.assertFalse(rollback.run(steps, self.config, self.app_logger))
+        self.assertFalse(os.path.exists(os.path.join(self.migrations_dir, '1-a', 'undone')))
+        self.assertEqual(self.statuses()['1-a'][0], 'RUNNING')
+
+    def test_python_unit_is_rolled_back_by_worker(self):
+        migration.set_status_done('1-a', self.app_logger, self.migrations_dir)
+        with open(os.path.join(self.migrations_dir, '1-a', workers.ROLLBACK_UNIT_FILE), 'w') as f:
+            f.write('import os\n\n\ndef rollback(env, context):\n    print("undone", env, os.getpid())\n')
+        steps = rollback.select(self.statuses(), self.migrations_dir, migration_id='1-a')
+        self.assertEqual(os.path.basename(steps[0].script), workers.ROLLBACK_UNIT_FILE)
+        out = io.TextIOWrapper(io.BytesIO())
+        try:
+            with contextlib.redirect_stdout(out):
+                self.assertTrue(rollback.run(steps, self.config, self.app_logger))
+        finally:
+            workers.shutdown()
+        out.flush()
+        undone = [line.split() for line in out.buffer.getvalue().decode().splitlines() if line.startswith('undone')]
+        self.assertEqual(len(undone), 1)
+        self.assertEqual(undone[0][1], 'test')
+        self.assertNotEqual(int(undone[0][2]), os.getpid())
+        self.assertEqual(self.statuses()['1-a'][0], 'PENDING')
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
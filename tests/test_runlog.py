@@ -0,0 +1,65 @@
+import unittest
+
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import os
+import gzip
+import time
+import shutil
+import tempfile
+import runlog
+import sys
+
+
+class TestRunlogModule(unittest.TestCase):
+    def setUp(self):
+        self.migrations_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.migrations_dir)
+
+    def test_output_is_compressed_and_tail_is_bounded(self):
+        path = runlog.log_path(self.migrations_dir, '1-first', 42)
+        self.assertTrue(path.endswith(os.path.join(runlog.LOG_DIR, '1-first', '00000042.log.gz')))
+        lines = [('line {0}\n'.format(i)).encode() for i in range(runlog.BUFFER_SIZE // 4)]
+        run_log = runlog.RunLog(path, 3)
+        for line in lines:
+            run_log.write(line)
+        run_log.write(b'x' * (runlog.TAIL_LINE_BYTES * 2) + b'\n')
+        run_log.close()
+        with gzip.open(path, 'rb') as f:
+            self.assertEqual(f.read(), b''.join(lines) + b'x' * (runlog.TAIL_LINE_BYTES * 2) + b'\n')
+        self.assertEqual(len(run_log.tail), 3)
+        self.assertEqual(run_log.tail[-1], b'x' * runlog.TAIL_LINE_BYTES + b'...\n')
+
+    def test_tail_only_without_path(self):
+        run_log = runlog.RunLog(None, 2)
+        seen = []
+        sink = runlog.tee(run_log.write, seen.append)
+        for line in (b'a\n', b'b\n', b'c\n'):
+            sink(line)
+        run_log.close()
+        self.assertEqual(list(run_log.tail), [b'b\n', b'c\n'])
+        self.assertEqual(seen, [b'a\n', b'b\n', b'c\n'])
+        self.assertFalse(os.path.exists(os.path.join(self.migrations_dir, runlog.LOG_DIR)))
+
+    def test_prune_keeps_latest_and_recent_logs(self):
+        for run_id in (9, 10, 11, 12):
+            runlog.RunLog(runlog.log_path(self.migrations_dir, '1-first', run_id)).close()
+        log_dir = os.path.dirname(runlog.log_path(self.migrations_dir, '1-first', 1))
+        old = time.time() - 3 * 86400
+        os.utime(os.path.join(log_dir, '00000011.log.gz'), (old, old))
+
+        removed = runlog.prune(log_dir, 3, 2)
+        self.assertEqual(sorted(os.path.basename(path) for path in removed),
+                         ['00000009.log.gz', '00000011.log.gz'])
+        self.assertEqual(sorted(os.listdir(log_dir)), ['00000010.log.gz', '00000012.log.gz'])
+        self.assertEqual(runlog.prune(os.path.join(self.migrations_dir, 'missing')), [])
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
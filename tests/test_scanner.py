@@ -0,0 +1,81 @@
+import unittest
+
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import os
+import shutil
+import tempfile
+import scanner
+import store
+import logger
+import sys
+
+# mtime far enough in the past to be trusted by scan cache
+OLD = 1500000000
+
+
+class TestScannerModule(unittest.TestCase):
+    def setUp(self):
+        self.migrations_dir = tempfile.mkdtemp()
+        for migration_id in ('1-a', '2-b'):
+            os.makedirs(os.path.join(self.migrations_dir, migration_id))
+            self.touch(migration_id, 'migrate.sh')
+        os.makedirs(os.path.join(self.migrations_dir, '.hidden'))
+        self.migration_store = store.open_store(self.migrations_dir, logger.Logger(level=logger.Levels.ERROR))
+        self.examined = []
+        self.examine = scanner.examine
+
+        def examine(migration_dir):
+            self.examined.append(os.path.basename(migration_dir))
+            return self.examine(migration_dir)
+
+        scanner.examine = examine
+
+    def tearDown(self):
+        scanner.examine = self.examine
+        store.close_all()
+        shutil.rmtree(self.migrations_dir)
+
+    def touch(self, migration_id: str, name: str, mtime: int = OLD):
+        open(os.path.join(self.migrations_dir, migration_id, name), 'w').close()
+        os.utime(os.path.join(self.migrations_dir, migration_id), (mtime, mtime))
+
+    def test_examine(self):
+        os.makedirs(os.path.join(self.migrations_dir, '1-a', 'docs'))
+        self.touch('1-a', 'docs/ReadMe.txt')
+        self.touch('1-a', 'rollback.sh')
+        self.assertEqual(self.examine(os.path.join(self.migrations_dir, '1-a')),
+                         ('docs/ReadMe.txt', 'migrate.sh', 'rollback.sh', 1))
+
+    def test_unchanged_directories_are_not_examined(self):
+        scans = scanner.scan(self.migrations_dir, self.migration_store)
+        self.assertEqual(sorted(scans), ['1-a', '2-b'])
+        self.assertEqual(sorted(self.examined), ['1-a', '2-b'])
+
+        self.examined.clear()
+        self.touch('2-b', 'README.md', OLD + 1)
+        scans = scanner.scan(self.migrations_dir, self.migration_store)
+        self.assertEqual(self.examined, ['2-b'])
+        self.assertEqual(scans['2-b'].readme, 'README.md')
+        self.assertEqual(scans['1-a'].migrate, 'migrate.sh')
+
+    def test_removed_and_racy_directories(self):
+        scanner.scan(self.migrations_dir, self.migration_store)
+        shutil.rmtree(os.path.join(self.migrations_dir, '1-a'))
+        os.makedirs(os.path.join(self.migrations_dir, '3-c'))
+        self.examined.clear()
+        scanner.scan(self.migrations_dir, self.migration_store)
+        self.assertEqual(sorted(self.migration_store.get_scans()), ['2-b', '3-c'])
+
+        # 3-c was modified just now, so another change could have the same mtime
+        self.examined.clear()
+        scanner.scan(self.migrations_dir, self.migration_store)
+        self.assertEqual(self.examined, ['3-c'])
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
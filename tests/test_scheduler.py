@@ -0,0 +1,90 @@
+import unittest
+
+import os
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import shutil
+import tempfile
+import threading
+import scheduler
+import logger
+import sys
+
+
+class TestSchedulerModule(unittest.TestCase):
+    def setUp(self):
+        self.migrations_dir = tempfile.mkdtemp()
+        for migration_id in ('1-a', '2-b', '3-c'):
+            os.mkdir(os.path.join(self.migrations_dir, migration_id))
+        self.app_logger = logger.Logger(level=logger.Levels.ERROR)
+
+    def tearDown(self):
+        shutil.rmtree(self.migrations_dir)
+
+    def test_build_graph_defaults_to_previous_migration(self):
+        graph = scheduler.build_graph(['3-c', '1-a', '2-b'], self.migrations_dir)
+        self.assertEqual(graph, {'1-a': set(), '2-b': {'1-a'}, '3-c': {'2-b'}})
+
+    def test_build_graph_reads_depends_on(self):
+        with open(os.path.join(self.migrations_dir, '3-c', scheduler.DEPENDS_ON_FILE), 'w') as f:
+            f.write('# comment\n1-a\n')
+        with open(os.path.join(self.migrations_dir, '2-b', scheduler.DEPENDS_ON_FILE), 'w'):
+            pass
+        graph = scheduler.build_graph(['1-a', '2-b', '3-c'], self.migrations_dir)
+        self.assertEqual(graph, {'1-a': set(), '2-b': set(), '3-c': {'1-a'}})
+
+    def test_execute_respects_dependencies(self):
+        order = []
+        lock = threading.Lock()
+
+        def run_one(migration_id):
+            with lock:
+                order.append(migration_id)
+            return True
+
+        graph = {'1-a': set(), '2-b': {'1-a'}, '3-c': {'1-a'}, '4-d': {'2-b', '3-c'}}
+        self.assertTrue(scheduler.execute(graph, 4, run_one, lambda m: False, self.app_logger))
+        self.assertEqual(order[0], '1-a')
+        self.assertEqual(order[-1], '4-d')
+
+    def test_execute_stops_dispatch_after_failure(self):
+        ran = []
+        graph = {'1-a': set(), '2-b': {'1-a'}, '3-c': {'2-b'}}
+        self.assertFalse(scheduler.execute(graph, 1, lambda m: ran.append(m) or m != '2-b', lambda m: False,
+                                           self.app_logger))
+        self.assertEqual(ran, ['1-a', '2-b'])
+
+    def test_execute_stops_before_manual(self):
+        ran = []
+        graph = {'1-a': set(), '2-b': set()}
+        self.assertFalse(scheduler.execute(graph, 1, lambda m: ran.append(m) or True, lambda m: m == '2-b',
+                                           self.app_logger))
+        self.assertEqual(ran, ['1-a'])
+
+    def test_execute_dispatches_deferred_migration_again(self):
+        ran = []
+        busy = {'1-a': 2}
+
+        def run_one(migration_id):
+            ran.append(migration_id)
+            if busy.get(migration_id):
+                busy[migration_id] -= 1
+                return None
+            return True
+
+        graph = {'1-a': set(), '2-b': set(), '3-c': {'1-a'}}
+        self.assertTrue(scheduler.execute(graph, 1, run_one, lambda m: False, self.app_logger, retry_interval=0.01))
+        self.assertEqual(ran, ['1-a', '2-b', '1-a', '1-a', '3-c'])
+
+    def test_execute_detects_cycles(self):
+        graph = {'1-a': {'2-b'}, '2-b': {'1-a'}}
+        self.assertRaises(scheduler.CycleError, scheduler.execute, graph, 2, lambda m: True, lambda m: False,
+                          self.app_logger)
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
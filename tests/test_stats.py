@@ -0,0 +1,37 @@
+import unittest
+
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import stats
+import store
+import sys
+
+
+def run(migration_id: str, duration: float, exit_code: int = 0) -> store.RunRecord:
+    return store.RunRecord(0, migration_id, 0.0, duration, duration, exit_code, 'dev', 'master', 'unknown', 0)
+
+
+class TestStatsModule(unittest.TestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(stats.percentile(values, 50), 50)
+        self.assertEqual(stats.percentile(values, 95), 95)
+        self.assertEqual(stats.percentile([7], 95), 7)
+
+    def test_is_regression(self):
+        self.assertTrue(stats.is_regression([1.0, 1.1, 0.9, 2.5]))
+        self.assertFalse(stats.is_regression([1.0, 1.1, 0.9, 1.5]))
+        self.assertFalse(stats.is_regression([1.0, 5.0]))
+
+    def test_summarize(self):
+        runs = [run('1-a', 1.0), run('1-a', 3.0), run('1-a', 0.0, 1), run('2-b', 0.0, 2)]
+        self.assertEqual(list(stats.summarize(runs)), [('1-a', 3, 1, 1.0, 3.0, 3.0, 3.0, 'no'),
+                                                       ('2-b', 1, 1, None, None, None, None, 'no')])
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
@@ -0,0 +1,75 @@
+import unittest
+
+import os
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import shutil
+import sqlite3
+import tempfile
+import store
+import logger
+import sys
+
+
+class TestStoreModule(unittest.TestCase):
+    def setUp(self):
+        self.migrations_dir = tempfile.mkdtemp()
+        self.app_logger = logger.Logger(level=logger.Levels.ERROR)
+        self.store = store.open_store(self.migrations_dir, self.app_logger)
+
+    def tearDown(self):
+        store.close_all()
+        shutil.rmtree(self.migrations_dir)
+
+    def test_open_store_reuses_connection(self):
+        self.assertIs(store.open_store(self.migrations_dir + '/', self.app_logger), self.store)
+
+    def test_add_keeps_existing_rows(self):
+        self.store.add([store.MigrationRecord('1-a', 'PENDING', 'PRESENT', 'master')])
+        self.store.set_status('1-a', store.Status.DONE)
+        self.store.add([store.MigrationRecord('1-a', 'PENDING', 'PRESENT', 'master'),
+                        store.MigrationRecord('2-b', 'PENDING', 'PRESENT', 'master')])
+        self.assertEqual([record.status for record in self.store.iterate()], ['DONE', 'PENDING'])
+
+    def test_upsert_overwrites_rows(self):
+        self.store.add([store.MigrationRecord('1-a', 'PENDING', 'PRESENT', 'master')])
+        self.store.upsert([store.MigrationRecord('1-a', 'SKIP', 'ABSENT', 'dev')])
+        self.assertEqual(self.store.get('1-a'), store.MigrationRecord('1-a', 'SKIP', 'ABSENT', 'dev'))
+
+    def test_set_status_of_unknown_migration(self):
+        self.assertFalse(self.store.set_status("it's-missing", store.Status.DONE, 'master'))
+        self.assertIsNone(self.store.get("it's-missing"))
+
+    def test_iterate_filters_and_paginates(self):
+        self.store.add(store.MigrationRecord('{0}-m'.format(1500000000 + i), 'DONE' if i % 2 else 'PENDING',
+                                             'PRESENT', 'master') for i in range(10))
+        records = list(self.store.iterate(statuses=('DONE',), since='1500000004', limit=2, offset=1))
+        self.assertEqual([record.migration_id for record in records], ['1500000007-m', '1500000009-m'])
+
+    def test_legacy_database_is_upgraded(self):
+        legacy_dir = tempfile.mkdtemp()
+        try:
+            with sqlite3.connect(os.path.join(legacy_dir, store.DB_FILE)) as conn:
+                conn.execute('CREATE TABLE IF NOT EXISTS migrations (migration_id, status, presence, branch)')
+                conn.executemany('INSERT INTO migrations VALUES (?, ?, ?, ?)',
+                                 [('1-a', 'PENDING', 'PRESENT', 'master'),
+                                  ('1-a', 'DONE\n', 'PRESENT', 'master'),
+                                  ('2-b', 'SKIP', 'ABSENT', 'master')])
+            legacy_store = store.open_store(legacy_dir, self.app_logger)
+            self.assertEqual(list(legacy_store.iterate()),
+                             [store.MigrationRecord('1-a', 'DONE', 'PRESENT', 'master'),
+                              store.MigrationRecord('2-b', 'SKIP', 'ABSENT', 'master')])
+            version = legacy_store._conn.execute('PRAGMA user_version').fetchone()[0]
+            self.assertEqual(version, store.SCHEMA_VERSION)
+            self.assertRaises(sqlite3.IntegrityError, legacy_store._conn.execute,
+                              'INSERT INTO migrations (migration_id) VALUES (?)', ('2-b',))
+        finally:
+            shutil.rmtree(legacy_dir)
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)
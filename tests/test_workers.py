@@ -0,0 +1,109 @@
+import unittest
+
+__author__ = 'Maxim Styushin'
+__copyright__ = 'Copyright (c)2017, Maxim Styushin'
+__license__ = 'MIT'
+__email__ = 'makcimkos@gmail.com'
+
+import io
+import os
+import shutil
+import tempfile
+import contextlib
+import executor
+import migration
+import workers
+import store
+import logger
+import sys
+
+
+class TestWorkersModule(unittest.TestCase):
+    def setUp(self):
+        self.project_dir = tempfile.mkdtemp()
+        self.migrations_dir = os.path.join(self.project_dir, 'migrations')
+        for migration_id in ('1-a', '2-b', '3-c'):
+            os.makedirs(os.path.join(self.migrations_dir, migration_id))
+        self.config = {'PROJECT_DIR': self.project_dir, 'MIGRATIONS_DIR': 'migrations', 'ENVIRONMENT': 'test',
+                       'LOG_KEEP_RUNS': '0'}
+        self.app_logger = logger.Logger(level=logger.Levels.ERROR)
+        migration.db_init(self.migrations_dir, self.app_logger)
+
+    def tearDown(self):
+        workers.shutdown()
+        store.close_all()
+        shutil.rmtree(self.project_dir)
+
+    def add_unit(self, migration_id: str, body: str):
+        with open(os.path.join(self.migrations_dir, migration_id, workers.UNIT_FILE), 'w') as f:
+            f.write(body)
+
+    def run_migration(self, migration_id: str, **config) -> tuple:
+        out = io.TextIOWrapper(io.BytesIO())
+        with contextlib.redirect_stdout(out):
+            res = migration.run_migration(migration_id, dict(self.config, **config), self.app_logger)
+        out.flush()
+        run = list(store.open_store(self.migrations_dir, self.app_logger).iterate_runs(migration_id))[-1]
+        return res, run.exit_code, out.buffer.getvalue().decode()
+
+    def test_units_share_warm_worker(self):
+        self.add_unit('1-a', 'import os\n\n\ndef migrate(env, context):\n'
+                             '    context.cache["connection"] = (env, os.getpid())\n')
+        self.add_unit('2-b', 'import os\n\n\ndef migrate(env, context):\n'
+                             '    print(context.migration_id, os.environ["ENVIRONMENT"], os.getpid(),\n'
+                             '          context.cache["connection"])\n')
+        workers.get_pool(self.config).prewarm()
+        self.assertTrue(self.run_migration('1-a')[0])
+        res, exit_code, output = self.run_migration('2-b')
+        self.assertTrue(res)
+        migration_id, environment, pid, cached = output.split('\n', 2)[1].split(' ', 3)
+        self.assertEqual((migration_id, environment), ('2-b', 'test'))
+        self.assertEqual(cached, "('test', {0})".format(pid))
+        self.assertNotEqual(int(pid), os.getpid())
+        self.assertEqual(migration.get_statuses(os.path.join(self.migrations_dir, store.DB_FILE),
+                                                self.app_logger)['2-b'][0], 'DONE')
+
+    def test_helper_modules_of_units_are_not_shared(self):
+        for migration_id in ('1-a', '2-b'):
+            with open(os.path.join(self.migrations_dir, migration_id, 'helpers.py'), 'w') as f:
+                f.write('NAME = {0!r}\n'.format(migration_id))
+            self.add_unit(migration_id, 'import os\nimport helpers\n\n\ndef migrate(env, context):\n'
+                                        '    print(context.migration_id, helpers.NAME, os.getpid())\n')
+        workers.get_pool(dict(self.config, WORKERS='1')).prewarm()
+        first = self.run_migration('1-a')[2].split('\n')[1].split()
+        second = self.run_migration('2-b')[2].split('\n')[1].split()
+        self.assertEqual(first[:2], ['1-a', '1-a'])
+        self.assertEqual(second[:2], ['2-b', '2-b'])
+        self.assertEqual(first[2], second[2])
+
+    def test_exit_status_maps_to_status(self):
+        self.add_unit('1-a', 'def migrate(env, context):\n    return 3\n')
+        self.add_unit('2-b', 'def migrate(env, context):\n    raise ValueError("broken")\n')
+        self.add_unit('3-c', 'import sys\n\n\ndef migrate(env, context):\n    sys.exit(0)\n')
+        self.assertEqual(self.run_migration('1-a')[:2], (False, 3))
+        res, exit_code, output = self.run_migration('2-b')
+        self.assertEqual((res, exit_code), (False, 1))
+        self.assertIn('ValueError: broken', output)
+        self.assertEqual(self.run_migration('3-c')[:2], (True, 0))
+        self.assertEqual([workers.exit_code_of(value) for value in (None, True, False, 0, 5)], [0, 0, 1, 0, 5])
+
+    def test_cancelled_worker_is_replaced(self):
+        self.add_unit('1-a', 'import time\n\n\ndef migrate(env, context):\n    time.sleep(10)\n')
+        self.add_unit('2-b', 'def migrate(env, context):\n    pass\n')
+        workers.get_pool(self.config).prewarm()
+        self.assertEqual(self.run_migration('1-a', MIGRATION_TIMEOUT='0.5', KILL_GRACE_PERIOD='0.2')[:2],
+                         (False, executor.TIMEOUT_EXIT_CODE))
+        self.assertEqual(self.run_migration('2-b')[:2], (True, 0))
+
+    def test_scripts_are_not_units(self):
+        self.add_unit('1-a', '#!/usr/bin/env python3\nprint("script")\n')
+        os.chmod(os.path.join(self.migrations_dir, '1-a', workers.UNIT_FILE), 0o775)
+        self.assertIsNone(workers.find_unit(os.path.join(self.migrations_dir, '1-a')))
+        res, exit_code, output = self.run_migration('1-a')
+        self.assertTrue(res)
+        self.assertIn('script', output)
+
+
+if __name__ == '__main__':
+    print("This module is not callable")
+    sys.exit(0)